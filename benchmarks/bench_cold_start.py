@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# handler name -> (module, function, clients and resources it creates on its first invocation)
+HANDLERS = {
+    'data_ingestion': ('load.data_loader', 'data_ingestion_lambda_handler', ['s3', 'lambda'], ['dynamodb']),
+    'schedule': ('load.LoadEventSchedule', 'schedule_lambda_handler', ['lambda', 'events'], ['dynamodb']),
+    'live_ingestion': ('load.data_loader', 'live_ingestion_lambda_handler', ['s3'], []),
+    'fanout_coordinator': ('load.data_loader', 'fanout_coordinator_lambda_handler', ['sqs'], ['dynamodb']),
+    'session_worker': ('load.data_loader', 'session_worker_lambda_handler', ['s3', 'lambda'], ['dynamodb']),
+    # No Lambda handler of its own; its incremental load is what a scheduled job would run
+    'stage_and_load': ('load.stage_and_load', 'incremental_load', ['s3'], []),
+}
+
+# Runs in a fresh interpreter, like a Lambda init: imports the handler, then creates its clients
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+module = __import__({module!r}, fromlist=[{function!r}])
+getattr(module, {function!r})
+imported = time.perf_counter()
+from load.aws_clients import get_client, get_resource
+for service in {clients!r}:
+    get_client(service)
+for service in {resources!r}:
+    get_resource(service)
+done = time.perf_counter()
+print(json.dumps({{'import_s': imported - start, 'clients_s': done - imported}}))
+"""
+
+
+def parse_importtime(stderr):
+    """(cumulative microseconds, module) for every top-level import in -X importtime output."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented below the module that triggered them
+        if not name[1:].startswith(' '):
+            imports.append((int(cumulative), name.strip()))
+    return imports
+
+
+def measure(handler):
+    module, function, clients, resources = HANDLERS[handler]
+    code = CHILD.format(module=module, function=function, clients=clients, resources=resources)
+    env = dict(os.environ, AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['imports'] = parse_importtime(result.stderr)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the init duration (imports and client setup) of each Lambda handler')
+    parser.add_argument('--handler', choices=sorted(HANDLERS), action='append',
+                        help='Handler to measure, may be repeated (default: all)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help='Number of slowest imports to list')
+    parser.add_argument('--budget-ms', type=float,
+                        help='Exit with an error if any handler takes longer than this to initialize')
+    args = parser.parse_args()
+
+    over_budget = []
+    for handler in args.handler or sorted(HANDLERS):
+        runs = [measure(handler) for _ in range(args.runs)]
+        import_ms = statistics.median(run['import_s'] for run in runs) * 1000
+        clients_ms = statistics.median(run['clients_s'] for run in runs) * 1000
+        print(f"{handler}: init {import_ms + clients_ms:.0f} ms "
+              f"(imports {import_ms:.0f} ms, clients {clients_ms:.0f} ms, median of {args.runs} runs)")
+        for cumulative, name in sorted(runs[-1]['imports'], reverse=True)[:args.top]:
+            print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+        if args.budget_ms is not None and import_ms + clients_ms > args.budget_ms:
+            over_budget.append(handler)
+
+    if over_budget:
+        sys.exit(f"Over the {args.budget_ms:.0f} ms init budget: {', '.join(over_budget)}")
+
+
+if __name__ == "__main__":
+    main()
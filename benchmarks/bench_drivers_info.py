@@ -0,0 +1,52 @@
+import argparse
+import os
+import sys
+import timeit
+
+import fastf1
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load.data_loader import extract_drivers_info
+
+
+def per_driver_loop(f1_session):
+    """The drivers info extraction data_loader used before the bulk results slice."""
+    dummy_df = []
+    for driver in f1_session.drivers:
+        df = pd.DataFrame(f1_session.get_driver(driver)).T
+        dummy_df.append(df)
+    return pd.concat(dummy_df, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare drivers info extraction on a recorded session')
+    parser.add_argument('--cache', required=True,
+                        help='fastf1 cache directory holding the recorded session')
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--event', default='Bahrain Grand Prix')
+    parser.add_argument('--session', default='R')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    fastf1.Cache.enable_cache(args.cache)
+    fastf1.Cache.offline_mode(True)
+    f1_session = fastf1.get_session(args.year, args.event, args.session)
+    f1_session.load(laps=False, telemetry=False, weather=False, messages=False)
+
+    old = per_driver_loop(f1_session)
+    new = extract_drivers_info(f1_session)
+    assert list(old.columns) == list(new.columns), 'column mismatch'
+    assert len(old) == len(new), 'row count mismatch'
+
+    old_time = min(timeit.repeat(lambda: per_driver_loop(f1_session), number=args.repeat, repeat=3)) / args.repeat
+    new_time = min(timeit.repeat(lambda: extract_drivers_info(f1_session), number=args.repeat, repeat=3)) / args.repeat
+    print(f"{len(new)} drivers")
+    print(f"per-driver loop : {old_time * 1000:.3f} ms")
+    print(f"bulk extraction : {new_time * 1000:.3f} ms")
+    print(f"speedup         : {old_time / new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
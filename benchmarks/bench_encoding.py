@@ -0,0 +1,65 @@
+import argparse
+import io
+import os
+import sys
+import time
+
+import fastf1
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from load.artifacts import load_flags, session_artifacts
+from load.data_loader import extract_drivers_info
+from load.normalize import normalize_frame, encode_options
+from load.s3_writer import encode_parquet
+
+
+def session_frames(f1_session, session_type):
+    frames = {'laps': f1_session.laps, 'weather': f1_session.weather_data}
+    if 'drivers_info' in session_artifacts(session_type):
+        frames['drivers_info'] = extract_drivers_info(f1_session)
+    return frames
+
+
+def old_encoding(df):
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getbuffer().nbytes
+
+
+def new_encoding(df, table):
+    buffer = io.BytesIO()
+    encode_parquet(normalize_frame(df, table), buffer, **encode_options(table))
+    return buffer.getbuffer().nbytes
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare parquet size and encode time before and after normalization')
+    parser.add_argument('--cache', required=True,
+                        help='fastf1 cache directory holding the recorded session')
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--event', default='Bahrain Grand Prix')
+    parser.add_argument('--session', default='R')
+    args = parser.parse_args()
+
+    fastf1.Cache.enable_cache(args.cache)
+    fastf1.Cache.offline_mode(True)
+    f1_session = fastf1.get_session(args.year, args.event, args.session)
+    f1_session.load(**load_flags(session_artifacts(args.session)))
+
+    print(f"{'table':<14}{'rows':>8}{'old bytes':>12}{'new bytes':>12}{'ratio':>8}{'old ms':>9}{'new ms':>9}")
+    for table, df in session_frames(f1_session, args.session).items():
+        old_size, old_time = timed(old_encoding, df)
+        new_size, new_time = timed(new_encoding, df, table)
+        print(f"{table:<14}{len(df):>8}{old_size:>12}{new_size:>12}{new_size / old_size:>8.2f}"
+              f"{old_time * 1000:>9.1f}{new_time * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
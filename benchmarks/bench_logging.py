@@ -0,0 +1,65 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ('sync', 'async')
+
+# Runs in a fresh interpreter, since logging is set up once per process. Console output goes to
+# /dev/null, the timings to the file given as argv[1].
+CHILD = """
+import json, sys, time
+from logger import Logger
+from logging_setup import LoggingSetup
+
+logger = Logger.get_logger('benchmark')
+latencies = []
+for i in range({calls}):
+    start = time.perf_counter_ns()
+    logger.info('Uploaded %s rows of %s to %s', i, 'laps', 's3://race-predictor-pro/f1_data')
+    latencies.append(time.perf_counter_ns() - start)
+start = time.perf_counter()
+LoggingSetup().stop()
+drain_s = time.perf_counter() - start
+with open(sys.argv[1], 'w') as file:
+    json.dump({{'latencies_ns': latencies, 'drain_s': drain_s}}, file)
+"""
+
+
+def measure(mode, calls):
+    """Per-call latencies (ns) of logger.info with the repo's config, and how long the writer took to drain."""
+    log_dir = tempfile.mkdtemp(prefix='bench_logging_')
+    output = os.path.join(log_dir, 'timings.json')
+    env = dict(os.environ, LOG_DIR=log_dir, LOG_ASYNC='1' if mode == 'async' else '0')
+    subprocess.run([sys.executable, '-c', CHILD.format(calls=calls), output], cwd=ROOT, env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+    with open(output) as file:
+        return json.load(file)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the latency of a logging call, synchronous vs queue-based')
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'p50 us':>9}{'p99 us':>9}{'max us':>10}{'drain ms':>10}")
+    for mode in MODES:
+        runs = [measure(mode, args.calls) for _ in range(args.runs)]
+        latencies = sorted(latency for run in runs for latency in run['latencies_ns'])
+        drain_ms = statistics.median(run['drain_s'] for run in runs) * 1000
+        print(f"{mode:<8}{percentile(latencies, 0.5) / 1000:>9.1f}{percentile(latencies, 0.99) / 1000:>9.1f}"
+              f"{latencies[-1] / 1000:>10.1f}{drain_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Recorded fastf1 cache (see --record); replayed offline so no scenario touches the live API
+DEFAULT_FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures', 'fastf1_cache')
+
+# One conventional and one sprint weekend
+FIXTURE_WEEKENDS = [
+    (2023, 'Bahrain Grand Prix'),
+    (2023, 'Azerbaijan Grand Prix'),
+]
+
+BUCKET = 'race-predictor-pro'
+PREFIX = 'f1_data'
+
+# Operations whose Body is counted as bytes written
+WRITE_OPERATIONS = ('s3.PutObject', 's3.UploadPart')
+
+
+class ApiCallCounter:
+    """
+    Counts every AWS API call made through clients of a boto3 session, and the bytes sent in
+    S3 writes. Hooks the session's event system, so it only sees clients created after install().
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.bytes_written = 0
+
+    def install(self, session):
+        session.events.register('before-parameter-build', self.on_call)
+
+    def on_call(self, params, event_name, **kwargs):
+        _, service, operation = event_name.split('.', 2)
+        name = f"{service}.{operation}"
+        self.calls[name] += 1
+        if name in WRITE_OPERATIONS:
+            self.bytes_written += body_size(params.get('Body', b''))
+
+    def reset(self):
+        self.calls.clear()
+        self.bytes_written = 0
+
+
+def body_size(body):
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    position = body.tell()
+    body.seek(0, os.SEEK_END)
+    size = body.tell() - position
+    body.seek(position)
+    return size
+
+
+def fixture_events():
+    """(year, race_name, session_types) of the recorded weekends, from the recorded schedule."""
+    from load.artifacts import event_session_types
+    from load.data_loader import init_fastf1
+
+    fastf1 = init_fastf1()
+    return [
+        (year, race_name, event_session_types(fastf1.get_event(year, race_name)['EventFormat']))
+        for year, race_name in FIXTURE_WEEKENDS
+    ]
+
+
+def fixture_ingestion(events):
+    """DataIngestion whose backfill only covers the recorded weekends of the seasons."""
+    from load.data_loader import DataIngestion
+
+    recorded = {(year, race_name) for year, race_name, _ in events}
+
+    class FixtureIngestion(DataIngestion):
+        def past_events(self, start_year, end_year):
+            return [event for event in super().past_events(start_year, end_year) if event[:2] in recorded]
+
+    return FixtureIngestion(BUCKET, PREFIX)
+
+
+def seed_lake(events):
+    from load.data_loader import DataIngestion
+
+    ingestion = DataIngestion(BUCKET, PREFIX)
+    for year, race_name, session_types in events:
+        ingestion.fetch_and_upload_race(year, race_name, session_types)
+
+
+def create_schedule_table(events):
+    from load.LoadEventSchedule import create_dynamoDB_table
+
+    create_dynamoDB_table()
+
+
+def run_fetch_and_upload_race(events):
+    from load.data_loader import DataIngestion
+
+    year, race_name, session_types = events[0]
+    ingestion = DataIngestion(BUCKET, PREFIX)
+    ingestion.fetch_and_upload_race(year, race_name, session_types)
+    ingestion.flush_indexes()
+
+
+def run_initial_load(events):
+    years = [year for year, _, _ in events]
+    fixture_ingestion(events).initial_load(min(years), max(years))
+
+
+def run_process_and_overwrite(events):
+    from preprocess.preprocessing import process_and_overwrite_parquet_files
+
+    process_and_overwrite_parquet_files(BUCKET, f"{PREFIX}/")
+
+
+def run_load_event_schedule(events):
+    from load.LoadEventSchedule import load_event_schedule_to_dynamodb
+
+    years = [year for year, _, _ in events]
+    load_event_schedule_to_dynamodb(min(years), max(years))
+
+
+# scenario -> (unmeasured setup, measured run); both get the fixture events
+SCENARIOS = {
+    'fetch_and_upload_race': (None, run_fetch_and_upload_race),
+    'initial_load': (None, run_initial_load),
+    'process_and_overwrite_parquet_files': (seed_lake, run_process_and_overwrite),
+    'load_event_schedule_to_dynamodb': (create_schedule_table, run_load_event_schedule),
+}
+
+
+def run_scenario(name, fixtures):
+    """
+    Runs one scenario in this process against moto S3 and DynamoDB and a replayed copy of the
+    fixtures. Peak RSS is the peak of the whole process, setup included.
+    """
+    import boto3
+    from moto import mock_aws
+
+    import load.data_loader as data_loader
+    from load import aws_clients
+    from load.artifacts import peak_rss_mb
+
+    cache_dir = tempfile.mkdtemp(prefix='fastf1_replay_')
+    shutil.copytree(fixtures, cache_dir, dirs_exist_ok=True)
+    data_loader.cache_dir = cache_dir
+    data_loader.init_fastf1().Cache.offline_mode(True)
+
+    setup, run = SCENARIOS[name]
+    counter = ApiCallCounter()
+    try:
+        with mock_aws():
+            boto3.setup_default_session()
+            counter.install(boto3.DEFAULT_SESSION)
+            aws_clients.reset()
+            boto3.client('s3').create_bucket(Bucket=BUCKET)
+
+            events = fixture_events()
+            if setup is not None:
+                setup(events)
+            counter.reset()
+
+            start = time.perf_counter()
+            run(events)
+            wall_s = time.perf_counter() - start
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return {
+        'wall_s': wall_s,
+        'peak_rss_mb': peak_rss_mb(),
+        'bytes_written': counter.bytes_written,
+        'api_calls': dict(sorted(counter.calls.items())),
+        'api_calls_total': sum(counter.calls.values()),
+    }
+
+
+def measure(name, fixtures):
+    """Runs a scenario in a fresh interpreter, so peak RSS and imports are not shared between scenarios."""
+    env = dict(os.environ, AWS_DEFAULT_REGION='us-east-1', AWS_ACCESS_KEY_ID='benchmark',
+               AWS_SECRET_ACCESS_KEY='benchmark')
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', name, '--fixtures', fixtures],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs):
+    """Median wall time and the peak RSS over all runs; bytes and calls do not vary between runs."""
+    summary = dict(runs[-1])
+    summary['wall_s'] = statistics.median(run['wall_s'] for run in runs)
+    summary['peak_rss_mb'] = max(run['peak_rss_mb'] for run in runs)
+    summary['runs'] = len(runs)
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results):
+    """Prints the change of every metric against a saved results file."""
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    for name, scenario in results['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if old is None:
+            print(f"  {name}: not in baseline")
+            continue
+        changes = []
+        for metric in ('wall_s', 'peak_rss_mb', 'bytes_written', 'api_calls_total'):
+            change = (scenario[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            changes.append(f"{metric} {old[metric]:.6g} -> {scenario[metric]:.6g} ({change:+.1f}%)")
+        print(f"  {name}: {', '.join(changes)}")
+        for call in sorted(set(old['api_calls']) | set(scenario['api_calls'])):
+            before, after = old['api_calls'].get(call, 0), scenario['api_calls'].get(call, 0)
+            if before != after:
+                print(f"    {call}: {before} -> {after}")
+
+
+def record(fixtures):
+    """Loads the fixture weekends from the live API into the fixtures cache directory."""
+    import fastf1
+    from load.artifacts import LOAD_FLAGS, event_session_types
+
+    os.makedirs(fixtures, exist_ok=True)
+    fastf1.Cache.enable_cache(fixtures)
+    for year, race_name in FIXTURE_WEEKENDS:
+        event = fastf1.get_event(year, race_name)
+        for session_type in event_session_types(event['EventFormat']):
+            print(f"Recording {race_name} {year} {session_type}")
+            fastf1.get_session(year, race_name, session_type).load(**dict.fromkeys(LOAD_FLAGS, True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the offline pipeline benchmarks on recorded sessions')
+    parser.add_argument('--fixtures', default=DEFAULT_FIXTURES,
+                        help='fastf1 cache directory holding the recorded weekends')
+    parser.add_argument('--record', action='store_true', help='Record the fixture weekends from the live API first')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), action='append',
+                        help='Scenario to run, may be repeated (default: all)')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='Results JSON of an earlier run to compare with')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args.fixtures)))
+        return
+    if args.record:
+        record(args.fixtures)
+    if not os.path.isdir(args.fixtures):
+        parser.error(f"No fixtures in {args.fixtures}, record them with --record")
+
+    results = {'commit': git_commit(), 'python': sys.version.split()[0], 'scenarios': {}}
+    print(f"{'scenario':<38}{'wall s':>9}{'peak MB':>9}{'MB written':>12}{'API calls':>11}")
+    for name in args.scenario or list(SCENARIOS):
+        summary = summarize([measure(name, args.fixtures) for _ in range(args.runs)])
+        results['scenarios'][name] = summary
+        print(f"{name:<38}{summary['wall_s']:>9.2f}{summary['peak_rss_mb']:>9.0f}"
+              f"{summary['bytes_written'] / (1024 * 1024):>12.2f}{summary['api_calls_total']:>11}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from logger import Logger
+
+# Summary output: 'json' (one JSON line) or 'emf' (CloudWatch embedded metric format). Unset disables
+# instrumentation entirely.
+OUTPUT_ENV = 'F1_METRICS'
+OUTPUTS = ('json', 'emf')
+
+NAMESPACE = 'F1Dashboard'
+SUMMARY_LOGGER = 'instrumentation'
+
+# CloudWatch units of the counters spans collect; anything else is reported as a plain count
+COUNTER_UNITS = {
+    'bytes': 'Bytes',
+    'rows': 'Count',
+    'items': 'Count',
+}
+TIMING_KEYS = ('count', 'errors', 'total_ms', 'max_ms')
+
+
+class Span:
+    """Times one stage and collects its counters, recorded on exit."""
+
+    __slots__ = ('instrumentation', 'stage', 'counters', 'start')
+
+    def __init__(self, instrumentation, stage):
+        self.instrumentation = instrumentation
+        self.stage = stage
+        self.counters = {}
+        self.start = None
+
+    def add(self, **counters):
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.instrumentation.record(self.stage, time.perf_counter() - self.start, exc_type is not None,
+                                    **self.counters)
+        return False
+
+
+class NullSpan:
+    """What span() returns while instrumentation is disabled: no clock reads, no locking."""
+
+    __slots__ = ()
+
+    def add(self, **counters):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+def summary_logger():
+    """Logger for the summaries: bare JSON on stdout, which is what CloudWatch parses EMF from."""
+    logger = Logger.get_logger(SUMMARY_LOGGER)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+class Instrumentation:
+    """
+    Aggregates timing spans per pipeline stage (fetch, load, extract, encode, upload, dynamodb)
+    with their row and byte counters, and emits one summary per invocation with flush().
+    Spans may be recorded from several threads. Pool worker processes record into their own
+    instance and send its stages back with their result, for the parent to merge().
+    """
+
+    def __init__(self, output=None):
+        self._lock = threading.Lock()
+        self.output = None
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.configure(output)
+
+    def configure(self, output):
+        if output not in OUTPUTS + (None,):
+            raise ValueError(f"Unknown metrics output {output!r}, expected one of {OUTPUTS}")
+        self.output = output
+
+    def span(self, stage):
+        if self.output is None:
+            return NULL_SPAN
+        return Span(self, stage)
+
+    def record(self, stage, seconds, error=False, **counters):
+        milliseconds = seconds * 1000
+        with self._lock:
+            stats = self.stages.setdefault(stage, {'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['count'] += 1
+            stats['errors'] += int(error)
+            stats['total_ms'] += milliseconds
+            stats['max_ms'] = max(stats['max_ms'], milliseconds)
+            for name, value in counters.items():
+                stats[name] = stats.get(name, 0) + value
+
+    def merge(self, stages):
+        """Adds the stages another process recorded (summary()['stages']) to this one's."""
+        with self._lock:
+            for stage, other in stages.items():
+                stats = self.stages.setdefault(stage, {'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+                for name, value in other.items():
+                    if name == 'max_ms':
+                        stats[name] = max(stats[name], value)
+                    else:
+                        stats[name] = stats.get(name, 0) + value
+
+    def summary(self, **dimensions):
+        with self._lock:
+            stages = {stage: dict(stats) for stage, stats in self.stages.items()}
+        for stats in stages.values():
+            stats['total_ms'] = round(stats['total_ms'], 3)
+            stats['max_ms'] = round(stats['max_ms'], 3)
+        return {
+            'event': 'invocation_summary',
+            **dimensions,
+            'duration_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'stages': stages,
+        }
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.started = time.perf_counter()
+
+    def flush(self, **dimensions):
+        """
+        Logs the summary of everything recorded since the last flush as one line, in the
+        configured format, and starts a new invocation. Returns the line, or None when disabled.
+        """
+        if self.output is None:
+            return None
+        summary = self.summary(**dimensions)
+        document = emf_document(summary, dimensions) if self.output == 'emf' else summary
+        line = json.dumps(document, default=str)
+        summary_logger().info(line)
+        self.reset()
+        return line
+
+
+def emf_document(summary, dimensions):
+    """
+    CloudWatch embedded metric format for a summary: <stage>_ms and <stage>_<counter> metrics
+    per stage, dimensioned by `dimensions`. The full summary is kept as log fields.
+    """
+    metrics = [{'Name': 'duration_ms', 'Unit': 'Milliseconds'}]
+    values = {'duration_ms': summary['duration_ms']}
+    for stage, stats in summary['stages'].items():
+        metrics.append({'Name': f"{stage}_ms", 'Unit': 'Milliseconds'})
+        values[f"{stage}_ms"] = stats['total_ms']
+        for counter, value in stats.items():
+            if counter in TIMING_KEYS:
+                continue
+            metrics.append({'Name': f"{stage}_{counter}", 'Unit': COUNTER_UNITS.get(counter, 'Count')})
+            values[f"{stage}_{counter}"] = value
+    return {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [sorted(dimensions)],
+                'Metrics': metrics,
+            }],
+        },
+        **{name: str(value) for name, value in dimensions.items()},
+        **values,
+        'stages': summary['stages'],
+    }
+
+
+# Process-wide instance used by the pipeline modules
+default = Instrumentation(os.getenv(OUTPUT_ENV) or None)
+
+
+def span(stage):
+    """Timing span for a pipeline stage: `with span('upload') as s: ...; s.add(bytes=n, rows=m)`."""
+    return default.span(stage)
+
+
+def configure(output):
+    default.configure(output)
+
+
+def flush(**dimensions):
+    return default.flush(**dimensions)
+
+
+def merge(stages):
+    default.merge(stages)
+
+
+def worker_call(output, function, *args):
+    """
+    Process pool entry point: runs function(*args) with instrumentation set to `output` (the
+    parent's, as worker processes may not inherit it) and returns its result together with
+    the stages it recorded, for the parent to merge().
+    """
+    default.configure(output)
+    default.reset()
+    result = function(*args)
+    return result, default.summary()['stages']
@@ -1,76 +1,91 @@
 import fastf1
-import pandas as pd
-import boto3
-import io
 import datetime
+from load.artifacts import load_flags
+from load.aws_clients import get_client
+from load.layout import artifact_key, parse_key
+from load.schema_registry import SchemaRegistry
+from load import schedule_service
+from load.telemetry import build_telemetry_frames
+from load.s3_writer import write_parquet
+from load.normalize import normalize_frame, encode_options, millisecond_columns
+
+# Artifacts uploaded for every session by this ingestion path
+SESSION_ARTIFACTS = ['laps', 'telemetry', 'weather', 'track_status']
 
 class F1DataIngestion:
     """Data ingestion class for fetching and uploading"""
     def __init__(self, bucket, prefix):
-        self.s3_client = boto3.client('s3')
+        self.s3_client = get_client('s3')
         self.bucket = bucket
         self.prefix = prefix
+        self.schema_registry = SchemaRegistry(self.s3_client, bucket, prefix)
 
     def fetch_and_upload_race_data(self, year, race_name, session_types):
         """Fetch data from open f1 for the race and upload to S3"""
         for session_type in session_types:
             # Load the session data
             session = fastf1.get_session(year, race_name, session_type)
-            session.load()
+            session.load(**load_flags(SESSION_ARTIFACTS))
 
             # Prepare the dataframes
             if session_type in ['FP1', 'FP2', 'FP3', 'Q', 'R']:
                 lap_df = session.laps
-                telemetry_df = session.car_data
+                telemetry_frames = build_telemetry_frames(session)
                 weather_df = session.weather_data
                 track_status_df = session.track_status
 
                 # Define S3 paths
                 base_path = f"{self.prefix}/{year}/{race_name.replace(' ', '-').lower()}"
                 lap_s3_path = f"{base_path}/{session_type.lower()}_laps.parquet"
-                telemetry_s3_path = f"{base_path}/{session_type.lower()}_telemetry.parquet"
                 weather_s3_path = f"{base_path}/{session_type.lower()}_weather.parquet"
                 track_status_s3_path = f"{base_path}/{session_type.lower()}_track_status.parquet"
 
                 # Convert DataFrames to Parquet and upload to S3
-                self.upload_parquet_to_s3(lap_df, lap_s3_path)
-                self.upload_parquet_to_s3(telemetry_df, telemetry_s3_path)
-                self.upload_parquet_to_s3(weather_df, weather_s3_path)
-                self.upload_parquet_to_s3(track_status_df, track_status_s3_path)
+                self.upload_parquet_to_s3(lap_df, lap_s3_path, 'laps')
+                self.upload_telemetry(year, race_name, session_type, telemetry_frames)
+                self.upload_parquet_to_s3(weather_df, weather_s3_path, 'weather')
+                self.upload_parquet_to_s3(track_status_df, track_status_s3_path, 'track_status')
+            self.schema_registry.flush()
+
+    def upload_telemetry(self, year, race_name, session_type, telemetry_frames):
+        """Full-rate telemetry goes to one file per driver, each rollup to one file per session"""
+        for artifact, frame in telemetry_frames.items():
+            if isinstance(frame, dict):
+                for driver, df in frame.items():
+                    s3_path = artifact_key(self.prefix, year, race_name, session_type, artifact, driver=driver)
+                    self.upload_parquet_to_s3(df, s3_path, artifact)
+            else:
+                s3_path = artifact_key(self.prefix, year, race_name, session_type, artifact)
+                self.upload_parquet_to_s3(frame, s3_path, artifact)
 
-    def upload_parquet_to_s3(self, df, s3_path):
-        """Util function, takes in the df from the predictor and converts it to parquet format and then upload to S3"""
-        parquet_buffer = io.BytesIO()
-        df.to_parquet(parquet_buffer, index=False)
-        self.s3_client.put_object(Bucket=self.bucket, Key=s3_path, Body=parquet_buffer.getvalue())
+    def upload_parquet_to_s3(self, df, s3_path, table=None):
+        """Util function, normalizes the df for its table, registers its schema and streams it to S3 as parquet"""
+        if table is not None:
+            milliseconds = millisecond_columns(df)
+            df = normalize_frame(df, table)
+            self.schema_registry.observe(table, parse_key(s3_path)['year'], df, milliseconds)
+        result = write_parquet(self.s3_client, self.bucket, s3_path, df, dedup=True, **encode_options(table))
+        if result.skipped:
+            print(f"Skipped {s3_path}, content unchanged in S3.")
 
     def fetch_latest_race_data(self):
         """Fetch the data for latest date"""
-        # Get the current year
-        year = datetime.datetime.now().year
-        schedule = fastf1.get_event_schedule(year)
-
-        # Get the last race that has occurred
-        now = datetime.datetime.now()
-        last_race = None
-        for _, row in schedule.iterrows():
-            race_date = pd.to_datetime(row['Session5DateUtc'])
-            if race_date < now:
-                last_race = row
+        # Get the last race that has occurred this year
+        now = datetime.datetime.utcnow()
+        last_race = schedule_service.default.last_completed_event(now.year, now)
 
         if last_race is not None and last_race['F1ApiSupport']:
             race_name = last_race['EventName']
             session_types = ['FP1', 'FP2', 'FP3', 'Q', 'R']
-            self.fetch_and_upload_race_data(year, race_name, session_types)
+            self.fetch_and_upload_race_data(now.year, race_name, session_types)
 
     def initial_load(self, start_year, end_year):
         for year in range(start_year, end_year + 1):
-            schedule = fastf1.get_event_schedule(year)
-            for _, row in schedule.iterrows():
-                race_name = row['EventName']
-                if row['F1ApiSupport']:  # Ensure the API supports the event
-                    session_types = ['FP1', 'FP2', 'FP3', 'Q', 'R']
-                    self.fetch_and_upload_race_data(year, race_name, session_types)
+            events = schedule_service.default.completed_events(year)
+            # Ensure the API supports the event
+            for race_name in events.loc[events['F1ApiSupport'], 'EventName']:
+                session_types = ['FP1', 'FP2', 'FP3', 'Q', 'R']
+                self.fetch_and_upload_race_data(year, race_name, session_types)
 
 def data_ingestion_lambda_handler(event, context):
     bucket_name = 'your-s3-bucket'
@@ -81,7 +96,7 @@ def data_ingestion_lambda_handler(event, context):
 
     # Mark the event as processed in DynamoDB
     event_date = datetime.datetime.now() - datetime.timedelta(days=1)
-    dynamodb = boto3.client('dynamodb')
+    dynamodb = get_client('dynamodb')
     dynamodb.update_item(
         TableName='F1EventsSchedule',
         Key={'EventDate': {'S': event_date.strftime('%Y-%m-%dT%H:%M:%SZ')}},
@@ -1,87 +1,61 @@
-import fastf1
-import boto3
 import datetime
-from boto3.dynamodb.conditions import Attr
 import json
+from load.schedule_store import EventScheduleStore, items_from_schedule
+from load.aws_clients import get_client, get_resource
+from load import schedule_service
+import instrumentation
 
-dynamodb = boto3.client('dynamodb')
-dynamodb_resource = boto3.resource('dynamodb')
+# fastf1 is only imported by the schedule service when a schedule is fetched; the scheduler Lambda never needs it
 events_table = 'F1EventsSchedule'
-lambda_client = boto3.client('lambda')
-cloudwatch_events = boto3.client('events')
 bucket_name = 'race-predictor-pro'
 prefix = 'f1_data'
 
 
 def create_dynamoDB_table():
     try:
-        existing_table = dynamodb.list_tables()['TableNames']
-
-        if events_table not in existing_table:
-            dynamodb.create_table(
-                TableName=events_table,
-                KeySchema=[
-                    {'AttributeName': 'EventDate', 'KeyType': 'HASH'},
-                    {'AttributeName': 'EventName', 'KeyType': 'RANGE'}
-                ],
-                AttributeDefinitions=[
-                    {'AttributeName': 'EventDate', 'AttributeType': 'S'},
-                    {'AttributeName': 'EventName', 'AttributeType': 'S'}
-                ],
-                ProvisionedThroughput={
-                    'ReadCapacityUnits': 5,
-                    'WriteCapacityUnits': 5
-                }
-            )
-            print('Creating table' + events_table + '...')
-            table_resources = dynamodb_resource.Table(events_table)
-            table_resources.wait_until_exists()
+        store = EventScheduleStore(events_table, get_resource('dynamodb'))
+        print('Creating table ' + events_table + '...')
+        if store.create_table():
             print(f'Table {events_table} created successfully')
+        else:
+            # Tables created before the pending index existed get it added in place
+            tagged = store.add_pending_index()
+            print(f'Table {events_table} already exists, pending index in place ({tagged} events tagged)')
 
     except Exception as e:
         print(f"Error creating table {e}")
 
 
-def load_event_schedule_to_dynamodb(start_year, end_year):
+def load_event_schedule_to_dynamodb(start_year, end_year, only_changed=False):
+    store = EventScheduleStore(events_table, get_resource('dynamodb'))
+    now = datetime.datetime.utcnow()
+    items = []
     for year in range(start_year, end_year + 1):
-        schedule = fastf1.get_event_schedule(year)
-        for _, row in schedule.iterrows():
-            event_date = row['Session5DateUtc']
-            event_name = row['EventName']
-            if row['EventFormat'] == 'testing':
-                continue
-            event_processed = event_date < datetime.datetime.utcnow()
-
-            dynamodb.put_item(
-                TableName=events_table,
-                Item={
-                    'EventDate': {'S': event_date.strftime('%Y-%m-%dT%H:%M:%SZ')},
-                    'EventName': {'S': event_name},
-                    'Processed': {'BOOL': event_processed}
-                }
-            )
-    print('Done loading event schedule')
+        schedule = schedule_service.default.schedule(year)
+        items.extend(items_from_schedule(schedule, now))
+
+    stats = store.put_events_batch(items, only_changed=only_changed)
+    print(f"Done loading event schedule: {stats['written']} events written "
+          f"({stats['unchanged']} unchanged) in {stats['requests']} batch requests, "
+          f"{stats['items_per_second']:.1f} items/s, {stats['consumed_capacity']:.1f} WCU consumed")
+    return stats
 
 
 def schedule_next_race_trigger(rule_name='F1DataIngestionTrigger', lambda_function_name='F1DataIngestionLambda'):
     try:
-        table = dynamodb_resource.Table(events_table)
-
-        # Scan the table for the next unprocessed event
-        response = table.scan(
-            FilterExpression=Attr('Processed').eq(False)
-        )
+        store = EventScheduleStore(events_table, get_resource('dynamodb'))
+        lambda_client = get_client('lambda')
+        cloudwatch_events = get_client('events')
 
-        events = response['Items']
-        if not events:
+        # Query the pending index for the earliest unprocessed event
+        next_event = store.next_pending()
+        if next_event is None:
             print("No unprocessed events found in the schedule.")
             return {
                 'statusCode': 404,
                 'body': 'No unprocessed events found in the schedule.'
             }
 
-        # Find the event with the earliest date
-        next_event = min(events, key=lambda x: x['EventDate'])
         next_event_date = datetime.datetime.strptime(next_event['EventDate'], '%Y-%m-%dT%H:%M:%SZ')
         print(f"Next event is {next_event['EventName']} on {next_event_date}")
 
@@ -164,4 +138,7 @@ def schedule_next_race_trigger(rule_name='F1DataIngestionTrigger', lambda_functi
 
 
 def schedule_lambda_handler(event, context):
-    return schedule_next_race_trigger()
+    try:
+        return schedule_next_race_trigger()
+    finally:
+        instrumentation.flush(function='schedule')
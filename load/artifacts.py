@@ -0,0 +1,84 @@
+import resource
+
+# Artifact plan: the parquet files written per session and the minimal
+# fastf1 `Session.load()` flags needed to produce each of them.
+LOAD_FLAGS = ('laps', 'telemetry', 'weather', 'messages')
+
+ARTIFACT_LOAD_FLAGS = {
+    # `Deleted` / `DeletedReason` are filled from race control messages
+    'laps': {'laps': True, 'messages': True},
+    'weather': {'weather': True},
+    # Driver info comes from session.results, which is loaded unconditionally
+    'drivers_info': {},
+    'telemetry': {'telemetry': True},
+    # Lap analytics (load/lap_analytics.py) are derived from the laps alone
+    'stints': {'laps': True},
+    'sector_bests': {'laps': True},
+    'lap_positions': {'laps': True},
+    'gap_to_leader': {'laps': True},
+    # Telemetry rollups need the laps to tag samples with lap numbers
+    'telemetry_1s': {'laps': True, 'telemetry': True},
+    'telemetry_100m': {'laps': True, 'telemetry': True},
+    'telemetry_lap': {'laps': True, 'telemetry': True},
+    # Track status is parsed as part of the lap data
+    'track_status': {'laps': True},
+}
+
+
+# Derived from the laps at ingest time; positions and gaps only for sprints and races
+LAP_ANALYTICS_ARTIFACTS = ['stints', 'sector_bests']
+RACE_ANALYTICS_ARTIFACTS = ['lap_positions', 'gap_to_leader']
+RACE_SESSIONS = ('S', 'R')
+
+# Written by load/telemetry.py when DataIngestion runs with telemetry enabled
+TELEMETRY_ARTIFACTS = ['telemetry', 'telemetry_1s', 'telemetry_100m', 'telemetry_lap']
+
+# Sessions with a classification worth exporting as drivers info
+DRIVERS_INFO_SESSIONS = ('Q', 'SQ', 'SS', 'S', 'R')
+
+# Columns of drivers_info_staging (load/stage_and_load.py), in table order
+DRIVERS_INFO_COLUMNS = [
+    'DriverNumber', 'BroadcastName', 'Abbreviation', 'DriverId', 'TeamName', 'TeamColor', 'TeamId',
+    'FirstName', 'LastName', 'FullName', 'HeadshotUrl', 'CountryCode', 'Position', 'ClassifiedPosition',
+    'GridPosition', 'Q1', 'Q2', 'Q3', 'Time', 'Status', 'Points',
+]
+
+# Session identifiers per fastf1 EventFormat, in running order
+EVENT_FORMAT_SESSIONS = {
+    'conventional': ['FP1', 'FP2', 'FP3', 'Q', 'R'],
+    'sprint': ['FP1', 'Q', 'FP2', 'S', 'R'],
+    'sprint_shootout': ['FP1', 'Q', 'SS', 'S', 'R'],
+    'sprint_qualifying': ['FP1', 'SQ', 'S', 'Q', 'R'],
+}
+
+
+def event_session_types(event_format):
+    """Sessions of a race weekend, falling back to the conventional format."""
+    return EVENT_FORMAT_SESSIONS.get(event_format, EVENT_FORMAT_SESSIONS['conventional'])
+
+
+def session_artifacts(session_type, telemetry=False):
+    """Names of the parquet artifacts written by DataIngestion for a session type."""
+    artifacts = ['laps', 'weather']
+    if session_type in DRIVERS_INFO_SESSIONS:
+        artifacts = ['drivers_info'] + artifacts
+    artifacts += LAP_ANALYTICS_ARTIFACTS
+    if session_type in RACE_SESSIONS:
+        artifacts += RACE_ANALYTICS_ARTIFACTS
+    if telemetry:
+        artifacts += TELEMETRY_ARTIFACTS
+    return artifacts
+
+
+def load_flags(artifacts):
+    """Combines the load flags of every artifact into kwargs for `Session.load()`."""
+    flags = dict.fromkeys(LOAD_FLAGS, False)
+    for artifact in artifacts:
+        for flag, enabled in ARTIFACT_LOAD_FLAGS[artifact].items():
+            flags[flag] = flags[flag] or enabled
+    return flags
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB (Linux reports ru_maxrss in KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
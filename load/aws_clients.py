@@ -0,0 +1,71 @@
+import os
+import threading
+
+# Upload threads share one client per service, so allow more pooled connections than botocore's default of 10
+MAX_POOL_CONNECTIONS = 32
+
+_lock = threading.Lock()
+_clients = {}
+_resources = {}
+# Stand-ins set with register_client/register_resource, kept across forks
+_registered_clients = {}
+_registered_resources = {}
+_pid = os.getpid()
+
+
+def _forget_after_fork():
+    # Clients inherited from a parent process share its sockets; worker processes make their own
+    global _pid
+    if _pid != os.getpid():
+        _clients.clear()
+        _resources.clear()
+        _pid = os.getpid()
+
+
+def get_client(service):
+    """
+    boto3 client for `service`, created on first use and reused afterwards, so a warm Lambda
+    keeps its connection pool between invocations. Handlers that never call a service do not
+    pay for creating its client.
+    """
+    with _lock:
+        _forget_after_fork()
+        if service in _registered_clients:
+            return _registered_clients[service]
+        if service not in _clients:
+            import boto3
+            from botocore.config import Config
+            _clients[service] = boto3.client(service, config=Config(max_pool_connections=MAX_POOL_CONNECTIONS))
+        return _clients[service]
+
+
+def get_resource(service):
+    """boto3 resource for `service`, created on first use and reused afterwards."""
+    with _lock:
+        _forget_after_fork()
+        if service in _registered_resources:
+            return _registered_resources[service]
+        if service not in _resources:
+            import boto3
+            _resources[service] = boto3.resource(service)
+        return _resources[service]
+
+
+def register_client(service, client):
+    """Uses `client` for `service` from now on, e.g. a stand-in for tests and benchmarks."""
+    with _lock:
+        _registered_clients[service] = client
+
+
+def register_resource(service, resource):
+    with _lock:
+        _registered_resources[service] = resource
+
+
+def reset():
+    """Drops every cached client and resource, including registered stand-ins."""
+    with _lock:
+        _clients.clear()
+        _resources.clear()
+        _registered_clients.clear()
+        _registered_resources.clear()
@@ -0,0 +1,180 @@
+import os
+import shutil
+import threading
+
+# fastf1 keeps one directory of .ff1pkl files per session under the cache dir,
+# named after the session's api path with the leading '/static/' dropped
+API_PATH_PREFIX = '/static/'
+CACHE_FILE_SUFFIX = '.ff1pkl'
+
+# Lambda's /tmp is 512 MB by default; leave headroom for spooled uploads
+DEFAULT_MAX_LOCAL_BYTES = 384 * 1024 * 1024
+
+
+class LocalDirStore:
+    """Remote cache tier backed by a local directory, used as a stand-in for S3 in tests and benchmarks."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def list(self, session_dir):
+        path = os.path.join(self.root, session_dir)
+        if not os.path.isdir(path):
+            return []
+        return sorted(name for name in os.listdir(path) if name.endswith(CACHE_FILE_SUFFIX))
+
+    def download(self, session_dir, name, local_path):
+        shutil.copyfile(os.path.join(self.root, session_dir, name), local_path)
+
+    def upload(self, local_path, session_dir, name):
+        os.makedirs(os.path.join(self.root, session_dir), exist_ok=True)
+        shutil.copyfile(local_path, os.path.join(self.root, session_dir, name))
+
+
+class S3CacheStore:
+    """Remote cache tier storing fastf1 cache files under s3://bucket/prefix/<session dir>/."""
+
+    def __init__(self, s3_client, bucket, prefix):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, session_dir, name):
+        return f"{self.prefix}/{session_dir}/{name}"
+
+    def list(self, session_dir):
+        names = []
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}/{session_dir}/"):
+            for obj in page.get('Contents', []):
+                name = obj['Key'].rsplit('/', 1)[-1]
+                if name.endswith(CACHE_FILE_SUFFIX):
+                    names.append(name)
+        return sorted(names)
+
+    def download(self, session_dir, name, local_path):
+        self.s3_client.download_file(self.bucket, self._key(session_dir, name), local_path)
+
+    def upload(self, local_path, session_dir, name):
+        self.s3_client.upload_file(local_path, self.bucket, self._key(session_dir, name))
+
+
+class TieredSessionCache:
+    """
+    Two-tier cache for fastf1 session data: the local fastf1 cache dir in front of a shared
+    remote store.
+
+    hydrate() runs before session.load(). Files only the remote tier has are pulled down (a
+    remote hit); a session fully cached locally is a local hit; with neither, fastf1 falls back
+    to the upstream API (a miss). write_back() runs after the load and pushes any cache file
+    the remote tier is missing. The local tier is capped at max_local_bytes, evicting the
+    least recently used session directories first.
+    """
+
+    def __init__(self, local_dir, remote=None, max_local_bytes=DEFAULT_MAX_LOCAL_BYTES):
+        self.local_dir = local_dir
+        self.remote = remote
+        self.max_local_bytes = max_local_bytes
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.remote_hits = 0
+        self.misses = 0
+        self.files_downloaded = 0
+        self.files_uploaded = 0
+        self.evictions = 0
+        # Remote file names seen by hydrate(), reused by write_back() to avoid a second listing
+        self._remote_names = {}
+
+    @staticmethod
+    def session_dir(f1_session):
+        api_path = f1_session.api_path
+        if api_path.startswith(API_PATH_PREFIX):
+            api_path = api_path[len(API_PATH_PREFIX):]
+        return api_path.strip('/')
+
+    def _local_files(self, session_dir):
+        path = os.path.join(self.local_dir, session_dir)
+        if not os.path.isdir(path):
+            return []
+        return [name for name in os.listdir(path) if name.endswith(CACHE_FILE_SUFFIX)]
+
+    def hydrate(self, f1_session):
+        """Makes the session's cache files available locally. Returns 'local', 'remote' or 'miss'."""
+        session_dir = self.session_dir(f1_session)
+        local_path = os.path.join(self.local_dir, session_dir)
+        local_names = set(self._local_files(session_dir))
+        remote_names = self.remote.list(session_dir) if self.remote is not None else []
+        with self._lock:
+            self._remote_names[session_dir] = set(remote_names)
+
+        missing = [name for name in remote_names if name not in local_names]
+        if missing:
+            os.makedirs(local_path, exist_ok=True)
+            for name in missing:
+                # Download next to the target and rename so fastf1 never reads a partial pickle
+                temp_path = os.path.join(local_path, f".{name}.part")
+                self.remote.download(session_dir, name, temp_path)
+                os.replace(temp_path, os.path.join(local_path, name))
+            with self._lock:
+                self.remote_hits += 1
+                self.files_downloaded += len(missing)
+            source = 'remote'
+        elif local_names:
+            with self._lock:
+                self.local_hits += 1
+            source = 'local'
+        else:
+            with self._lock:
+                self.misses += 1
+            return 'miss'
+
+        os.utime(local_path)
+        self.evict(keep=session_dir)
+        return source
+
+    def write_back(self, f1_session):
+        """Uploads cache files written by session.load() that the remote tier does not have yet."""
+        session_dir = self.session_dir(f1_session)
+        if self.remote is not None:
+            with self._lock:
+                remote_names = self._remote_names.pop(session_dir, None)
+            if remote_names is None:
+                remote_names = set(self.remote.list(session_dir))
+            new_names = [name for name in self._local_files(session_dir) if name not in remote_names]
+            for name in new_names:
+                self.remote.upload(os.path.join(self.local_dir, session_dir, name), session_dir, name)
+            with self._lock:
+                self.files_uploaded += len(new_names)
+        self.evict(keep=session_dir)
+
+    def evict(self, keep=None):
+        """Removes least recently used session directories until the local tier fits its size cap."""
+        sessions = []
+        total = 0
+        for path, _, names in os.walk(self.local_dir):
+            size = sum(os.path.getsize(os.path.join(path, name)) for name in names if name.endswith(CACHE_FILE_SUFFIX))
+            if size:
+                sessions.append((os.path.getmtime(path), path, size))
+                total += size
+
+        keep_path = None if keep is None else os.path.join(self.local_dir, keep)
+        for _, path, size in sorted(sessions):
+            if total <= self.max_local_bytes:
+                break
+            if path == keep_path:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'local_hits': self.local_hits,
+                'remote_hits': self.remote_hits,
+                'misses': self.misses,
+                'files_downloaded': self.files_downloaded,
+                'files_uploaded': self.files_uploaded,
+                'evictions': self.evictions,
+            }
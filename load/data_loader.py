@@ -1,37 +1,49 @@
-import io
-import fastf1
-import boto3
-import pandas as pd
 import datetime
-from boto3.dynamodb.conditions import Attr
-from fastf1.core import DataNotLoadedError
+import functools
+import hashlib
+import json
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from load.artifacts import session_artifacts, load_flags, peak_rss_mb, event_session_types, DRIVERS_INFO_COLUMNS
+from load.layout import FLAT, HIVE, artifact_key, driver_files_prefix, event_slug, parse_key, PartitionIndex
+from load.schedule_store import EventScheduleStore, event_year
+from load.cache_tier import TieredSessionCache, S3CacheStore
+from load.schema_registry import SchemaRegistry, format_drift
+from load import schedule_service
+from load.schedule_service import DATE_COLUMN
+from load.aws_clients import get_client, get_resource
+import instrumentation
+from instrumentation import span
+from logging_setup import LoggingSetup
+
+# fastf1, pandas and pyarrow are imported where they are used, so importing this module (and
+# handlers that never load a session) stays cheap on a cold start
 
-dynamodb_client = boto3.client('dynamodb')
-dynamodb_resource = boto3.resource('dynamodb')
 events_table = 'F1EventsSchedule'
-lambda_client = boto3.client('lambda')
-cloudwatch_events = boto3.client('events')
 bucket_name = 'race-predictor-pro'
 prefix = 'f1_data'
 
 # Define cache directory in Lambda's /tmp
 cache_dir = '/tmp/.fastf1'
+_fastf1_cache_enabled = False
 
-# Ensure the cache directory exists before doing anything with FastF1
-if not os.path.exists(cache_dir):
-    os.makedirs(cache_dir, mode=0o700)  # Ensure correct permissions
+# S3 prefix (under the data prefix) of the fastf1 cache shared between Lambda invocations
+shared_cache_prefix = '_fastf1_cache'
 
-# Enable cache after ensuring the directory exists
-fastf1.Cache.enable_cache(cache_dir)
+# Local spool the Lambda handlers encode into; its uploads run in the background
+spool_dir = '/tmp/spool'
 
 
 def data_ingestion_lambda_handler(event, context):
+    data_ingestion = None
     try:
-        data_ingestion = DataIngestion(bucket_name, prefix)
+        data_ingestion = DataIngestion(bucket_name, prefix, shared_cache=True, spool_dir=spool_dir)
         eventName = data_ingestion.fetch_and_load_latest_race()
         data_ingestion.mark_latest_events_as_processed(eventName)
-        lambda_client.invoke(
+        get_client('lambda').invoke(
             FunctionName='F1RaceSchedulerLambda',
             InvocationType='Event'
         )
@@ -46,125 +58,633 @@ def data_ingestion_lambda_handler(event, context):
             'statusCode': 500,
             'body': f'Error processing data: {e}'
         }
+    finally:
+        if data_ingestion is not None:
+            data_ingestion.close()
+        instrumentation.flush(function='data_ingestion')
+
+
+def live_ingestion_lambda_handler(event, context):
+    """
+    One live poll of the session in the event ({'year', 'event_name', 'session_type'}). Meant to
+    run on a short schedule during the session window; the watermark is kept in S3.
+    """
+    try:
+        data_ingestion = DataIngestion(bucket_name, prefix)
+        uploaded = data_ingestion.ingest_live(int(event['year']), event['event_name'], event['session_type'],
+                                              max_polls=1)
+        return {
+            'statusCode': 200,
+            'body': f'live rows uploaded: {uploaded}'
+        }
+
+    except Exception as e:
+        print(f'Error processing live data: {e}')
+        return {
+            'statusCode': 500,
+            'body': f'Error processing live data: {e}'
+        }
+    finally:
+        instrumentation.flush(function='live_ingestion')
+
+
+def fanout_coordinator_lambda_handler(event, context):
+    """
+    Fan-out entry point: queues one work item per session of the next unprocessed event on
+    the SESSION_QUEUE_URL queue instead of loading them all in this invocation.
+    """
+    try:
+        from load.fanout import SqsQueue, DynamoDBBarrier, enqueue_event
+
+        store = EventScheduleStore(events_table, get_resource('dynamodb'))
+        next_event = store.next_pending()
+        if next_event is None:
+            return {
+                'statusCode': 200,
+                'body': 'no unprocessed event to fan out'
+            }
+
+        year = event_year(next_event)
+        event_format = init_fastf1().get_event(year, next_event['EventName'])['EventFormat']
+        work_queue = SqsQueue(get_client('sqs'), os.environ['SESSION_QUEUE_URL'])
+        items = enqueue_event(next_event, year, event_session_types(event_format), work_queue,
+                              DynamoDBBarrier(store))
+        return {
+            'statusCode': 200,
+            'body': f"queued {len(items)} sessions of {next_event['EventName']}"
+        }
+
+    except Exception as e:
+        print(f'Error fanning out sessions: {e}')
+        return {
+            'statusCode': 500,
+            'body': f'Error fanning out sessions: {e}'
+        }
+    finally:
+        instrumentation.flush(function='fanout_coordinator')
+
+
+def session_worker_lambda_handler(event, context):
+    """
+    SQS-triggered worker for fan-out work items, one session each. The worker that completes
+    an event's barrier marks it processed and triggers the scheduler. Failed messages are
+    reported as batch item failures so only those are retried.
+    """
+    from load.fanout import DynamoDBBarrier, process_work_item, item_event
+
+    data_ingestion = None
+    try:
+        try:
+            barrier = DynamoDBBarrier(EventScheduleStore(events_table, get_resource('dynamodb')))
+            data_ingestion = DataIngestion(bucket_name, prefix, shared_cache=True, spool_dir=spool_dir)
+        except Exception as e:
+            # Nothing was processed, so every message is retried
+            print(f'Error setting up the session worker: {e}')
+            return {'batchItemFailures': [{'itemIdentifier': record['messageId']} for record in event['Records']]}
+
+        failures = []
+        for record in event['Records']:
+            try:
+                item = json.loads(record['body'])
+                if not process_work_item(data_ingestion, item):
+                    raise RuntimeError('upload failed')
+                if barrier.complete(item_event(item), item['SessionType']):
+                    print(f"All sessions of {item['EventName']} completed, event marked processed.")
+                    get_client('lambda').invoke(
+                        FunctionName='F1RaceSchedulerLambda',
+                        InvocationType='Event'
+                    )
+            except Exception as e:
+                print(f"Error processing work item {record['messageId']}: {e}")
+                failures.append({'itemIdentifier': record['messageId']})
+        return {'batchItemFailures': failures}
+    finally:
+        if data_ingestion is not None:
+            data_ingestion.close()
+        instrumentation.flush(function='session_worker')
 
 
 class DataIngestion:
 
-    def __init__(self, bucket, prefix):
-        self.s3_client = boto3.client('s3')
+    def __init__(self, bucket, prefix, manifest=None, resume=False, selective_load=True, dedup=True,
+                 hash_index=None, layout=FLAT, shared_cache=False, telemetry=False, spool_dir=None):
+        self.s3_client = get_client('s3')
         self.bucket = bucket
         self.prefix = prefix
+        # Optional BackfillManifest; with resume=True artifacts it marks as done are skipped
+        self.manifest = manifest
+        self.resume = resume
+        # Only parse the fastf1 data the uploaded artifacts need; False restores the full load()
+        self.selective_load = selective_load
+        # Skip uploads whose content hash matches the existing object (HEAD, or the optional HashIndex)
+        self.dedup = dedup
+        self.hash_index = hash_index
+        # 'flat' keeps {year}/{event}/{session}_{artifact}.parquet; 'hive' writes dataset=/year=/event=/session=
+        # partitions and keeps a per-dataset _index.json up to date
+        self.layout = layout
+        self.partition_index = PartitionIndex(self.s3_client, bucket, prefix) if layout == HIVE else None
+        # Arrow schemas of everything written, per dataset and season; the Snowflake DDL is generated from them
+        self.schema_registry = SchemaRegistry(self.s3_client, bucket, prefix)
+        # (bucket, prefix) of the shared fastf1 cache tier, or None to only use the local cache dir.
+        # Passed as plain values so it can be sent to the backfill worker processes.
+        self.cache_remote = (bucket, f"{prefix}/{shared_cache_prefix}") if shared_cache else None
+        # Also write full-rate telemetry per driver plus its 1 s / 100 m / per-lap rollups
+        self.telemetry = telemetry
+        # With a spool directory, artifacts are encoded to local disk and uploaded by a background
+        # pool, so loading the next session overlaps the uploads; flush_indexes() waits for them
+        self.spool = None
+        if spool_dir is not None:
+            from load.spool import Spool
+            self.spool = Spool(self.s3_client, spool_dir, dedup=dedup, hash_index=hash_index)
 
     def fetch_and_upload_race(self, year, race_name, session_types):
+        summary = BackfillSummary()
         for session_type in session_types:
+            if self.session_already_loaded(year, race_name, session_type):
+                print(f"Skipping {race_name} {year} {session_type}, already in the manifest.")
+                summary.record(year, race_name, session_type, 'skipped')
+                continue
+
             try:
-                f1_session = fastf1.get_session(year, race_name, session_type)
-                f1_session.load()
+                frames = load_session_frames(year, race_name, session_type, self.selective_load,
+                                             self.cache_remote, self.telemetry)
+            except ValueError as e:
+                print(f"Session {session_type} does not exist for this race : {e}")
+                self.record_missing_session(year, race_name, session_type, e)
+                summary.record(year, race_name, session_type, 'missing')
+                continue
+            except Exception as e:
+                print(f"An unexpected error occurred: {e}")
+                summary.record(year, race_name, session_type, 'failed', e)
+                continue
 
-                # Define S3 paths
-                base_path = f"{self.prefix}/{year}/{race_name.replace(' ', '-').lower()}"
+            self.upload_session_frames(year, race_name, session_type, frames, summary)
+        return summary
 
-                if session_type == 'R':
-                    drivers = f1_session.drivers
-                    dummy_df = []
+    def upload_session_frames(self, year, race_name, session_type, frames, summary=None, previous=None):
+        """Upload the frames of one session. Waits for `previous` first so an event's sessions land in order."""
+        if previous is not None:
+            try:
+                previous.result()
+            except Exception:
+                pass
 
-                    for driver in drivers:
-                        df = pd.DataFrame(f1_session.get_driver(driver)).T
-                        dummy_df.append(df)
+        failed = []
+        for artifact in session_artifacts(session_type, self.telemetry):
+            if artifact not in frames:
+                if self.manifest is not None:
+                    self.manifest.mark_unavailable(year, race_name, session_type, artifact)
+                continue
+            if self.resume and self.manifest is not None \
+                    and self.manifest.is_done(year, race_name, session_type, artifact):
+                print(f"Skipping {session_type.lower()}_{artifact} for {race_name} {year}, already uploaded.")
+                continue
 
-                    driver_df = pd.concat(dummy_df, ignore_index=True)
-                    drivers_info_s3_path = f"{base_path}/{session_type.lower()}_drivers_info.parquet"
-                    self.upload_parquet_to_s3(driver_df, drivers_info_s3_path)
+            if isinstance(frames[artifact], dict):
+                s3_path, result = self.upload_driver_frames(year, race_name, session_type, artifact, frames[artifact])
+            else:
+                s3_path = artifact_key(self.prefix, year, race_name, session_type, artifact, self.layout)
+                result = self.upload_parquet_to_s3(frames[artifact], s3_path, artifact)
+            if result is None:
+                failed.append(artifact)
+                self.record_artifact(year, race_name, session_type, artifact, 'failed', s3_key=s3_path)
+            else:
+                if result.skipped and summary is not None:
+                    summary.record_unchanged(result.key)
+                if self.partition_index is not None and not isinstance(frames[artifact], dict):
+                    self.partition_index.add(artifact, year, event_slug(race_name), session_type.lower(),
+                                             result.key, frames[artifact])
+                complete = functools.partial(self.record_artifact, year, race_name, session_type, artifact,
+                                             'complete', row_count=result.rows, byte_size=result.bytes,
+                                             content_hash=result.content_hash, s3_key=result.key)
+                if self.spool is None:
+                    complete()
+                else:
+                    # Spooled files are only marked complete once they are in S3
+                    keys = [result.key]
+                    if isinstance(frames[artifact], dict):
+                        keys = [artifact_key(self.prefix, year, race_name, session_type, artifact, self.layout,
+                                             driver=driver) for driver in frames[artifact]]
+                    self.spool.when_uploaded(keys, complete)
 
-                try:
+        if summary is not None:
+            if failed:
+                summary.record(year, race_name, session_type, 'failed', f"upload failed for {', '.join(failed)}")
+            else:
+                summary.record(year, race_name, session_type, 'uploaded')
 
-                    try:
-                        laps_df = f1_session.laps
-                        lap_s3_path = f"{base_path}/{session_type.lower()}_laps.parquet"
-                        self.upload_parquet_to_s3(laps_df, lap_s3_path)
-                    except DataNotLoadedError as e:
-                        print(f"Laps data not loaded: {e}")
-                        laps_df = None
+    def upload_driver_frames(self, year, race_name, session_type, artifact, driver_frames):
+        """
+        Uploads one file per driver for artifacts split by driver. Returns the common key prefix
+        and one UploadResult covering all files, or None if any of them failed.
+        """
+        from load.s3_writer import UploadResult
 
-                    try:
-                        weather_df = f1_session.weather_data
-                        weather_s3_path = f"{base_path}/{session_type.lower()}_weather.parquet"
-                        self.upload_parquet_to_s3(weather_df, weather_s3_path)
-                    except DataNotLoadedError as e:
-                        print(f"Weather data not loaded: {e}")
-                        weather_df = None
+        key_prefix = driver_files_prefix(self.prefix, year, race_name, session_type, artifact, self.layout)
+        results = []
+        for driver, df in driver_frames.items():
+            s3_path = artifact_key(self.prefix, year, race_name, session_type, artifact, self.layout, driver=driver)
+            result = self.upload_parquet_to_s3(df, s3_path, artifact)
+            if result is None:
+                return key_prefix, None
+            if self.partition_index is not None:
+                self.partition_index.add(artifact, year, event_slug(race_name), session_type.lower(),
+                                         result.key, df, driver=driver)
+            results.append(result)
 
-                except Exception as e:
-                    print(f"An unexpected error occurred: {e}")
+        combined_hash = hashlib.sha256(''.join(result.content_hash for result in results).encode()).hexdigest()
+        return key_prefix, UploadResult(key_prefix, sum(result.rows for result in results),
+                                        sum(result.bytes for result in results), combined_hash,
+                                        skipped=all(result.skipped for result in results))
 
-            except ValueError as e:
-                print(f"Session {session_type} does not exist for this race : {e}")
-                continue
+    def ingest_live(self, year, race_name, session_type, feed=None, watermarks=None,
+                    poll_interval=None, until=None, max_polls=None):
+        """
+        Live mode: polls a running session and uploads its new laps and weather rows as
+        append-only delta files (see load/live.py). By default fastf1 is polled and the
+        watermarks are kept in S3; `feed` and `watermarks` take stand-ins such as ReplayFeed.
+        Polling stops at `until`, after max_polls polls, or when the feed is finished.
+        Returns the number of rows uploaded per artifact.
+        """
+        from load.live import (LiveIngestion, FastF1Feed, WatermarkStore, DEFAULT_POLL_INTERVAL,
+                               session_window)
 
-            except Exception as e:
-                print(f"An unexpected error occurred: {e}")
+        feed = feed or FastF1Feed(year, race_name, session_type)
+        watermarks = watermarks or WatermarkStore(self.s3_client, self.bucket, self.prefix)
+        if until is None and max_polls is None:
+            until = session_window(year, race_name, session_type)[1]
+        if poll_interval is None:
+            poll_interval = DEFAULT_POLL_INTERVAL
+        live = LiveIngestion(self, feed, watermarks, year, race_name, session_type)
+        return live.run(poll_interval, until=until, max_polls=max_polls)
+
+    def flush_uploads(self):
+        """
+        Waits for the spooled uploads. Raises if any gave up after retrying; those stay in the
+        spool and are uploaded by the next run on the same spool directory.
+        """
+        if self.spool is None:
+            return
+        failed = self.spool.flush()
+        if failed:
+            raise RuntimeError(f"{len(failed)} uploads left in the spool: {', '.join(failed)}")
+
+    def flush_indexes(self):
+        """
+        Waits for the spooled uploads, then writes the partition index and the schemas
+        registered since the last flush, so they never point at files that are not in S3.
+        """
+        self.flush_uploads()
+        if self.partition_index is not None:
+            self.partition_index.flush()
+        self.schema_registry.flush()
+
+    def close(self):
+        """Waits for the spooled uploads and stops the spool's upload threads."""
+        if self.spool is not None:
+            self.spool.close()
+
+    def session_already_loaded(self, year, race_name, session_type):
+        if not self.resume or self.manifest is None:
+            return False
+        return self.manifest.session_done(year, race_name, session_type,
+                                          session_artifacts(session_type, self.telemetry))
+
+    def record_artifact(self, year, race_name, session_type, artifact, status, **details):
+        if self.manifest is not None:
+            self.manifest.mark(year, race_name, session_type, artifact, status, **details)
+
+    def record_missing_session(self, year, race_name, session_type, error):
+        if self.manifest is not None:
+            self.manifest.mark_session_missing(year, race_name, session_type,
+                                               session_artifacts(session_type, self.telemetry), error)
+
+    def upload_parquet_to_s3(self, df, s3_path, artifact=None):
+        """
+        Uploads the frame as parquet. When `artifact` names a table in TABLE_SPECS the frame is
+        normalized and encoded with that table's settings first, and its schema is registered.
+        Returns an UploadResult, or None if the upload failed.
+        """
+        # Imported here so that importing this module does not pull in pandas and pyarrow
+        from load.normalize import normalize_frame, encode_options, millisecond_columns
+        from load.s3_writer import write_parquet
 
-    def upload_parquet_to_s3(self, df, s3_path):
         try:
-            buffer = io.BytesIO()
-            df.to_parquet(buffer, index=False)
-            buffer.seek(0)
-            self.s3_client.put_object(Bucket=self.bucket, Key=s3_path, Body=buffer.getvalue())
-            print(f"Successfully uploaded {s3_path} to S3.")
+            if artifact is not None:
+                with span('encode'):
+                    milliseconds = millisecond_columns(df)
+                    df = normalize_frame(df, artifact)
+                    drift = self.schema_registry.observe(artifact, parse_key(s3_path)['year'], df, milliseconds)
+                if drift:
+                    print(f"Schema drift in {artifact}: {format_drift(drift)}")
+            if self.spool is not None:
+                result = self.spool.write(self.bucket, s3_path, df, **encode_options(artifact))
+                print(f"Spooled {s3_path} for upload.")
+                return result
+            result = write_parquet(self.s3_client, self.bucket, s3_path, df, dedup=self.dedup,
+                                   hash_index=self.hash_index, **encode_options(artifact))
+            if result.skipped:
+                print(f"Skipped {s3_path}, content unchanged in S3.")
+            else:
+                print(f"Successfully uploaded {s3_path} to S3.")
+            return result
         except Exception as e:
             print(f"Failed to upload {s3_path} to S3. Error: {e}")
+            return None
 
-    def initial_load(self, start_year, end_year):
+    def past_events(self, start_year, end_year):
+        """Raced, API-supported events of the seasons as (year, race_name, session_types, race_date)."""
+        # Schedules are fetched through fastf1 with this module's cache enabled
+        init_fastf1()
+        events = []
+        now = datetime.datetime.utcnow()
         for year in range(start_year, end_year + 1):
-            f1_schedule = fastf1.get_event_schedule(year)
-            for _, row in f1_schedule.iterrows():
-                race_name = row['EventName']
-                if row['EventFormat'] == 'testing':
-                    continue
-                race_date = row['Session5DateUtc']
-                if race_date < datetime.datetime.utcnow():
-                    if row['F1ApiSupport']:
-                        session_types = ['FP1', 'FP2', 'FP3', 'Q', 'R']
-                        self.fetch_and_upload_race(year, race_name, session_types)
+            raced = schedule_service.default.completed_events(year, now)
+            raced = raced[raced['F1ApiSupport']]
+            for race_name, event_format, race_date in zip(raced['EventName'], raced['EventFormat'],
+                                                          raced[DATE_COLUMN]):
+                events.append((year, race_name, event_session_types(event_format), race_date))
+        return events
 
-    def fetch_and_load_latest_race(self) -> str:
-        table = dynamodb_resource.Table(events_table)
+    def initial_load(self, start_year, end_year, max_workers=1):
+        events = [event[:3] for event in self.past_events(start_year, end_year)]
 
-        response = table.scan(
-            FilterExpression=Attr('Processed').eq(False)
-        )
+        if max_workers <= 1:
+            summary = BackfillSummary()
+            for year, race_name, session_types in events:
+                summary.merge(self.fetch_and_upload_race(year, race_name, session_types))
+        else:
+            summary = self.backfill(events, max_workers)
+
+        try:
+            self.flush_indexes()
+        finally:
+            summary.report()
+        return summary
+
+    def fanout_load(self, start_year, end_year, max_workers=4, use_processes=False):
+        """
+        Backfill through the fan-out flow: one work item per session, run on a local pool.
+        Worker threads share this DataIngestion, manifest, hash index and spool included. Worker
+        processes use their own with this one's upload settings and manifest; the hash index
+        and the spool cannot be shared across processes, so they are rejected there.
+        """
+        if use_processes and (self.hash_index is not None or self.spool is not None):
+            raise ValueError("The hash index and the spool only work with the fan-out on threads, "
+                             "drop --processes or --hash-index/--spool-dir.")
+        from load.fanout import run_local_fanout
+        from load.schedule_store import DATE_FORMAT
+
+        events = [
+            ({'EventDate': race_date.strftime(DATE_FORMAT), 'EventName': race_name}, year, session_types)
+            for year, race_name, session_types, race_date in self.past_events(start_year, end_year)
+        ]
+        options = dict(resume=self.resume, selective_load=self.selective_load, dedup=self.dedup,
+                       layout=self.layout, shared_cache=self.cache_remote is not None, telemetry=self.telemetry)
+        return run_local_fanout(self, events, max_workers, use_processes, ingestion_options=options)
+
+    def backfill(self, events, max_workers, upload_workers=None):
+        """
+        Loads the sessions of (year, race_name, session_types) events on a process pool
+        and uploads them on a thread pool.
+
+        At most `2 * max_workers` loads are in flight so finished frames do not pile up
+        in memory; sessions are consumed in schedule order and each event's uploads are
+        chained so FP1 always lands before R.
+        """
+        summary = BackfillSummary()
+        upload_workers = upload_workers or max_workers * 2
+        in_flight = deque()
+        previous_upload = {}
+
+        def drain_one():
+            year, race_name, session_type, load_future = in_flight.popleft()
+            try:
+                frames, stages = load_future.result()
+                instrumentation.merge(stages)
+            except ValueError as e:
+                print(f"Session {session_type} does not exist for {race_name} {year} : {e}")
+                self.record_missing_session(year, race_name, session_type, e)
+                summary.record(year, race_name, session_type, 'missing')
+                return
+            except Exception as e:
+                print(f"Failed to load {race_name} {year} {session_type}: {e}")
+                summary.record(year, race_name, session_type, 'failed', e)
+                return
+
+            event_key = (year, race_name)
+            previous_upload[event_key] = upload_pool.submit(
+                self.upload_session_frames, year, race_name, session_type, frames, summary,
+                previous_upload.get(event_key)
+            )
+
+        initializer, initargs = LoggingSetup.worker_initializer()
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=initargs) as load_pool, \
+                ThreadPoolExecutor(max_workers=upload_workers) as upload_pool:
+            for year, race_name, session_types in events:
+                for session_type in session_types:
+                    if self.session_already_loaded(year, race_name, session_type):
+                        summary.record(year, race_name, session_type, 'skipped')
+                        continue
+                    # fetch, load and extract are timed in the worker and merged in drain_one
+                    load_future = load_pool.submit(instrumentation.worker_call, instrumentation.default.output,
+                                                   load_session_frames, year, race_name, session_type,
+                                                   self.selective_load, self.cache_remote, self.telemetry)
+                    in_flight.append((year, race_name, session_type, load_future))
+                    if len(in_flight) >= max_workers * 2:
+                        drain_one()
 
-        events = response['Items']
+            while in_flight:
+                drain_one()
 
-        if not events:
+        return summary
+
+    def fetch_and_load_latest_race(self) -> str:
+        store = EventScheduleStore(events_table, get_resource('dynamodb'))
+        latest_event = store.next_pending()
+
+        if latest_event is None:
             return ""
 
-        # Find the latest race event
-        latest_event = min(events, key=lambda x: x['EventDate'])
-        session_types = ['FP1', 'FP2', 'FP3', 'Q', 'R']
-        self.fetch_and_upload_race(datetime.datetime.now().year, latest_event['EventName'], session_types)
+        year = event_year(latest_event)
+        event_format = init_fastf1().get_event(year, latest_event['EventName'])['EventFormat']
+        self.fetch_and_upload_race(year, latest_event['EventName'], event_session_types(event_format))
+        self.flush_indexes()
         return latest_event['EventName']
 
     def mark_latest_events_as_processed(self, event_name):
-        table = dynamodb_resource.Table(events_table)
+        store = EventScheduleStore(events_table, get_resource('dynamodb'))
+
+        event = store.next_pending()
+        if event is not None and event['EventName'] == event_name:
+            store.mark_processed(event)
+
+
+def init_fastf1():
+    """Imports fastf1 and enables its cache dir on first use. Returns the fastf1 module."""
+    global _fastf1_cache_enabled
+    import fastf1
+    if not _fastf1_cache_enabled:
+        # Ensure the cache directory exists before doing anything with FastF1
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        fastf1.Cache.enable_cache(cache_dir)
+        _fastf1_cache_enabled = True
+    return fastf1
+
+
+_session_caches = {}
 
-        response = table.scan(
-            FilterExpression=Attr('EventName').eq(event_name) & Attr('Processed').eq(False)
+
+def session_cache(cache_remote):
+    """Per-process TieredSessionCache in front of the shared S3 cache at (bucket, prefix)."""
+    if cache_remote not in _session_caches:
+        bucket, cache_prefix = cache_remote
+        _session_caches[cache_remote] = TieredSessionCache(
+            cache_dir, S3CacheStore(get_client('s3'), bucket, cache_prefix)
         )
-        if response['Items']:
-            event = response['Items'][0]
-            dynamodb_client.update_item(
-                TableName='F1EventsSchedule',
-                Key={
-                    'EventName': {'S': event['EventName']},
-                    'EventDate': {'S': event['EventDate']}
-                },
-                UpdateExpression='SET #P = :val1',
-                ExpressionAttributeNames={
-                    '#P': 'Processed'  # Escape reserved keyword
-                },
-                ExpressionAttributeValues={
-                    ':val1': {'BOOL': True}
-                },
-            )
+    return _session_caches[cache_remote]
+
+
+def load_session_frames(year, race_name, session_type, selective=True, cache_remote=None, telemetry=False):
+    """
+    Loads one fastf1 session and returns the frames to upload, keyed by artifact name.
+    With cache_remote, the session's fastf1 cache files are pulled from the shared S3 tier
+    before the load and any newly fetched ones pushed back after it.
+    """
+    artifacts = session_artifacts(session_type, telemetry)
+    flags = load_flags(artifacts) if selective else {}
+    cache = session_cache(cache_remote) if cache_remote else None
+
+    start = time.perf_counter()
+    cache_source = 'local only'
+    with span('fetch'):
+        f1_session = init_fastf1().get_session(year, race_name, session_type)
+        if cache is not None:
+            try:
+                cache_source = cache.hydrate(f1_session)
+            except Exception as e:
+                print(f"Could not read the shared fastf1 cache: {e}")
+                cache_source = 'error'
+    with span('load'):
+        f1_session.load(**flags)
+    if cache is not None:
+        with span('fetch'):
+            try:
+                cache.write_back(f1_session)
+            except Exception as e:
+                print(f"Could not update the shared fastf1 cache: {e}")
+    print(f"Loaded {race_name} {year} {session_type} in {time.perf_counter() - start:.1f}s "
+          f"(flags: {flags or 'full load'}, cache: {cache_source}), peak RSS {peak_rss_mb():.0f} MB")
+    if cache is not None:
+        print(f"fastf1 cache tier: {cache.metrics()}")
+
+    with span('extract') as extract:
+        frames = extract_session_frames(f1_session, session_type, artifacts, telemetry)
+        extract.add(rows=sum(len(frame) for frame in frames.values() if not isinstance(frame, dict)))
+    return frames
+
+
+def extract_session_frames(f1_session, session_type, artifacts, telemetry=False):
+    """Frames of a loaded session to upload, keyed by artifact name."""
+    from fastf1.core import DataNotLoadedError
+
+    frames = {}
+    if 'drivers_info' in artifacts:
+        frames['drivers_info'] = extract_drivers_info(f1_session)
+
+    try:
+        frames['laps'] = f1_session.laps
+    except DataNotLoadedError as e:
+        print(f"Laps data not loaded: {e}")
+    else:
+        from load.lap_analytics import build_lap_analytics
+        try:
+            frames.update(build_lap_analytics(frames['laps'], session_type, f1_session.results))
+        except Exception as e:
+            print(f"Lap analytics could not be built: {e}")
+
+    try:
+        frames['weather'] = f1_session.weather_data
+    except DataNotLoadedError as e:
+        print(f"Weather data not loaded: {e}")
+
+    if telemetry:
+        from load.telemetry import build_telemetry_frames
+        try:
+            frames.update(build_telemetry_frames(f1_session))
+        except DataNotLoadedError as e:
+            print(f"Telemetry data not loaded: {e}")
+
+    return plain_frames(frames)
+
+
+def plain_frames(frames):
+    """
+    The frames as plain DataFrames. fastf1's Laps and Telemetry pickle their whole Session
+    (car and position data included) along with them, which would all be sent back through
+    the backfill process pool.
+    """
+    import pandas as pd
+
+    plain = {}
+    for artifact, frame in frames.items():
+        if isinstance(frame, dict):
+            plain[artifact] = plain_frames(frame)
+        elif isinstance(frame, pd.DataFrame) and type(frame) is not pd.DataFrame:
+            plain[artifact] = pd.DataFrame(frame)
+        else:
+            plain[artifact] = frame
+    return plain
+
+
+def extract_drivers_info(f1_session):
+    """
+    Driver info and classification for every driver of the session in one frame.
+
+    Slices session.results in bulk instead of building one frame per driver. Timedeltas
+    are kept at microsecond resolution, which is what the per-driver frames used to
+    write, so the parquet schema seen by drivers_info_staging does not change.
+    """
+    import pandas as pd
+
+    driver_df = pd.DataFrame(f1_session.results).reindex(columns=DRIVERS_INFO_COLUMNS).reset_index(drop=True)
+    timedelta_columns = driver_df.select_dtypes('timedelta').columns
+    driver_df[timedelta_columns] = driver_df[timedelta_columns].astype('timedelta64[us]')
+    return driver_df
+
+
+class BackfillSummary:
+    """Thread-safe tally of per-session outcomes for a load run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.outcomes = []
+        self.unchanged_keys = []
+
+    def record(self, year, race_name, session_type, status, error=None):
+        with self._lock:
+            self.outcomes.append((year, race_name, session_type, status, error))
+
+    def record_unchanged(self, key):
+        with self._lock:
+            self.unchanged_keys.append(key)
+
+    def merge(self, other):
+        with self._lock:
+            self.outcomes.extend(other.outcomes)
+            self.unchanged_keys.extend(other.unchanged_keys)
+
+    def count(self, status):
+        return sum(1 for outcome in self.outcomes if outcome[3] == status)
 
+    def report(self):
+        print(f"Load finished: {self.count('uploaded')} sessions uploaded, "
+              f"{self.count('failed')} failed, {self.count('missing')} not available, "
+              f"{self.count('skipped')} skipped (already loaded).")
+        if self.unchanged_keys:
+            print(f"{len(self.unchanged_keys)} uploads skipped because the content was unchanged:")
+            for key in self.unchanged_keys:
+                print(f"  {key}")
+        for year, race_name, session_type, status, error in self.outcomes:
+            if status == 'failed':
+                print(f"  FAILED {year} {race_name} {session_type}: {error}")
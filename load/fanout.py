@@ -0,0 +1,224 @@
+import json
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import instrumentation
+from logging_setup import LoggingSetup
+
+# SendMessageBatch takes at most 10 messages
+SQS_BATCH_SIZE = 10
+
+
+def work_item(event, year, session_type):
+    """One unit of fan-out work: a single session of a schedule event."""
+    return {
+        'EventDate': event['EventDate'],
+        'EventName': event['EventName'],
+        'Year': int(year),
+        'SessionType': session_type,
+    }
+
+
+def item_event(item):
+    """Schedule key of the event a work item belongs to."""
+    return {'EventDate': item['EventDate'], 'EventName': item['EventName']}
+
+
+class LocalQueue:
+    """In-process work queue, the local stand-in for SqsQueue."""
+
+    def __init__(self):
+        self.items = queue.Queue()
+
+    def send(self, items):
+        for item in items:
+            self.items.put(item)
+
+    def drain(self):
+        """Removes and returns everything queued so far."""
+        items = []
+        while True:
+            try:
+                items.append(self.items.get_nowait())
+            except queue.Empty:
+                return items
+
+
+class SqsQueue:
+    """Sends work items as JSON messages to an SQS queue that triggers the session worker Lambda."""
+
+    def __init__(self, sqs_client, queue_url):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+
+    def send(self, items):
+        for start in range(0, len(items), SQS_BATCH_SIZE):
+            batch = items[start:start + SQS_BATCH_SIZE]
+            response = self.sqs_client.send_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[{'Id': str(index), 'MessageBody': json.dumps(item)} for index, item in enumerate(batch)]
+            )
+            if response.get('Failed'):
+                raise RuntimeError(f"Could not enqueue {len(response['Failed'])} work items: {response['Failed']}")
+
+
+class InMemoryBarrier:
+    """
+    Completion barrier kept in memory, for local fan-out runs. When `store` (an
+    EventScheduleStore) is given the event is marked processed once all its sessions completed.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._lock = threading.Lock()
+        self.expected = {}
+        self.completed = {}
+
+    @staticmethod
+    def _key(event):
+        return event['EventDate'], event['EventName']
+
+    def start(self, event, session_types):
+        with self._lock:
+            key = self._key(event)
+            self.expected[key] = set(session_types)
+            completed = self.completed.setdefault(key, set())
+            return [session_type for session_type in session_types if session_type not in completed]
+
+    def complete(self, event, session_type):
+        """Records a completed session. Returns True if this call completed the event."""
+        with self._lock:
+            key = self._key(event)
+            completed = self.completed.setdefault(key, set())
+            already_done = self.expected.get(key, set()) <= completed
+            completed.add(session_type)
+            if already_done or not self.expected.get(key, set()) <= completed:
+                return False
+        if self.store is not None:
+            return self.store.mark_processed(event)
+        return True
+
+
+class DynamoDBBarrier:
+    """
+    Completion barrier on the F1EventsSchedule item of the event: workers atomically add their
+    session to CompletedSessions, and whoever completes the set marks the event processed. The
+    conditional update in mark_processed lets only one of several racing workers win.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def start(self, event, session_types):
+        return self.store.start_sessions(event, session_types)
+
+    def complete(self, event, session_type):
+        if not self.store.complete_session(event, session_type):
+            return False
+        return self.store.mark_processed(event)
+
+
+def enqueue_event(event, year, session_types, work_queue, barrier):
+    """Registers the event's sessions with the barrier and queues the ones still to do. Returns the items."""
+    remaining = barrier.start(event, session_types)
+    items = [work_item(event, year, session_type) for session_type in remaining]
+    work_queue.send(items)
+    return items
+
+
+def process_work_item(data_ingestion, item, flush_indexes=True):
+    """
+    Loads and uploads the single session of a work item. Returns True if it succeeded,
+    which includes sessions that do not exist for the event. With flush_indexes=False only the
+    uploads are waited for; the caller flushes the partition index and schemas once for all
+    the sessions sharing them.
+    """
+    summary = data_ingestion.fetch_and_upload_race(item['Year'], item['EventName'], [item['SessionType']])
+    if flush_indexes:
+        data_ingestion.flush_indexes()
+    else:
+        data_ingestion.flush_uploads()
+    return summary.count('failed') == 0
+
+
+def run_session(bucket, prefix, item, ingestion_options=None, manifest_path=None):
+    """
+    Process pool entry point: processes one work item with its own DataIngestion (and its own
+    connection to the manifest at `manifest_path`). Returns whether it succeeded, and the
+    schemas and partitions it observed for the parent to flush.
+    """
+    from load.data_loader import DataIngestion
+    from load.manifest import BackfillManifest
+
+    manifest = BackfillManifest(manifest_path) if manifest_path else None
+    data_ingestion = DataIngestion(bucket, prefix, manifest=manifest, **(ingestion_options or {}))
+    try:
+        succeeded = process_work_item(data_ingestion, item, flush_indexes=False)
+    finally:
+        data_ingestion.close()
+        if manifest is not None:
+            manifest.close()
+    partition_index = data_ingestion.partition_index
+    return succeeded, data_ingestion.schema_registry.pending, {} if partition_index is None else partition_index.pending
+
+
+def run_local_fanout(data_ingestion, events, max_workers=4, use_processes=False, store=None,
+                     ingestion_options=None):
+    """
+    Runs the fan-out flow in one process: every session of the (event, year, session_types)
+    events goes through a LocalQueue and is processed on a thread or process pool, and the
+    barrier completes each event once all of its sessions succeeded. Sessions run independently,
+    so a slow FP1 does not hold up the race. Returns the events that completed.
+
+    Threads share `data_ingestion`; worker processes build their own from `ingestion_options`
+    and its manifest path. Either way the partition index and schemas are flushed once, by
+    `data_ingestion`, after the pool drained, since concurrent flushes would overwrite each other.
+    """
+    work_queue = LocalQueue()
+    barrier = InMemoryBarrier(store)
+    for event, year, session_types in events:
+        enqueue_event(event, year, session_types, work_queue, barrier)
+
+    completed_events = []
+    if use_processes:
+        initializer, initargs = LoggingSetup.worker_initializer()
+        pool = ProcessPoolExecutor(max_workers=max_workers, initializer=initializer, initargs=initargs)
+    else:
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+    manifest = data_ingestion.manifest
+    with pool:
+        if use_processes:
+            futures = {
+                pool.submit(instrumentation.worker_call, instrumentation.default.output, run_session,
+                            data_ingestion.bucket, data_ingestion.prefix, item, ingestion_options,
+                            None if manifest is None else manifest.path): item
+                for item in work_queue.drain()
+            }
+        else:
+            futures = {
+                pool.submit(process_work_item, data_ingestion, item, False): item
+                for item in work_queue.drain()
+            }
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                succeeded = future.result()
+                if use_processes:
+                    (succeeded, schemas, partitions), stages = succeeded
+                    instrumentation.merge(stages)
+                    data_ingestion.schema_registry.merge(schemas)
+                    if data_ingestion.partition_index is not None:
+                        data_ingestion.partition_index.merge(partitions)
+            except Exception as e:
+                print(f"Session {item['SessionType']} of {item['EventName']} failed: {e}")
+                continue
+            if not succeeded:
+                print(f"Session {item['SessionType']} of {item['EventName']} failed, event left pending.")
+                continue
+            if barrier.complete(item_event(item), item['SessionType']):
+                print(f"All sessions of {item['EventName']} {item['Year']} completed.")
+                completed_events.append(item_event(item))
+
+    data_ingestion.flush_indexes()
+    return completed_events
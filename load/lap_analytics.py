@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+
+from load.artifacts import RACE_SESSIONS
+
+SECTOR_TIME_COLUMNS = ['Sector1Time', 'Sector2Time', 'Sector3Time']
+
+
+def lap_positions(laps, grid=None):
+    """
+    Position per driver and lap with the places gained on that lap (positive = gained).
+    Lap 1 is compared with the grid position when `grid` (Driver -> GridPosition) is given.
+    """
+    positions = laps[['Driver', 'Team', 'LapNumber', 'Position']].dropna(subset=['LapNumber'])
+    positions = positions.sort_values(['Driver', 'LapNumber']).reset_index(drop=True)
+    previous = positions.groupby('Driver')['Position'].shift()
+    if grid is not None:
+        first_lap = previous.isna() & (positions['LapNumber'] == 1)
+        previous = previous.mask(first_lap, positions['Driver'].map(grid))
+    return positions.assign(PositionsGained=previous - positions['Position'])
+
+
+def representative_laps(laps):
+    """Timed laps on a green track that are not in or out laps, as used for pace figures."""
+    mask = laps['LapTime'].notna() & laps['PitInTime'].isna() & laps['PitOutTime'].isna()
+    if 'IsAccurate' in laps.columns:
+        mask &= laps['IsAccurate'].fillna(False).astype(bool)
+    if 'TrackStatus' in laps.columns:
+        mask &= laps['TrackStatus'].astype(str).eq('1')
+    return laps[mask]
+
+
+def degradation_slopes(laps, keys):
+    """
+    Least-squares slope of lap time (ms) against tyre life per group of `keys`, from the
+    grouped sums n, Sx, Sy, Sxy and Sxx so every stint is fitted in one pass. Groups with
+    fewer than two distinct tyre ages get NaN.
+    """
+    x = laps['TyreLife'].astype('float64')
+    y = laps['LapTime'].dt.total_seconds() * 1000
+    sums = pd.DataFrame({'x': x, 'y': y, 'xy': x * y, 'xx': x * x}).groupby([laps[key] for key in keys]).agg(
+        ['sum', 'count'])
+    n = sums[('x', 'count')]
+    denominator = n * sums[('xx', 'sum')] - sums[('x', 'sum')] ** 2
+    slope = (n * sums[('xy', 'sum')] - sums[('x', 'sum')] * sums[('y', 'sum')]) / denominator.replace(0, np.nan)
+    return slope.rename('DegradationMsPerLap')
+
+
+def stint_summaries(laps):
+    """One row per driver and stint: compound, tyre life, lap range, pace and degradation slope."""
+    stints = laps.dropna(subset=['Stint'])
+    summary = stints.groupby(['Driver', 'Stint']).agg(
+        Team=('Team', 'first'),
+        Compound=('Compound', 'first'),
+        FreshTyre=('FreshTyre', 'first'),
+        StartLap=('LapNumber', 'min'),
+        EndLap=('LapNumber', 'max'),
+        Laps=('LapNumber', 'count'),
+        TyreLifeStart=('TyreLife', 'min'),
+        TyreLifeEnd=('TyreLife', 'max'),
+    )
+
+    representative = representative_laps(stints)
+    pace = representative.groupby(['Driver', 'Stint'])['LapTime'].agg(MeanLapTime='mean', BestLapTime='min')
+    slopes = degradation_slopes(representative.dropna(subset=['TyreLife']), ['Driver', 'Stint'])
+    return summary.join(pace).join(slopes).reset_index()
+
+
+def sector_bests(laps):
+    """
+    Sector-best matrix: each driver's best time per sector, their theoretical best lap and
+    the gap of each sector to the session best.
+    """
+    grouped = laps.groupby('Driver')
+    bests = grouped[SECTOR_TIME_COLUMNS].min()
+    bests.columns = ['BestSector1', 'BestSector2', 'BestSector3']
+    bests['TheoreticalBest'] = bests.sum(axis=1, min_count=3)
+    bests['BestLapTime'] = grouped['LapTime'].min()
+    for sector in range(1, 4):
+        column = f'BestSector{sector}'
+        bests[f'Sector{sector}GapToBest'] = bests[column] - bests[column].min()
+    bests.insert(0, 'Team', grouped['Team'].first())
+    return bests.reset_index()
+
+
+def gap_to_leader(laps):
+    """
+    Gap to the leader and to the car ahead at the end of every lap, from the session time at
+    which each driver completed it.
+    """
+    timing = laps[['Driver', 'Team', 'LapNumber', 'Position', 'Time']].dropna(subset=['LapNumber', 'Time'])
+    timing = timing.sort_values(['LapNumber', 'Time']).reset_index(drop=True)
+    by_lap = timing.groupby('LapNumber')['Time']
+    return timing.assign(
+        GapToLeader=timing['Time'] - by_lap.transform('min'),
+        Interval=by_lap.diff(),
+    ).drop(columns=['Time'])
+
+
+def build_lap_analytics(laps, session_type, results=None):
+    """
+    Derived tables of a session's laps, keyed by artifact name. Position deltas and gaps to
+    the leader are only built for sprint and race sessions.
+    """
+    if laps is None or laps.empty:
+        return {}
+    laps = pd.DataFrame(laps)
+    frames = {
+        'stints': stint_summaries(laps),
+        'sector_bests': sector_bests(laps),
+    }
+    if session_type in RACE_SESSIONS:
+        grid = None
+        if results is not None and len(results):
+            grid = results.set_index('Abbreviation')['GridPosition']
+            # Pit lane starters have grid position 0
+            grid = grid.where(grid > 0)
+        frames['lap_positions'] = lap_positions(laps, grid)
+        frames['gap_to_leader'] = gap_to_leader(laps)
+    return frames
@@ -0,0 +1,179 @@
+import json
+import threading
+
+from botocore.exceptions import ClientError
+
+FLAT = 'flat'
+HIVE = 'hive'
+
+PARTITION_KEYS = ('year', 'event', 'session')
+
+# Column whose min/max is recorded per partition in the _index manifest
+TIMESTAMP_COLUMNS = {
+    'laps': 'LapStartDate',
+    'telemetry': 'Date',
+}
+
+
+def event_slug(race_name):
+    return race_name.replace(' ', '-').lower()
+
+
+def artifact_key(prefix, year, race_name, session_type, artifact, layout=FLAT, part=0, driver=None):
+    """
+    S3 key of an artifact.
+
+    flat: {prefix}/{year}/{event}/{session}_{artifact}.parquet
+    hive: {prefix}/dataset={artifact}/year={year}/event={event}/session={session}/part-{part}.parquet
+
+    Artifacts split per driver (full-rate telemetry) get one file per driver:
+    flat: {prefix}/{year}/{event}/{session}_{artifact}/{driver}.parquet
+    hive: .../session={session}/driver={driver}/part-{part}.parquet
+    """
+    if driver is not None:
+        path = driver_files_prefix(prefix, year, race_name, session_type, artifact, layout)
+        if layout == HIVE:
+            return f"{path}driver={driver}/part-{part}.parquet"
+        return f"{path}{driver}.parquet"
+    if layout == HIVE:
+        return (f"{partition_prefix(prefix, artifact, year, event_slug(race_name), session_type.lower())}"
+                f"part-{part}.parquet")
+    return f"{prefix}/{year}/{event_slug(race_name)}/{session_type.lower()}_{artifact}.parquet"
+
+
+def driver_files_prefix(prefix, year, race_name, session_type, artifact, layout=FLAT):
+    """Key prefix shared by the per-driver files of an artifact."""
+    if layout == HIVE:
+        return partition_prefix(prefix, artifact, year, event_slug(race_name), session_type.lower())
+    return f"{prefix}/{year}/{event_slug(race_name)}/{session_type.lower()}_{artifact}/"
+
+
+def delta_key(prefix, year, race_name, session_type, artifact, sequence, layout=FLAT):
+    """
+    S3 key of an append-only delta written by live ingestion (load/live.py).
+
+    flat: {prefix}/{year}/{event}/{session}_delta_{sequence:04d}_{artifact}.parquet
+    hive: .../session={session}/delta-{sequence:04d}.parquet
+    """
+    if layout == HIVE:
+        return (f"{partition_prefix(prefix, artifact, year, event_slug(race_name), session_type.lower())}"
+                f"delta-{sequence:04d}.parquet")
+    return f"{prefix}/{year}/{event_slug(race_name)}/{session_type.lower()}_delta_{sequence:04d}_{artifact}.parquet"
+
+
+def partition_prefix(prefix, dataset, year=None, event=None, session=None):
+    """
+    Longest key prefix that selects the given partitions. Stops at the first partition key left
+    open, so dataset=laps/year=2024/ selects every event and session of 2024.
+    """
+    path = f"{prefix}/dataset={dataset}/"
+    for name, value in zip(PARTITION_KEYS, (year, event, session)):
+        if value is None:
+            break
+        path += f"{name}={value}/"
+    return path
+
+
+def parse_key(key):
+    """
+    Recovers dataset, year, event and session from a key in either layout. Keys of per-driver
+    files also carry the driver, and keys of live deltas their sequence number.
+    """
+    parts = key.split('/')
+    hive_parts = dict(part.split('=', 1) for part in parts[:-1] if '=' in part)
+    if 'dataset' in hive_parts:
+        partition = {name: hive_parts.get(name) for name in ('dataset',) + PARTITION_KEYS}
+        if 'driver' in hive_parts:
+            partition['driver'] = hive_parts['driver']
+        if parts[-1].startswith('delta-'):
+            partition['delta'] = int(parts[-1][len('delta-'):-len('.parquet')])
+        return partition
+
+    name = parts[-1][:-len('.parquet')]
+    # Event slugs never contain '_', so a directory that does is a per-driver artifact
+    if '_' in parts[-2]:
+        session, _, dataset = parts[-2].partition('_')
+        return {'dataset': dataset, 'year': parts[-4], 'event': parts[-3], 'session': session, 'driver': name}
+    session, _, dataset = name.partition('_')
+    partition = {'dataset': dataset, 'year': parts[-3], 'event': parts[-2], 'session': session}
+    if dataset.startswith('delta_'):
+        _, sequence, partition['dataset'] = dataset.split('_', 2)
+        partition['delta'] = int(sequence)
+    return partition
+
+
+def index_key(prefix, dataset):
+    return f"{prefix}/dataset={dataset}/_index.json"
+
+
+class PartitionIndex:
+    """
+    Collects per-partition stats while writing the hive layout and merges them into one
+    `_index.json` manifest per dataset, so readers can pick partitions without listing the bucket.
+    """
+
+    def __init__(self, s3_client, bucket, prefix):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.pending = {}
+
+    def add(self, dataset, year, event, session, key, df, driver=None):
+        entry = {
+            'year': str(year),
+            'event': event,
+            'session': session,
+            'key': key,
+            'rows': len(df),
+            'min_timestamp': None,
+            'max_timestamp': None,
+        }
+        if driver is not None:
+            entry['driver'] = driver
+        column = TIMESTAMP_COLUMNS.get(dataset)
+        if column in df.columns and df[column].notna().any():
+            entry['min_timestamp'] = df[column].min().isoformat()
+            entry['max_timestamp'] = df[column].max().isoformat()
+        with self._lock:
+            self.pending.setdefault(dataset, {})[key] = entry
+
+    def read(self, dataset):
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket, Key=index_key(self.prefix, dataset))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                return {'dataset': dataset, 'partitions': []}
+            raise
+        return json.loads(obj['Body'].read())
+
+    def merge(self, pending):
+        """Adds the entries another process collected (its `pending`) to what the next flush() writes."""
+        with self._lock:
+            for dataset, entries in pending.items():
+                self.pending.setdefault(dataset, {}).update(entries)
+
+    def flush(self):
+        """Merges the collected entries into each dataset's _index.json."""
+        with self._lock:
+            pending, self.pending = self.pending, {}
+
+        for dataset, entries in pending.items():
+            index = self.read(dataset)
+            partitions = {partition['key']: partition for partition in index['partitions']}
+            partitions.update(entries)
+            index['partitions'] = sorted(partitions.values(), key=lambda p: (p['year'], p['event'], p['session']))
+            self.s3_client.put_object(
+                Bucket=self.bucket, Key=index_key(self.prefix, dataset),
+                Body=json.dumps(index, indent=1).encode('utf-8'), ContentType='application/json'
+            )
+            print(f"Updated partition index for {dataset} with {len(entries)} partitions.")
+
+
+def select_partitions(index, year=None, event=None, session=None):
+    """Keys of the partitions in an _index manifest that match the given filters."""
+    wanted = {'year': None if year is None else str(year), 'event': event, 'session': session}
+    return [
+        partition['key'] for partition in index['partitions']
+        if all(value is None or partition[name] == value for name, value in wanted.items())
+    ]
@@ -0,0 +1,304 @@
+import datetime
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+from botocore.exceptions import ClientError
+
+from load.layout import delta_key, event_slug
+
+# Artifacts streamed during a live session and the session-time column used as their watermark:
+# a lap is final once it has a lap end time, a weather row once it has been sampled
+LIVE_ARTIFACTS = {
+    'laps': 'Time',
+    'weather': 'Time',
+}
+
+# Artifacts watermarked per group on a sequence column instead of on session time: a driver's
+# lap can be timed after a later lap of another driver, so one time watermark would skip it
+LIVE_GROUPS = {
+    'laps': ('Driver', 'LapNumber'),
+}
+
+DEFAULT_POLL_INTERVAL = 60
+# How long after its scheduled start a session is polled
+SESSION_WINDOW = datetime.timedelta(hours=3)
+
+
+def session_key(year, race_name, session_type):
+    return f"{year}/{event_slug(race_name)}/{session_type.lower()}"
+
+
+def session_window(year, race_name, session_type):
+    """(start, end) in naive UTC of the period a session is polled in, from the fastf1 schedule."""
+    from load.data_loader import init_fastf1
+
+    event = init_fastf1().get_event(year, race_name)
+    start = event.get_session_date(session_type, utc=True).to_pydatetime()
+    return start, start + SESSION_WINDOW
+
+
+def empty_state():
+    return {'sequence': 0, 'watermarks': {}, 'pending': None}
+
+
+class WatermarkStore:
+    """
+    Live ingestion state per session, kept as one JSON object per session in S3 so that a
+    restarted poller or the next Lambda invocation carries on where the last one stopped.
+    """
+
+    def __init__(self, s3_client, bucket, prefix):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f"{self.prefix}/_live/{key}.json"
+
+    def get(self, key):
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                return empty_state()
+            raise
+        return json.loads(obj['Body'].read())
+
+    def set(self, key, state):
+        self.s3_client.put_object(Bucket=self.bucket, Key=self._key(key),
+                                  Body=json.dumps(state).encode('utf-8'), ContentType='application/json')
+
+
+class LocalWatermarkStore:
+    """WatermarkStore kept in a local JSON file, for local polling and replays."""
+
+    def __init__(self, path='live_watermarks.json'):
+        self.path = path
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as file:
+            return json.load(file)
+
+    def get(self, key):
+        return self._read().get(key, empty_state())
+
+    def set(self, key, state):
+        states = self._read()
+        states[key] = state
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(states, file)
+        os.replace(temp_path, self.path)
+
+
+class FastF1Feed:
+    """Polls fastf1 for the current laps and weather of a running session."""
+
+    def __init__(self, year, race_name, session_type):
+        self.year = year
+        self.race_name = race_name
+        self.session_type = session_type
+        self.finished = False
+
+    def poll(self):
+        from load.data_loader import init_fastf1
+
+        fastf1 = init_fastf1()
+        # The cached responses would be stale while the session is still running
+        with fastf1.Cache.disabled():
+            f1_session = fastf1.get_session(self.year, self.race_name, self.session_type)
+            f1_session.load(laps=True, weather=True, messages=True, telemetry=False)
+        return {'laps': f1_session.laps, 'weather': f1_session.weather_data}
+
+
+class ReplayFeed:
+    """
+    Stand-in for FastF1Feed that replays a recorded session: every poll moves a session clock
+    forward by `step` and returns the rows that were available at that time.
+    """
+
+    def __init__(self, frames, step=datetime.timedelta(minutes=1), start=None):
+        self.frames = {artifact: pd.DataFrame(df) for artifact, df in frames.items()}
+        self.step = pd.Timedelta(step)
+        ends = [df[LIVE_ARTIFACTS[artifact]].max() for artifact, df in self.frames.items() if len(df)]
+        self.end = max(ends) if ends else pd.Timedelta(0)
+        self.clock = pd.Timedelta(start) if start is not None else pd.Timedelta(0)
+        self.finished = False
+
+    @classmethod
+    def from_parquet(cls, paths, **kwargs):
+        """Replay of recorded artifacts, given as {artifact: parquet path} with timedelta columns."""
+        return cls({artifact: pd.read_parquet(path) for artifact, path in paths.items()}, **kwargs)
+
+    def poll(self):
+        self.clock += self.step
+        self.finished = self.clock >= self.end
+        return {
+            artifact: df[df[LIVE_ARTIFACTS[artifact]] <= self.clock]
+            for artifact, df in self.frames.items()
+        }
+
+
+def to_ns(value):
+    return int(pd.Timedelta(value).value)
+
+
+def rows_hash(rows):
+    """Hash of the content of a delta's rows, stable across processes."""
+    return hashlib.sha256(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def group_watermarks(df, group, order, time_column, watermark):
+    """Per-group watermarks equivalent to a time watermark, for state written before LIVE_GROUPS."""
+    seen = df[df[time_column] <= pd.Timedelta(watermark, unit='ns')]
+    return {str(name): int(value) for name, value in seen.groupby(group)[order].max().items()}
+
+
+class LiveIngestion:
+    """
+    Uploads what is new in a running session as small append-only delta files.
+
+    Each poll takes the rows past the stored watermark, up to the newest row seen: on session
+    time, or per group (driver) on a sequence column (lap number) for LIVE_GROUPS. The bounds
+    and a hash of the rows are saved as `pending` before the delta is uploaded, and the
+    watermark only moves once every artifact's upload finished, so after a restart the delta is
+    rebuilt from the same bounds under the same key. Unchanged rows are skipped by the dedup in
+    write_parquet; rows fastf1 revised in the meantime overwrite the delta in place, so no row
+    is ever delivered in two deltas.
+    """
+
+    def __init__(self, data_ingestion, feed, watermarks, year, race_name, session_type):
+        self.data_ingestion = data_ingestion
+        self.feed = feed
+        self.watermarks = watermarks
+        self.year = year
+        self.race_name = race_name
+        self.session_type = session_type
+        self.key = session_key(year, race_name, session_type)
+        self.last_sequence = None
+
+    def new_rows(self, artifact, df, lower, upper=None):
+        """
+        Rows of `df` with lower < watermark <= upper, in session time order. For LIVE_GROUPS the
+        bounds are {group: sequence} and a group missing from `lower` starts from scratch.
+        """
+        column = df[LIVE_ARTIFACTS[artifact]]
+        mask = column.notna()
+        if artifact in LIVE_GROUPS:
+            group, order = LIVE_GROUPS[artifact]
+            groups = df[group].astype(str)
+            mask &= df[order].notna()
+            if lower is not None:
+                mask &= df[order] > groups.map(lower).astype('float64').fillna(float('-inf'))
+            if upper is not None:
+                mask &= df[order] <= groups.map(upper).astype('float64').fillna(float('-inf'))
+        else:
+            if lower is not None:
+                mask &= column > pd.Timedelta(lower, unit='ns')
+            if upper is not None:
+                mask &= column <= pd.Timedelta(upper, unit='ns')
+        return df[mask].sort_values(LIVE_ARTIFACTS[artifact], kind='stable')
+
+    def upper_bound(self, artifact, rows):
+        """Watermark covering `rows`: the newest session time, or per group the highest sequence."""
+        if artifact in LIVE_GROUPS:
+            group, order = LIVE_GROUPS[artifact]
+            return {str(name): int(value) for name, value in rows.groupby(group)[order].max().items()}
+        return to_ns(rows[LIVE_ARTIFACTS[artifact]].max())
+
+    def lower_bound(self, artifact, df, watermark):
+        if artifact in LIVE_GROUPS and watermark is not None and not isinstance(watermark, dict):
+            group, order = LIVE_GROUPS[artifact]
+            return group_watermarks(df, group, order, LIVE_ARTIFACTS[artifact], watermark)
+        return watermark
+
+    def poll_once(self):
+        """Polls the feed once and uploads one delta per artifact with new rows. Returns the row counts."""
+        state = self.watermarks.get(self.key)
+        frames = self.feed.poll()
+
+        pending = state['pending']
+        if pending is None:
+            bounds = {}
+            for artifact in LIVE_ARTIFACTS:
+                df = frames.get(artifact)
+                if df is None or df.empty:
+                    continue
+                lower = self.lower_bound(artifact, df, state['watermarks'].get(artifact))
+                rows = self.new_rows(artifact, df, lower)
+                if len(rows):
+                    upper = self.upper_bound(artifact, rows)
+                    if isinstance(lower, dict):
+                        # Groups without new rows keep their watermark
+                        upper = {**lower, **upper}
+                    bounds[artifact] = [lower, upper]
+            if not bounds:
+                return {}
+            pending = {'sequence': state['sequence'] + 1, 'bounds': bounds}
+
+        deltas = {
+            artifact: self.new_rows(artifact, frames[artifact], lower, upper)
+            for artifact, (lower, upper) in pending['bounds'].items()
+        }
+        hashes = {artifact: rows_hash(rows) for artifact, rows in deltas.items()}
+        if pending.get('hashes') not in (None, hashes):
+            # Same bounds, so the same rows: rewriting the key replaces what was uploaded of it
+            print(f"Rows of live delta {pending['sequence']} were revised, rewriting it")
+        if pending.get('hashes') != hashes:
+            pending['hashes'] = hashes
+            state['pending'] = pending
+            self.watermarks.set(self.key, state)
+
+        uploaded = {}
+        for artifact, rows in deltas.items():
+            s3_path = delta_key(self.data_ingestion.prefix, self.year, self.race_name, self.session_type,
+                                artifact, pending['sequence'], self.data_ingestion.layout)
+            if self.data_ingestion.upload_parquet_to_s3(rows, s3_path, artifact) is None:
+                raise RuntimeError(f"Upload of {s3_path} failed, watermark left at delta {state['sequence']}")
+            uploaded[artifact] = len(rows)
+
+        state['sequence'] = self.last_sequence = pending['sequence']
+        for artifact, (_, upper) in pending['bounds'].items():
+            state['watermarks'][artifact] = upper
+        state['pending'] = None
+        self.watermarks.set(self.key, state)
+        return uploaded
+
+    def run(self, poll_interval=DEFAULT_POLL_INTERVAL, until=None, max_polls=None):
+        """
+        Polls until the feed reports the session finished, `until` (UTC datetime) has passed or
+        max_polls polls were made. Returns the number of rows uploaded per artifact. A failed
+        poll is retried on the next one; if the last poll failed, this raises.
+        """
+        totals = dict.fromkeys(LIVE_ARTIFACTS, 0)
+        polls = failures = 0
+        error = None
+        while True:
+            try:
+                uploaded = self.poll_once()
+                for artifact, rows in uploaded.items():
+                    totals[artifact] += rows
+                if uploaded:
+                    print(f"Live {self.race_name} {self.year} {self.session_type}: delta "
+                          f"{self.last_sequence} with {uploaded}")
+                error = None
+            except Exception as e:
+                print(f"Live poll failed, retrying on the next poll: {e}")
+                failures += 1
+                error = e
+            polls += 1
+
+            if self.feed.finished or (max_polls is not None and polls >= max_polls):
+                break
+            if until is not None and datetime.datetime.utcnow() >= until:
+                break
+            time.sleep(poll_interval)
+
+        if error is not None:
+            raise RuntimeError(f"{failures} of {polls} live polls failed, the last one with: {error}") from error
+        return totals
@@ -0,0 +1,95 @@
+import datetime
+import sqlite3
+import threading
+
+# Statuses after which an artifact never needs to be fetched again. An artifact missing from a
+# session's frames is 'unavailable' and fetched once more on resume, since a fastf1 endpoint may
+# just have failed that time; missing again, it is 'unavailable_confirmed'.
+TERMINAL_STATUSES = ('complete', 'unavailable_confirmed', 'missing')
+
+
+class BackfillManifest:
+    """
+    Checkpoint of a backfill run, stored in a local SQLite file.
+
+    Holds one record per (year, event, session_type, artifact) with its status, row count,
+    byte size and content hash, so a restarted run can skip everything already uploaded.
+    """
+
+    def __init__(self, path='backfill_manifest.sqlite'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    year          INTEGER NOT NULL,
+                    event         TEXT    NOT NULL,
+                    session_type  TEXT    NOT NULL,
+                    artifact      TEXT    NOT NULL,
+                    status        TEXT    NOT NULL,
+                    row_count     INTEGER,
+                    byte_size     INTEGER,
+                    content_hash  TEXT,
+                    s3_key        TEXT,
+                    error         TEXT,
+                    updated_at    TEXT    NOT NULL,
+                    PRIMARY KEY (year, event, session_type, artifact)
+                )
+            """)
+
+    def mark(self, year, event, session_type, artifact, status, row_count=None, byte_size=None,
+             content_hash=None, s3_key=None, error=None):
+        updated_at = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO artifacts
+                    (year, event, session_type, artifact, status, row_count, byte_size, content_hash,
+                     s3_key, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (year, event, session_type, artifact, status, row_count, byte_size, content_hash,
+                 s3_key, None if error is None else str(error), updated_at)
+            )
+
+    def status(self, year, event, session_type, artifact):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM artifacts WHERE year = ? AND event = ? AND session_type = ? AND artifact = ?",
+                (year, event, session_type, artifact)
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_done(self, year, event, session_type, artifact):
+        return self.status(year, event, session_type, artifact) in TERMINAL_STATUSES
+
+    def session_done(self, year, event, session_type, artifacts):
+        """True when every artifact of the session has reached a terminal status."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT artifact, status FROM artifacts WHERE year = ? AND event = ? AND session_type = ?",
+                (year, event, session_type)
+            ).fetchall()
+        statuses = dict(rows)
+        if statuses and all(status == 'missing' for status in statuses.values()):
+            return True
+        return all(statuses.get(artifact) in TERMINAL_STATUSES for artifact in artifacts)
+
+    def mark_unavailable(self, year, event, session_type, artifact):
+        """Marks an artifact missing from the session's frames, confirmed if it was missing before too."""
+        previous = self.status(year, event, session_type, artifact)
+        confirmed = previous in ('unavailable', 'unavailable_confirmed')
+        self.mark(year, event, session_type, artifact, 'unavailable_confirmed' if confirmed else 'unavailable')
+
+    def mark_session_missing(self, year, event, session_type, artifacts, error=None):
+        for artifact in artifacts:
+            self.mark(year, event, session_type, artifact, 'missing', error=error)
+
+    def counts(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM artifacts GROUP BY status").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
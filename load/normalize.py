@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+
+# min/max/mean columns of the telemetry rollups (load/telemetry.py)
+TELEMETRY_ROLLUP_COLUMNS = [f"{channel}_{stat}" for channel in ('Speed', 'Throttle', 'Brake', 'RPM')
+                            for stat in ('min', 'max', 'mean')]
+
+# Per-table encoding spec applied between fetch and upload. Columns missing from a frame are
+# ignored, and every timedelta column is stored as int64 milliseconds whether listed or not.
+# Integer columns get a fixed dtype, wide enough for any session, so every file of a dataset
+# has the same schema.
+TABLE_SPECS = {
+    'laps': {
+        'categorical': ['Driver', 'DriverNumber', 'Team', 'Compound', 'TrackStatus', 'DeletedReason'],
+        'integer': {'LapNumber': 'Int16', 'Stint': 'Int8', 'TyreLife': 'Int16', 'Position': 'Int8'},
+        'float32': ['SpeedI1', 'SpeedI2', 'SpeedFL', 'SpeedST'],
+        'boolean': ['IsPersonalBest', 'FreshTyre', 'Deleted', 'FastF1Generated', 'IsAccurate'],
+        'compression': 'zstd',
+        'row_group_size': 50_000,
+    },
+    'weather': {
+        'categorical': [],
+        'integer': {'WindDirection': 'Int16'},
+        'float32': ['AirTemp', 'Humidity', 'Pressure', 'TrackTemp', 'WindSpeed'],
+        'boolean': ['Rainfall'],
+        'compression': 'zstd',
+        'row_group_size': 50_000,
+    },
+    'drivers_info': {
+        'categorical': ['TeamName', 'TeamColor', 'TeamId', 'CountryCode', 'Status', 'ClassifiedPosition'],
+        'integer': {'Position': 'Int8', 'GridPosition': 'Int8'},
+        'float32': ['Points'],
+        'boolean': [],
+        'compression': 'zstd',
+        'row_group_size': 50_000,
+    },
+    'telemetry': {
+        'categorical': ['Source', 'Driver'],
+        'integer': {'RPM': 'Int16', 'nGear': 'Int8', 'Throttle': 'Int16', 'DRS': 'Int8', 'LapNumber': 'Int16'},
+        'float32': ['Speed', 'Distance', 'LapDistance'],
+        'boolean': ['Brake'],
+        'compression': 'zstd',
+        'row_group_size': 250_000,
+    },
+    'stints': {
+        'categorical': ['Driver', 'Team', 'Compound'],
+        'integer': {'Stint': 'Int8', 'StartLap': 'Int16', 'EndLap': 'Int16', 'Laps': 'Int16',
+                    'TyreLifeStart': 'Int16', 'TyreLifeEnd': 'Int16'},
+        'float32': ['DegradationMsPerLap'],
+        'boolean': ['FreshTyre'],
+        'compression': 'zstd',
+        'row_group_size': 50_000,
+    },
+    'sector_bests': {
+        'categorical': ['Driver', 'Team'],
+        'integer': {},
+        'float32': [],
+        'boolean': [],
+        'compression': 'zstd',
+        'row_group_size': 50_000,
+    },
+    'lap_positions': {
+        'categorical': ['Driver', 'Team'],
+        'integer': {'LapNumber': 'Int16', 'Position': 'Int8', 'PositionsGained': 'Int8'},
+        'float32': [],
+        'boolean': [],
+        'compression': 'zstd',
+        'row_group_size': 50_000,
+    },
+    'gap_to_leader': {
+        'categorical': ['Driver', 'Team'],
+        'integer': {'LapNumber': 'Int16', 'Position': 'Int8'},
+        'float32': [],
+        'boolean': [],
+        'compression': 'zstd',
+        'row_group_size': 50_000,
+    },
+    'telemetry_1s': {
+        'categorical': ['Driver'],
+        'integer': {'SessionTimeBucket': 'Int32', 'Samples': 'Int32'},
+        'float32': TELEMETRY_ROLLUP_COLUMNS,
+        'boolean': [],
+        'compression': 'zstd',
+        'row_group_size': 100_000,
+    },
+    'telemetry_100m': {
+        'categorical': ['Driver'],
+        'integer': {'LapNumber': 'Int16', 'LapDistanceBucket': 'Int32', 'Samples': 'Int32'},
+        'float32': TELEMETRY_ROLLUP_COLUMNS,
+        'boolean': [],
+        'compression': 'zstd',
+        'row_group_size': 100_000,
+    },
+    'telemetry_lap': {
+        'categorical': ['Driver'],
+        'integer': {'LapNumber': 'Int16', 'Samples': 'Int32'},
+        'float32': TELEMETRY_ROLLUP_COLUMNS,
+        'boolean': [],
+        'compression': 'zstd',
+        'row_group_size': 50_000,
+    },
+    'track_status': {
+        'categorical': ['Status', 'Message'],
+        'integer': {},
+        'float32': [],
+        'boolean': [],
+        'compression': 'zstd',
+        'row_group_size': 50_000,
+    },
+}
+
+DEFAULT_ENCODING = {'compression': 'snappy', 'row_group_size': 100_000}
+
+
+def timedelta_to_ms(series):
+    values = series.to_numpy(dtype='timedelta64[ns]')
+    missing = np.isnat(values)
+    milliseconds = np.round(values.view('int64') / 1e6).astype('int64')
+    milliseconds[missing] = 0
+    return pd.Series(pd.arrays.IntegerArray(milliseconds, missing), index=series.index, name=series.name)
+
+
+def millisecond_columns(df):
+    """Timedelta columns of `df`, which normalize_frame stores as int64 milliseconds."""
+    return [column for column in df.columns if pd.api.types.is_timedelta64_dtype(df[column])]
+
+
+def fixed_int(series, dtype):
+    """
+    Casts a whole-number column to the nullable integer `dtype`. Returns None if it holds
+    fractions; values out of the dtype's range fall back to Int64.
+    """
+    values = series.to_numpy(dtype='float64', na_value=np.nan)
+    missing = np.isnan(values)
+    present = values[~missing]
+    if not np.array_equal(present, np.floor(present)):
+        return None
+    info = np.iinfo(dtype.lower())
+    if present.size and (present.min() < info.min or present.max() > info.max):
+        print(f"{series.name} exceeds {dtype}, stored as Int64")
+        dtype = 'Int64'
+    data = np.where(missing, 0, values).astype(dtype.lower())
+    return pd.Series(pd.arrays.IntegerArray(data, missing), index=series.index, name=series.name)
+
+
+def normalize_frame(df, table):
+    """
+    Returns a compact copy of `df` following TABLE_SPECS[table]: timedeltas as int64 ms,
+    low-cardinality strings as categoricals, integers at their spec dtype, and downcast
+    float and boolean columns.
+    """
+    spec = TABLE_SPECS.get(table)
+    df = pd.DataFrame(df)
+    columns = {}
+
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_timedelta64_dtype(series):
+            columns[column] = timedelta_to_ms(series)
+        elif spec is None:
+            continue
+        elif column in spec['categorical']:
+            columns[column] = series.astype('category')
+        elif column in spec['integer'] and pd.api.types.is_numeric_dtype(series):
+            values = fixed_int(series, spec['integer'][column])
+            if values is not None:
+                columns[column] = values
+        elif column in spec['float32'] and pd.api.types.is_float_dtype(series):
+            columns[column] = series.astype('float32')
+        elif column in spec['boolean']:
+            columns[column] = series.astype('boolean')
+
+    return df.assign(**columns)
+
+
+def encode_options(table):
+    """Compression and row group size for write_parquet."""
+    spec = TABLE_SPECS.get(table)
+    if spec is None:
+        return dict(DEFAULT_ENCODING)
+    return {'compression': spec['compression'], 'row_group_size': spec['row_group_size']}
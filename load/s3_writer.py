@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
+
+from instrumentation import span
+
+# S3 rejects multipart parts smaller than 5 MB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_ROW_GROUP_SIZE = 100_000
+
+# User metadata key (x-amz-meta-content-sha256) holding the sha256 of the encoded parquet
+CONTENT_HASH_METADATA = 'content-sha256'
+
+UploadResult = namedtuple('UploadResult', ['key', 'rows', 'bytes', 'content_hash', 'skipped'], defaults=(False,))
+
+
+class MultipartSink:
+    """
+    Write-only file object that ships parquet bytes to S3 as they are produced.
+
+    Bytes are buffered until `part_size` is reached and then sent as one multipart part,
+    so memory stays bounded by the part size. If the whole object fits in a single part
+    it is sent with a plain put_object on finish() instead.
+    """
+
+    def __init__(self, s3_client, bucket, key, part_size=DEFAULT_PART_SIZE, metadata=None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.metadata = metadata or {}
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.closed = False
+
+    def write(self, data):
+        self.buffer += data
+        self.size += len(data)
+        self.sha256.update(data)
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        # The ParquetWriter closes its sink; the upload itself is completed by finish()
+        self.closed = True
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, Metadata=self.metadata
+            )['UploadId']
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=part_number, Body=bytes(self.buffer)
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self.buffer = bytearray()
+
+    def finish(self):
+        if self.upload_id is None:
+            self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer),
+                                      Metadata=self.metadata)
+        else:
+            if self.buffer:
+                self._upload_part()
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.parts}
+            )
+        self.buffer = bytearray()
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            self.upload_id = None
+
+
+class HashingFile:
+    """Write-only wrapper that tracks the size and sha256 of everything written to `file`."""
+
+    def __init__(self, file):
+        self.file = file
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.closed = False
+
+    def write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+        self.sha256.update(data)
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class HashIndex:
+    """
+    Local JSON index of the content hash last uploaded per S3 key.
+
+    Lets dedup skip the HEAD request entirely when the same machine keeps re-running a load.
+    """
+
+    def __init__(self, path='upload_hash_index.json'):
+        self.path = path
+        self._lock = threading.Lock()
+        self.hashes = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.hashes = json.load(file)
+
+    def get(self, bucket, key):
+        with self._lock:
+            return self.hashes.get(f"{bucket}/{key}")
+
+    def set(self, bucket, key, content_hash):
+        with self._lock:
+            self.hashes[f"{bucket}/{key}"] = content_hash
+
+    def save(self):
+        with self._lock:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w') as file:
+                json.dump(self.hashes, file)
+            os.replace(temp_path, self.path)
+
+
+def remote_content_hash(s3_client, bucket, key):
+    """Content hash stored on the existing object, or None if it does not exist or has none."""
+    try:
+        response = s3_client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    return response.get('Metadata', {}).get(CONTENT_HASH_METADATA)
+
+
+def iter_row_groups(data, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """Yields `data` (DataFrame or Arrow table) as Arrow tables of at most row_group_size rows."""
+    if isinstance(data, pa.Table):
+        if data.num_rows == 0:
+            yield data
+        for offset in range(0, data.num_rows, row_group_size):
+            yield data.slice(offset, row_group_size)
+        return
+
+    schema = pa.Schema.from_pandas(data, preserve_index=False)
+    if len(data) == 0:
+        yield pa.Table.from_pandas(data, schema=schema, preserve_index=False)
+    for offset in range(0, len(data), row_group_size):
+        yield pa.Table.from_pandas(data.iloc[offset:offset + row_group_size], schema=schema, preserve_index=False)
+
+
+def encode_parquet(data, sink, row_group_size=DEFAULT_ROW_GROUP_SIZE, compression='snappy'):
+    """Writes `data` as parquet into a file-like sink one row group at a time. Returns the row count."""
+    rows = 0
+    writer = None
+    for table in iter_row_groups(data, row_group_size):
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema, compression=compression)
+        writer.write_table(table, row_group_size=row_group_size)
+        rows += table.num_rows
+    writer.close()
+    return rows
+
+
+def upload_encoded(s3_client, bucket, key, file, content_hash, part_size=DEFAULT_PART_SIZE):
+    """Copies already encoded parquet from `file` to s3://bucket/key with its content hash as metadata."""
+    sink = MultipartSink(s3_client, bucket, key, part_size, metadata={CONTENT_HASH_METADATA: content_hash})
+    try:
+        shutil.copyfileobj(file, sink, sink.part_size)
+        sink.finish()
+    except Exception:
+        sink.abort()
+        raise
+
+
+def write_parquet(s3_client, bucket, key, data, part_size=DEFAULT_PART_SIZE,
+                  row_group_size=DEFAULT_ROW_GROUP_SIZE, compression='snappy', dedup=False, hash_index=None):
+    """
+    Encodes `data` to parquet one row group at a time and streams it to s3://bucket/key.
+
+    Returns an UploadResult with the row count, encoded size and sha256 of the object.
+    A failed write aborts the multipart upload so no partial object is left behind.
+    With dedup=True the upload is skipped (skipped=True) when the existing object already
+    holds the same bytes, see write_parquet_deduplicated.
+    """
+    if dedup:
+        return write_parquet_deduplicated(s3_client, bucket, key, data, part_size, row_group_size,
+                                          compression, hash_index)
+
+    # Encoding and upload are interleaved here, so both count as upload time
+    with span('upload') as upload:
+        sink = MultipartSink(s3_client, bucket, key, part_size)
+        try:
+            rows = encode_parquet(data, sink, row_group_size, compression)
+            sink.finish()
+        except Exception:
+            sink.abort()
+            raise
+        upload.add(rows=rows, bytes=sink.size)
+    return UploadResult(key, rows, sink.size, sink.sha256.hexdigest())
+
+
+def write_parquet_deduplicated(s3_client, bucket, key, data, part_size=DEFAULT_PART_SIZE,
+                               row_group_size=DEFAULT_ROW_GROUP_SIZE, compression='snappy', hash_index=None):
+    """
+    Encodes `data` into a spooled temp file (in memory up to part_size, on disk beyond) to
+    learn its sha256 before writing, then compares it with the hash of the existing object,
+    from `hash_index` if given or a HEAD request otherwise. Identical objects are not
+    re-written, so unchanged artifacts do not re-trigger Snowpipe. New content is uploaded
+    with the hash stored as object metadata.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=part_size) as spool:
+        with span('encode') as encode:
+            encoded = HashingFile(spool)
+            rows = encode_parquet(data, encoded, row_group_size, compression)
+            content_hash = encoded.sha256.hexdigest()
+            encode.add(rows=rows, bytes=encoded.size)
+
+        with span('upload') as upload:
+            if hash_index is not None:
+                existing_hash = hash_index.get(bucket, key)
+            else:
+                existing_hash = remote_content_hash(s3_client, bucket, key)
+            if existing_hash == content_hash:
+                upload.add(skipped=1)
+                return UploadResult(key, rows, encoded.size, content_hash, skipped=True)
+
+            spool.seek(0)
+            upload_encoded(s3_client, bucket, key, spool, content_hash, part_size)
+            upload.add(rows=rows, bytes=encoded.size)
+
+    if hash_index is not None:
+        hash_index.set(bucket, key, content_hash)
+    return UploadResult(key, rows, encoded.size, content_hash)
@@ -0,0 +1,114 @@
+import datetime
+import threading
+import time
+
+# numpy (and fastf1, pandas) are imported where they are used, so the scheduler Lambda, which
+# imports this module but never looks up a schedule, does not pay for them on a cold start
+
+# Race date of an event; the date index of a season is built over this column
+DATE_COLUMN = 'Session5DateUtc'
+
+# fastf1 schedules only change when sessions are rescheduled, a few hours of staleness is fine
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+
+
+def fetch_schedule(year):
+    """The season's fastf1 event schedule. fastf1 is imported here, so importing this module stays cheap."""
+    import fastf1
+
+    return fastf1.get_event_schedule(year)
+
+
+def as_datetime64(moment):
+    import numpy as np
+
+    return np.datetime64(moment.replace(tzinfo=None) if isinstance(moment, datetime.datetime) else moment, 'ns')
+
+
+class SeasonSchedule:
+    """
+    A season's schedule with its race events (testing and events without a race date left out)
+    sorted by race date, so date lookups are a searchsorted over the date index.
+    """
+
+    def __init__(self, year, schedule):
+        self.year = year
+        self.schedule = schedule
+        events = schedule[(schedule['EventFormat'] != 'testing') & schedule[DATE_COLUMN].notna()]
+        self.events = events.sort_values(DATE_COLUMN, kind='stable').reset_index(drop=True)
+        self.dates = self.events[DATE_COLUMN].to_numpy(dtype='datetime64[ns]')
+
+    def position(self, moment):
+        """Index of the first event racing at or after `moment` (naive UTC)."""
+        import numpy as np
+
+        return int(np.searchsorted(self.dates, as_datetime64(moment), side='left'))
+
+    def between(self, start=None, end=None):
+        """Events racing in [start, end); either bound may be None."""
+        first = 0 if start is None else self.position(start)
+        last = len(self.dates) if end is None else self.position(end)
+        return self.events.iloc[first:last]
+
+    def last_completed(self, now):
+        """The latest event raced before `now`, or None."""
+        index = self.position(now) - 1
+        return self.events.iloc[index] if index >= 0 else None
+
+    def next_event(self, now):
+        """The first event racing at or after `now`, or None."""
+        index = self.position(now)
+        return self.events.iloc[index] if index < len(self.events) else None
+
+
+class ScheduleService:
+    """
+    Event schedules per season, fetched once and memoized for `ttl_seconds`, shared by every
+    caller in the process. All lookups take and compare naive UTC datetimes.
+    """
+
+    def __init__(self, fetch=fetch_schedule, ttl_seconds=DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        self.fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.seasons = {}
+
+    def season(self, year):
+        with self._lock:
+            cached = self.seasons.get(year)
+            if cached is not None and cached[0] > self.clock():
+                return cached[1]
+        season = SeasonSchedule(year, self.fetch(year))
+        with self._lock:
+            self.seasons[year] = (self.clock() + self.ttl_seconds, season)
+        return season
+
+    def schedule(self, year):
+        """The season's full fastf1 schedule frame, testing included."""
+        return self.season(year).schedule
+
+    def events_in_range(self, year, start=None, end=None):
+        """The season's race events racing in [start, end), in date order."""
+        return self.season(year).between(start, end)
+
+    def completed_events(self, year, now=None):
+        return self.events_in_range(year, end=now or datetime.datetime.utcnow())
+
+    def last_completed_event(self, year=None, now=None):
+        """The season's latest event raced before `now`, or None; the season defaults to now's."""
+        now = now or datetime.datetime.utcnow()
+        return self.season(year or now.year).last_completed(now)
+
+    def next_event(self, year=None, now=None):
+        """The season's first event racing at or after `now`, or None; the season defaults to now's."""
+        now = now or datetime.datetime.utcnow()
+        return self.season(year or now.year).next_event(now)
+
+    def clear(self):
+        with self._lock:
+            self.seasons = {}
+
+
+# Process-wide instance used by the loaders
+default = ScheduleService()
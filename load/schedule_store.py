@@ -0,0 +1,322 @@
+import datetime
+import time
+
+from boto3.dynamodb.conditions import Attr, Key
+
+from load.aws_clients import get_resource
+from instrumentation import span
+
+EVENTS_TABLE = 'F1EventsSchedule'
+PENDING_INDEX = 'PendingEvents'
+# Present only while an event is unprocessed, which keeps the GSI sparse. Always PENDING_VALUE,
+# so every pending event sits in one index partition, sorted by date
+PENDING_ATTRIBUTE = 'PendingSeason'
+PENDING_VALUE = 'PENDING'
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# Fan-out completion barrier of an event (load/fanout.py); not part of the schedule itself
+BARRIER_ATTRIBUTES = ('ExpectedSessions', 'CompletedSessions')
+BATCH_WRITE_SIZE = 25
+BATCH_GET_SIZE = 100
+MAX_BATCH_RETRIES = 8
+
+
+def event_item(event_date, event_name, processed):
+    """Schedule item for an event; unprocessed events also get the sparse index key."""
+    item = {
+        'EventDate': event_date.strftime(DATE_FORMAT),
+        'EventName': event_name,
+        'Processed': processed,
+    }
+    if not processed:
+        item[PENDING_ATTRIBUTE] = PENDING_VALUE
+    return item
+
+
+def event_year(item):
+    """Season of a schedule item, from its EventDate."""
+    return int(item['EventDate'][:4])
+
+
+def items_from_schedule(schedule, now=None):
+    """
+    Schedule items built column-wise from a fastf1 event schedule frame. Testing events and
+    events without a race date are left out.
+    """
+    now = now or datetime.datetime.utcnow()
+    events = schedule[(schedule['EventFormat'] != 'testing') & schedule['Session5DateUtc'].notna()]
+    event_dates = events['Session5DateUtc']
+    columns = zip(
+        event_dates.dt.strftime(DATE_FORMAT),
+        events['EventName'],
+        (event_dates < now).to_numpy(),
+    )
+
+    items = []
+    for event_date, event_name, processed in columns:
+        item = {'EventDate': event_date, 'EventName': event_name, 'Processed': bool(processed)}
+        if not processed:
+            item[PENDING_ATTRIBUTE] = PENDING_VALUE
+        items.append(item)
+    return items
+
+
+def schedule_fields(item):
+    """A stored item without its barrier attributes, for comparing with a schedule item."""
+    if item is None:
+        return None
+    return {name: value for name, value in item.items() if name not in BARRIER_ATTRIBUTES}
+
+
+def with_barrier(item, stored):
+    """`item` with the barrier attributes of the `stored` item, if any."""
+    barrier = {name: stored[name] for name in BARRIER_ATTRIBUTES if stored and name in stored}
+    return {**item, **barrier} if barrier else item
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _backoff(attempt):
+    time.sleep(min(0.05 * 2 ** attempt, 5))
+
+
+class EventScheduleStore:
+    """
+    Key-based access to the F1EventsSchedule table.
+
+    Unprocessed events carry PendingSeason, always set to PENDING_VALUE, and the PendingEvents
+    GSI (PendingSeason, EventDate) only contains those items. "Next unprocessed event" is
+    therefore a single Query with Limit=1, and marking an event processed removes it from the
+    index, so the read cost per invocation stays constant however large the table grows.
+    """
+
+    def __init__(self, table_name=EVENTS_TABLE, dynamodb_resource=None):
+        self.table_name = table_name
+        self.dynamodb = dynamodb_resource or get_resource('dynamodb')
+        self.table = self.dynamodb.Table(table_name)
+
+    @property
+    def client(self):
+        # The resource's client converts between Python values and DynamoDB attribute values
+        return self.dynamodb.meta.client
+
+    def create_table(self):
+        """Creates the table with the pending index. Returns False if it already exists."""
+        if self.table_name in self.client.list_tables()['TableNames']:
+            return False
+
+        self.client.create_table(
+            TableName=self.table_name,
+            KeySchema=[
+                {'AttributeName': 'EventDate', 'KeyType': 'HASH'},
+                {'AttributeName': 'EventName', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'EventDate', 'AttributeType': 'S'},
+                {'AttributeName': 'EventName', 'AttributeType': 'S'},
+                {'AttributeName': PENDING_ATTRIBUTE, 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexes=[self._pending_index_definition()],
+            ProvisionedThroughput={
+                'ReadCapacityUnits': 5,
+                'WriteCapacityUnits': 5
+            }
+        )
+        self.table.wait_until_exists()
+        return True
+
+    def _pending_index_definition(self):
+        return {
+            'IndexName': PENDING_INDEX,
+            'KeySchema': [
+                {'AttributeName': PENDING_ATTRIBUTE, 'KeyType': 'HASH'},
+                {'AttributeName': 'EventDate', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+            'ProvisionedThroughput': {
+                'ReadCapacityUnits': 5,
+                'WriteCapacityUnits': 5
+            }
+        }
+
+    def add_pending_index(self):
+        """
+        One-time migration for tables created before the index existed, or whose events were
+        tagged with their season: adds the GSI and tags every unprocessed event with PENDING_VALUE.
+        """
+        indexes = self.client.describe_table(TableName=self.table_name)['Table'].get('GlobalSecondaryIndexes', [])
+        if not any(index['IndexName'] == PENDING_INDEX for index in indexes):
+            self.client.update_table(
+                TableName=self.table_name,
+                AttributeDefinitions=[
+                    {'AttributeName': PENDING_ATTRIBUTE, 'AttributeType': 'S'},
+                    {'AttributeName': 'EventDate', 'AttributeType': 'S'}
+                ],
+                GlobalSecondaryIndexUpdates=[{'Create': self._pending_index_definition()}]
+            )
+        return self.backfill_pending_attribute()
+
+    def backfill_pending_attribute(self):
+        """Paginated scan used only by the migration; returns the number of events tagged."""
+        tagged = 0
+        stale = Attr(PENDING_ATTRIBUTE).not_exists() | Attr(PENDING_ATTRIBUTE).ne(PENDING_VALUE)
+        scan_kwargs = {'FilterExpression': Attr('Processed').eq(False) & stale}
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            for item in response['Items']:
+                self.table.update_item(
+                    Key={'EventDate': item['EventDate'], 'EventName': item['EventName']},
+                    UpdateExpression='SET #S = :pending',
+                    ExpressionAttributeNames={'#S': PENDING_ATTRIBUTE},
+                    ExpressionAttributeValues={':pending': PENDING_VALUE}
+                )
+                tagged += 1
+            if 'LastEvaluatedKey' not in response:
+                return tagged
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def put_event(self, event_date, event_name, processed):
+        self.table.put_item(Item=event_item(event_date, event_name, processed))
+
+    def next_pending(self):
+        """Earliest unprocessed event of any season, or None, from one Limit=1 query."""
+        response = self.table.query(
+            IndexName=PENDING_INDEX,
+            KeyConditionExpression=Key(PENDING_ATTRIBUTE).eq(PENDING_VALUE),
+            ScanIndexForward=True,
+            Limit=1
+        )
+        return response['Items'][0] if response['Items'] else None
+
+    def mark_processed(self, event):
+        """
+        Marks the event processed and drops it from the pending index. The update only applies
+        while the event is still pending, so concurrent callers cannot process it twice.
+        Returns False if it had already been marked.
+        """
+        with span('dynamodb') as update:
+            update.add(items=1)
+            try:
+                self.table.update_item(
+                    Key={'EventDate': event['EventDate'], 'EventName': event['EventName']},
+                    UpdateExpression='SET #P = :processed REMOVE #S',
+                    ConditionExpression=Attr(PENDING_ATTRIBUTE).exists(),
+                    ExpressionAttributeNames={
+                        '#P': 'Processed',  # Escape reserved keyword
+                        '#S': PENDING_ATTRIBUTE
+                    },
+                    ExpressionAttributeValues={':processed': True}
+                )
+            except self.client.exceptions.ConditionalCheckFailedException:
+                return False
+            return True
+
+    def start_sessions(self, event, session_types):
+        """
+        Records the sessions an event is split into for the fan-out completion barrier.
+        Returns the sessions that have not completed yet; completions from an earlier
+        attempt are kept, so a re-run only redoes what is missing.
+        """
+        with span('dynamodb') as update:
+            update.add(items=1)
+            response = self.table.update_item(
+                Key={'EventDate': event['EventDate'], 'EventName': event['EventName']},
+                UpdateExpression='SET ExpectedSessions = :expected',
+                ExpressionAttributeValues={':expected': set(session_types)},
+                ReturnValues='ALL_NEW'
+            )
+        completed = response['Attributes'].get('CompletedSessions', set())
+        return [session_type for session_type in session_types if session_type not in completed]
+
+    def complete_session(self, event, session_type):
+        """
+        Adds a session to the event's CompletedSessions in one atomic update. Returns True when
+        every expected session has completed. Without ExpectedSessions (start_sessions not run,
+        or the item rewritten since) nothing is recorded and False is returned, since an empty
+        expected set would count as complete.
+        """
+        with span('dynamodb') as update:
+            update.add(items=1)
+            try:
+                response = self.table.update_item(
+                    Key={'EventDate': event['EventDate'], 'EventName': event['EventName']},
+                    UpdateExpression='ADD CompletedSessions :done',
+                    ConditionExpression=Attr('ExpectedSessions').exists(),
+                    ExpressionAttributeValues={':done': {session_type}},
+                    ReturnValues='ALL_NEW'
+                )
+            except self.client.exceptions.ConditionalCheckFailedException:
+                print(f"{event['EventName']} has no expected sessions, {session_type} not recorded as completed.")
+                return False
+        item = response['Attributes']
+        return set(item.get('ExpectedSessions', ())) <= set(item.get('CompletedSessions', ()))
+
+    def get_events(self, keys):
+        """Existing items for (EventDate, EventName) keys via BatchGetItem, keyed the same way."""
+        found = {}
+        for chunk in _chunks(keys, BATCH_GET_SIZE):
+            request = {self.table_name: {'Keys': [
+                {'EventDate': event_date, 'EventName': event_name} for event_date, event_name in chunk
+            ]}}
+            for attempt in range(MAX_BATCH_RETRIES):
+                response = self.client.batch_get_item(RequestItems=request)
+                for item in response['Responses'].get(self.table_name, []):
+                    found[(item['EventDate'], item['EventName'])] = item
+                request = response.get('UnprocessedKeys')
+                if not request:
+                    break
+                _backoff(attempt)
+            else:
+                raise RuntimeError(f"BatchGetItem left {len(request[self.table_name]['Keys'])} keys unprocessed")
+        return found
+
+    def put_events_batch(self, items, only_changed=False):
+        """
+        Writes schedule items in BatchWriteItem chunks of 25, retrying unprocessed items with
+        exponential backoff. Puts replace whole items, so the fan-out barrier attributes of
+        stored items are carried over. With only_changed=True, items whose schedule fields
+        match what is stored are not rewritten. Returns write statistics including the
+        consumed write capacity.
+        """
+        start = time.perf_counter()
+        items = list({(item['EventDate'], item['EventName']): item for item in items}.values())
+        existing = self.get_events([(item['EventDate'], item['EventName']) for item in items])
+        unchanged = 0
+        if only_changed:
+            changed = [item for item in items
+                       if schedule_fields(existing.get((item['EventDate'], item['EventName']))) != item]
+            unchanged = len(items) - len(changed)
+            items = changed
+        items = [with_barrier(item, existing.get((item['EventDate'], item['EventName']))) for item in items]
+
+        consumed_capacity = 0.0
+        requests = 0
+        with span('dynamodb') as update:
+            update.add(items=len(items))
+            for chunk in _chunks(items, BATCH_WRITE_SIZE):
+                pending = [{'PutRequest': {'Item': item}} for item in chunk]
+                for attempt in range(MAX_BATCH_RETRIES):
+                    response = self.client.batch_write_item(
+                        RequestItems={self.table_name: pending},
+                        ReturnConsumedCapacity='TOTAL'
+                    )
+                    requests += 1
+                    consumed_capacity += sum(c.get('CapacityUnits', 0) for c in response.get('ConsumedCapacity', []))
+                    pending = response.get('UnprocessedItems', {}).get(self.table_name)
+                    if not pending:
+                        break
+                    _backoff(attempt)
+                else:
+                    raise RuntimeError(f"BatchWriteItem left {len(pending)} items unprocessed")
+
+        elapsed = time.perf_counter() - start
+        return {
+            'written': len(items),
+            'unchanged': unchanged,
+            'requests': requests,
+            'consumed_capacity': consumed_capacity,
+            'seconds': elapsed,
+            'items_per_second': len(items) / elapsed if elapsed else 0.0,
+        }
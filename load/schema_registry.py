@@ -0,0 +1,293 @@
+import json
+import threading
+
+from botocore.exceptions import ClientError
+
+# Columns of every staging table that COPY fills from the staged file's path, not its content
+PATH_COLUMNS = ['circuit_name', 'year', 'session_type']
+
+# REGEXP_SUBSTR (pattern, group) pulling each path column out of METADATA$FILENAME, hive
+# layout first, then flat (see load/layout.py)
+PATH_PATTERNS = {
+    'circuit_name': [('event=([^/]+)', 1), ('([0-9]{4})/([^/]+)/([^_/]+)_', 2)],
+    'year': [('year=([^/]+)', 1), ('([0-9]{4})/([^/]+)/([^_/]+)_', 1)],
+    'session_type': [('session=([^/]+)', 1), ('([0-9]{4})/([^/]+)/([^_/]+)_', 3)],
+}
+
+# Snowflake types from narrowest to widest; two seasons disagreeing on a column get the wider one
+TYPE_ORDER = ['BOOLEAN', 'NUMBER(38,0)', 'FLOAT', 'TIMESTAMP_NTZ', 'TIMESTAMP_TZ', 'STRING']
+
+# DATA_TYPE reported by information_schema.columns for each type
+INFORMATION_SCHEMA_TYPES = {
+    'BOOLEAN': 'BOOLEAN',
+    'NUMBER(38,0)': 'NUMBER',
+    'FLOAT': 'FLOAT',
+    'TIMESTAMP_NTZ': 'TIMESTAMP_NTZ',
+    'TIMESTAMP_TZ': 'TIMESTAMP_TZ',
+    'STRING': 'TEXT',
+}
+
+# Unit recorded for timedelta columns, which normalize_frame stores as int64 milliseconds
+MILLISECONDS = 'ms'
+
+
+def snowflake_type(arrow_type):
+    """Snowflake column type for an Arrow type, or None for all-null columns that carry no type."""
+    import pyarrow as pa
+
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+    if pa.types.is_null(arrow_type):
+        return None
+    if pa.types.is_boolean(arrow_type):
+        return 'BOOLEAN'
+    if pa.types.is_integer(arrow_type):
+        return 'NUMBER(38,0)'
+    if pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type):
+        return 'FLOAT'
+    if pa.types.is_timestamp(arrow_type):
+        return 'TIMESTAMP_TZ' if arrow_type.tz else 'TIMESTAMP_NTZ'
+    return 'STRING'
+
+
+def frame_columns(data, millisecond_columns=()):
+    """
+    Column map of a frame as written to parquet: {column: {'arrow', 'snowflake'[, 'unit']}},
+    from the Arrow schema of `data` (DataFrame or Arrow table).
+    """
+    import pyarrow as pa
+
+    schema = data.schema if isinstance(data, pa.Table) else pa.Schema.from_pandas(data, preserve_index=False)
+    columns = {}
+    for field in schema:
+        column = {'arrow': str(field.type), 'snowflake': snowflake_type(field.type)}
+        if field.name in millisecond_columns:
+            column['unit'] = MILLISECONDS
+        columns[field.name] = column
+    return columns
+
+
+def wider_type(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return max(left, right, key=TYPE_ORDER.index)
+
+
+def merge_columns(base, other):
+    """Union of two column maps in order of first appearance, widening types the maps disagree on."""
+    merged = {name: dict(column) for name, column in base.items()}
+    for name, column in other.items():
+        if name not in merged:
+            merged[name] = dict(column)
+            continue
+        merged[name]['snowflake'] = wider_type(merged[name]['snowflake'], column['snowflake'])
+        if merged[name]['arrow'] == 'null':
+            merged[name]['arrow'] = column['arrow']
+        if 'unit' in column:
+            merged[name]['unit'] = column['unit']
+    return merged
+
+
+def schema_drift(before, after):
+    """
+    Changes from one column map to another at the Snowflake level: added and removed columns,
+    and columns whose type or unit changed. Integer width changes are not drift, they all load
+    into NUMBER. Columns that are all-null on one side are not compared.
+    """
+    drift = []
+    for name, column in after.items():
+        if name not in before:
+            drift.append({'column': name, 'change': 'added', 'before': None, 'after': column['snowflake']})
+            continue
+        old = before[name]
+        if None not in (old['snowflake'], column['snowflake']) and old['snowflake'] != column['snowflake']:
+            drift.append({'column': name, 'change': 'type', 'before': old['snowflake'], 'after': column['snowflake']})
+        elif old.get('unit') != column.get('unit'):
+            drift.append({'column': name, 'change': 'unit', 'before': old.get('unit'), 'after': column.get('unit')})
+    for name, column in before.items():
+        if name not in after:
+            drift.append({'column': name, 'change': 'removed', 'before': column['snowflake'], 'after': None})
+    return drift
+
+
+def season_drift(document):
+    """Drift between consecutive seasons of a registry document, as {season: drift from the previous season}."""
+    seasons = sorted(document['seasons'])
+    return {
+        season: schema_drift(document['seasons'][previous], document['seasons'][season])
+        for previous, season in zip(seasons, seasons[1:])
+    }
+
+
+def table_columns(document):
+    """Columns of a dataset's staging table: the union of all registered seasons, oldest first."""
+    columns = {}
+    for season in sorted(document['seasons']):
+        columns = merge_columns(columns, document['seasons'][season])
+    return columns
+
+
+def format_drift(drift):
+    return ', '.join(f"{change['column']} {change['change']} ({change['before']} -> {change['after']})"
+                     for change in drift)
+
+
+def schema_key(prefix, dataset):
+    return f"{prefix}/_schemas/{dataset}.json"
+
+
+class SchemaRegistry:
+    """
+    Arrow schemas of the artifacts written per dataset and season, merged into one
+    `_schemas/{dataset}.json` document per dataset. The staging table DDL and COPY statements
+    of load/stage_and_load.py are generated from these documents.
+    """
+
+    def __init__(self, s3_client, bucket, prefix):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.documents = {}
+        self.pending = {}
+
+    def read(self, dataset):
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket, Key=schema_key(self.prefix, dataset))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                return {'dataset': dataset, 'seasons': {}}
+            raise
+        return json.loads(obj['Body'].read())
+
+    def document(self, dataset):
+        """Registered document of a dataset, read once and merged with what this process observed."""
+        with self._lock:
+            if dataset not in self.documents:
+                self.documents[dataset] = self.read(dataset)
+            document = self.documents[dataset]
+            seasons = dict(document['seasons'])
+            for season, columns in self.pending.get(dataset, {}).items():
+                seasons[season] = merge_columns(seasons.get(season, {}), columns)
+            return {'dataset': dataset, 'seasons': seasons}
+
+    def observe(self, dataset, year, data, millisecond_columns=()):
+        """
+        Registers the schema of a frame about to be written. Returns its drift against what is
+        registered for the season, or for the latest earlier season if this one is new.
+        """
+        season = str(year)
+        columns = frame_columns(data, millisecond_columns)
+        seasons = self.document(dataset)['seasons']
+        if season in seasons:
+            known = seasons[season]
+        else:
+            earlier = [registered for registered in sorted(seasons) if registered < season]
+            known = seasons[earlier[-1]] if earlier else None
+        # A session missing some columns is not drift; only what the frame adds or changes is
+        drift = [] if known is None else [change for change in schema_drift(known, columns)
+                                         if change['change'] != 'removed']
+
+        if known is None or season not in seasons or drift:
+            with self._lock:
+                pending = self.pending.setdefault(dataset, {})
+                pending[season] = merge_columns(pending.get(season, {}), columns)
+        return drift
+
+    def merge(self, pending):
+        """Adds the schemas another process observed (its `pending`) to what the next flush() writes."""
+        with self._lock:
+            for dataset, seasons in pending.items():
+                own = self.pending.setdefault(dataset, {})
+                for season, columns in seasons.items():
+                    own[season] = merge_columns(own.get(season, {}), columns)
+
+    def flush(self):
+        """Merges the observed schemas into each dataset's document."""
+        with self._lock:
+            pending, self.pending = self.pending, {}
+
+        for dataset, seasons in pending.items():
+            document = self.read(dataset)
+            for season, columns in seasons.items():
+                document['seasons'][season] = merge_columns(document['seasons'].get(season, {}), columns)
+            self.s3_client.put_object(
+                Bucket=self.bucket, Key=schema_key(self.prefix, dataset),
+                Body=json.dumps(document, indent=1).encode('utf-8'), ContentType='application/json'
+            )
+            with self._lock:
+                self.documents[dataset] = document
+            print(f"Updated schema registry for {dataset} ({', '.join(sorted(seasons))}).")
+
+
+def column_definition(name, column):
+    definition = f"{name:<19} {column['snowflake'] or 'STRING'}"
+    if column.get('unit') == MILLISECONDS:
+        definition += " COMMENT 'milliseconds'"
+    return definition
+
+
+def create_table_sql(table, columns, replace=False):
+    """CREATE TABLE statement for a staging table with the path columns, `columns` and LOAD_TIME."""
+    create = 'CREATE OR REPLACE TABLE' if replace else 'CREATE TABLE IF NOT EXISTS'
+    definitions = [f"{name:<19} STRING" for name in PATH_COLUMNS]
+    definitions += [column_definition(name, column) for name, column in columns.items() if name not in PATH_COLUMNS]
+    definitions.append(f"{'LOAD_TIME':<19} TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()")
+    body = ',\n            '.join(definitions)
+    return f"""
+        {create} {table} (
+            {body}
+        );
+    """
+
+
+def table_changes(table, existing, columns):
+    """
+    Reconciles a table's current columns ({NAME: information_schema DATA_TYPE}) with the
+    registry. Returns the ALTER statements adding missing columns and the columns whose
+    existing type differs, which need the table to be recreated.
+    """
+    existing = {name.upper(): data_type for name, data_type in existing.items()}
+    statements = []
+    mismatched = []
+    for name, column in columns.items():
+        if name in PATH_COLUMNS:
+            continue
+        if name.upper() not in existing:
+            statements.append(f"ALTER TABLE {table} ADD COLUMN {column_definition(name, column)}")
+        elif INFORMATION_SCHEMA_TYPES[column['snowflake'] or 'STRING'] != existing[name.upper()]:
+            mismatched.append(name)
+    return statements, mismatched
+
+
+def path_expression(column):
+    matches = [f"REGEXP_SUBSTR(METADATA$FILENAME, '{pattern}', 1, 1, 'e', {group})"
+               for pattern, group in PATH_PATTERNS[column]]
+    expression = f"COALESCE({', '.join(matches)})"
+    # Keys carry the session in lower case
+    return f"UPPER({expression})" if column == 'session_type' else expression
+
+
+def copy_transform(table, columns, source):
+    """
+    COPY INTO ... FROM (SELECT ...) head that casts every parquet column to its registered type
+    and fills the path columns from the file name, for files of either layout. `source` is the stage location to read from;
+    FILES or PATTERN and the options are appended by the caller.
+    """
+    names = list(PATH_COLUMNS)
+    expressions = [path_expression(column) for column in PATH_COLUMNS]
+    for name, column in columns.items():
+        if name in PATH_COLUMNS:
+            continue
+        names.append(name)
+        expressions.append(f'$1:"{name}"::{column["snowflake"] or "STRING"}')
+    select = ',\n                    '.join(expressions)
+    return f"""
+                COPY INTO {table} ({', '.join(names)})
+                FROM (
+                    SELECT
+                    {select}
+                    FROM {source}
+                )"""
@@ -0,0 +1,296 @@
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from load.s3_writer import (DEFAULT_PART_SIZE, DEFAULT_ROW_GROUP_SIZE, HashingFile, UploadResult, encode_parquet,
+                            remote_content_hash, upload_encoded)
+from instrumentation import span
+
+# Lambda's only writable directory is /tmp, which survives between warm invocations
+DEFAULT_SPOOL_DIR = '/tmp/spool'
+DEFAULT_UPLOAD_WORKERS = 4
+MAX_UPLOAD_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 20
+# Runs an entry may give up in (e.g. AccessDenied on its key) before it is moved out of the way
+# into the dead-letter subdirectory, so it does not fail every later flush
+MAX_FAILED_RUNS = 3
+DEAD_LETTER_DIR = 'dead'
+# /tmp also holds the local fastf1 cache tier (up to 384 MB, see load/cache_tier.py) out of 512 MB
+DEFAULT_MAX_SPOOL_BYTES = 96 * 1024 * 1024
+
+
+def _backoff(attempt):
+    # Full jitter, so workers retrying after the same outage do not hit S3 in lockstep
+    time.sleep(random.uniform(0, min(RETRY_BASE_SECONDS * 2 ** attempt, RETRY_MAX_SECONDS)))
+
+
+def fsync_dir(path):
+    """Makes the renames into a directory durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path, document):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as file:
+        json.dump(document, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    fsync_dir(os.path.dirname(path) or '.')
+
+
+class Spool:
+    """
+    Durable local spool between encoding and upload. write() encodes a frame into the spool
+    directory and returns as soon as it is on disk; a thread pool uploads the spooled files to
+    S3 with retries and backoff, sharing one client and so its connection pool.
+
+    Every entry is an {id}.parquet file plus an {id}.json sidecar written after it, both
+    renamed into place, so a crash leaves either a complete entry or nothing. Entries are only
+    removed once they are in S3; whatever is left (a crash, or an upload that gave up) is
+    uploaded by the next Spool on the same directory, unless it already gave up in
+    MAX_FAILED_RUNS runs, in which case it is moved to the DEAD_LETTER_DIR subdirectory for
+    inspection. Use one spool directory per process.
+
+    At most `max_bytes` are spooled: once the cap is reached write() blocks until uploads free
+    up space. A single frame larger than the cap is still spooled once the spool is empty.
+    """
+
+    def __init__(self, s3_client, spool_dir=DEFAULT_SPOOL_DIR, workers=DEFAULT_UPLOAD_WORKERS,
+                 max_attempts=MAX_UPLOAD_ATTEMPTS, dedup=True, hash_index=None, part_size=DEFAULT_PART_SIZE,
+                 max_bytes=DEFAULT_MAX_SPOOL_BYTES):
+        self.s3_client = s3_client
+        self.spool_dir = spool_dir
+        self.max_attempts = max_attempts
+        self.dedup = dedup
+        self.hash_index = hash_index
+        self.part_size = part_size
+        self.max_bytes = max_bytes
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='spool-upload')
+        self._lock = threading.Lock()
+        # Signalled whenever an upload finishes, for write() waiting on the size cap
+        self._space = threading.Condition(self._lock)
+        # Bytes of the entries on disk, and the number of them still being uploaded
+        self.spooled_bytes = 0
+        self.uploading = 0
+        # entry id -> (key, future) of uploads not yet flushed
+        self.pending = {}
+        # key -> id of its newest entry; an older entry of the same key is dropped, not uploaded
+        self.latest = {}
+        # key -> upload future of its newest entry, for when_uploaded()
+        self.uploads = {}
+        self.key_locks = {}
+        os.makedirs(spool_dir, exist_ok=True)
+        self.recover()
+
+    def paths(self, entry_id):
+        base = os.path.join(self.spool_dir, entry_id)
+        return f"{base}.parquet", f"{base}.json"
+
+    def write(self, bucket, key, data, row_group_size=DEFAULT_ROW_GROUP_SIZE, compression='snappy'):
+        """
+        Encodes `data` into the spool and queues its upload to s3://bucket/key. Returns the
+        UploadResult straight away; whether the upload went through is reported by flush().
+        """
+        with self._space:
+            # Entries that gave up stay on disk but free nothing by waiting, so only wait on live uploads
+            while self.spooled_bytes >= self.max_bytes and self.uploading:
+                self._space.wait()
+
+        # Time-ordered ids, so recovery uploads in the order things were written
+        entry_id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        data_path, entry_path = self.paths(entry_id)
+        with span('encode') as encode:
+            with open(f"{data_path}.tmp", 'wb') as file:
+                encoded = HashingFile(file)
+                rows = encode_parquet(data, encoded, row_group_size, compression)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(f"{data_path}.tmp", data_path)
+            encode.add(rows=rows, bytes=encoded.size)
+
+        entry = {
+            'id': entry_id,
+            'bucket': bucket,
+            'key': key,
+            'content_hash': encoded.sha256.hexdigest(),
+            'rows': rows,
+            'bytes': encoded.size,
+        }
+        write_json_atomic(entry_path, entry)
+        self.submit(entry)
+        return UploadResult(key, rows, encoded.size, entry['content_hash'])
+
+    def submit(self, entry):
+        with self._lock:
+            self.spooled_bytes += entry['bytes']
+            self.uploading += 1
+            self.latest[entry['key']] = entry['id']
+            self.key_locks.setdefault(entry['key'], threading.Lock())
+            future = self.pool.submit(self.upload, entry)
+            self.pending[entry['id']] = (entry['key'], future)
+            self.uploads[entry['key']] = future
+
+    def when_uploaded(self, keys, callback):
+        """
+        Calls callback() once the newest spooled entries of all `keys` are in S3, from the upload
+        thread finishing last. It is not called if any of them gave up.
+        """
+        with self._lock:
+            futures = [self.uploads[key] for key in keys]
+        lock = threading.Lock()
+        state = {'remaining': len(futures), 'uploaded': True}
+
+        def done(future):
+            with lock:
+                state['uploaded'] = state['uploaded'] and future.exception() is None and future.result()
+                state['remaining'] -= 1
+                if state['remaining'] or not state['uploaded']:
+                    return
+            try:
+                callback()
+            except Exception as e:
+                print(f"Completion callback for {', '.join(keys)} failed: {e}")
+
+        if not futures:
+            callback()
+        for future in futures:
+            future.add_done_callback(done)
+
+    def recover(self):
+        """
+        Queues the entries a previous run left behind and clears out partial writes. A sidecar
+        that cannot be read is dropped, and its data file with it.
+        """
+        entries = []
+        for name in sorted(os.listdir(self.spool_dir)):
+            path = os.path.join(self.spool_dir, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+            elif name.endswith('.json'):
+                try:
+                    with open(path) as file:
+                        entries.append(json.load(file))
+                except (OSError, ValueError) as e:
+                    print(f"Dropping unreadable spool entry {path}: {e}")
+                    os.remove(path)
+        committed = {entry['id'] for entry in entries}
+        for name in os.listdir(self.spool_dir):
+            if name.endswith('.parquet') and name[:-len('.parquet')] not in committed:
+                os.remove(os.path.join(self.spool_dir, name))
+
+        for entry in entries:
+            if os.path.exists(self.paths(entry['id'])[0]):
+                self.submit(entry)
+            else:
+                os.remove(self.paths(entry['id'])[1])
+        if entries:
+            print(f"Recovered {len(entries)} spooled uploads from {self.spool_dir}.")
+
+    def upload(self, entry):
+        """Uploads one entry, retrying with backoff. Returns True once it is in S3 (or superseded)."""
+        try:
+            return self.upload_entry(entry)
+        finally:
+            with self._space:
+                self.uploading -= 1
+                self._space.notify_all()
+
+    def upload_entry(self, entry):
+        with self.key_locks[entry['key']]:
+            if self.latest.get(entry['key']) != entry['id']:
+                # A newer version of the key was spooled after this one
+                self.discard(entry)
+                return True
+            for attempt in range(self.max_attempts):
+                try:
+                    self.put(entry)
+                    break
+                except Exception as e:
+                    if attempt + 1 == self.max_attempts:
+                        self.give_up(entry, e)
+                        return False
+                    print(f"Upload of {entry['key']} failed (attempt {attempt + 1}), retrying: {e}")
+                    _backoff(attempt)
+            self.discard(entry)
+        return True
+
+    def give_up(self, entry, error):
+        """Leaves a failed entry for the next run, or dead-letters it after MAX_FAILED_RUNS runs."""
+        entry['failed_runs'] = entry.get('failed_runs', 0) + 1
+        if entry['failed_runs'] < MAX_FAILED_RUNS:
+            write_json_atomic(self.paths(entry['id'])[1], entry)
+            print(f"Giving up on {entry['key']} after {self.max_attempts} attempts, "
+                  f"left in {self.spool_dir}: {error}")
+            return
+        dead_dir = os.path.join(self.spool_dir, DEAD_LETTER_DIR)
+        os.makedirs(dead_dir, exist_ok=True)
+        data_path, entry_path = self.paths(entry['id'])
+        os.replace(data_path, os.path.join(dead_dir, os.path.basename(data_path)))
+        write_json_atomic(os.path.join(dead_dir, os.path.basename(entry_path)), entry)
+        os.remove(entry_path)
+        with self._space:
+            self.spooled_bytes -= entry['bytes']
+            self._space.notify_all()
+        print(f"Giving up on {entry['key']} for good after {entry['failed_runs']} runs, "
+              f"moved to {dead_dir}: {error}")
+
+    def put(self, entry):
+        bucket, key, content_hash = entry['bucket'], entry['key'], entry['content_hash']
+        with span('upload') as upload:
+            if self.dedup:
+                if self.hash_index is not None:
+                    existing_hash = self.hash_index.get(bucket, key)
+                else:
+                    existing_hash = remote_content_hash(self.s3_client, bucket, key)
+                if existing_hash == content_hash:
+                    upload.add(skipped=1)
+                    print(f"Skipped {key}, content unchanged in S3.")
+                    return
+            with open(self.paths(entry['id'])[0], 'rb') as file:
+                upload_encoded(self.s3_client, bucket, key, file, content_hash, self.part_size)
+            upload.add(rows=entry['rows'], bytes=entry['bytes'])
+        if self.hash_index is not None:
+            self.hash_index.set(bucket, key, content_hash)
+        print(f"Successfully uploaded {key} to S3.")
+
+    def discard(self, entry):
+        data_path, entry_path = self.paths(entry['id'])
+        # The sidecar goes first, a data file without one is cleared out by recover()
+        os.remove(entry_path)
+        os.remove(data_path)
+        with self._space:
+            self.spooled_bytes -= entry['bytes']
+            self._space.notify_all()
+
+    def flush(self):
+        """
+        Waits until everything spooled so far is uploaded or has given up. Returns the keys
+        that gave up; they stay in the spool for the next run.
+        """
+        failed = []
+        while True:
+            with self._lock:
+                pending = list(self.pending.items())
+            if not pending:
+                return failed
+            for entry_id, (key, future) in pending:
+                if not future.result():
+                    failed.append(key)
+                with self._lock:
+                    self.pending.pop(entry_id, None)
+
+    def close(self):
+        """Flushes and stops the upload threads. Returns the keys that gave up, like flush()."""
+        failed = self.flush()
+        self.pool.shutdown()
+        return failed
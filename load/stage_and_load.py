@@ -1,13 +1,55 @@
 from dotenv import load_dotenv
+import argparse
+import datetime
 import os
+import time
+from email.utils import parsedate_to_datetime
 import snowflake.connector
 
-load_dotenv("../.env.local")
+from load.artifacts import LAP_ANALYTICS_ARTIFACTS, RACE_ANALYTICS_ARTIFACTS
+from load.aws_clients import get_client
+from load.schema_registry import SchemaRegistry, create_table_sql, table_changes, copy_transform, format_drift, \
+    season_drift, table_columns
 
+# Run from the repo root as `python -m load.stage_and_load`, so the `load` package imports resolve.
+# The credentials file sits in the repo root, found relative to this file rather than the cwd.
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.env.local'))
 
-def initial_load():
-    # 1. Connect to Snowflake
-    conn = snowflake.connector.connect(
+STAGE = '@my_f1_stage'
+# S3 location behind the stage (load/snowflake_integration.sql) and the matching key prefix
+STAGE_BUCKET = 'race-predictor-pro'
+STAGE_PREFIX = 'f1_data'
+STAGE_URL = f's3://{STAGE_BUCKET}/{STAGE_PREFIX}/'
+STAGE_KEY_PREFIX = f'{STAGE_PREFIX}/'
+
+# COPY accepts at most 1000 entries in FILES
+MAX_FILES_PER_COPY = 1000
+ASYNC_POLL_SECONDS = 1
+
+# Per-table watermark (last_modified of the newest loaded stage file) for incremental loads
+WATERMARK_TABLE = 'stage_load_watermarks'
+# S3 dates a multipart upload by when it started, so a file can appear with a last_modified
+# older than files loaded before it finished. Files this far behind the watermark are listed
+# again; COPY's load metadata skips the ones already loaded.
+WATERMARK_OVERLAP = datetime.timedelta(hours=1)
+
+# COPY result statuses that count as loaded. Incremental COPYs skip a file with bad rows
+# whole (ON_ERROR = SKIP_FILE) rather than dropping the rows, so it is retried instead
+LOADED_STATUSES = ('LOADED',)
+# Runs a failing file holds a table's watermark back for before it is given up on
+MAX_FILE_ATTEMPTS = 5
+
+# Datasets loaded into a <dataset>_staging table. Their columns and types come from the
+# schema registry (load/schema_registry.py), which the ingestion fills while writing the files.
+STAGING_DATASETS = ['laps', 'weather', 'drivers_info'] + LAP_ANALYTICS_ARTIFACTS + RACE_ANALYTICS_ARTIFACTS
+
+
+def staging_table(dataset):
+    return f"{dataset}_staging"
+
+
+def connect():
+    return snowflake.connector.connect(
         user=os.getenv("SNOWFLAKE_USER"),
         password=os.getenv("SNOWFLAKE_PASSWORD"),
         account=os.getenv("SNOWFLAKE_ACCOUNT"),
@@ -15,132 +57,357 @@ def initial_load():
         database=os.getenv("SNOWFLAKE_DATABASE"),
         schema=os.getenv("SNOWFLAKE_SCHEMA")
     )
-    cursor = conn.cursor()
-    try:
 
-        create_laps_table_sql = """
-                CREATE OR REPLACE TABLE laps_staging (
-                  circuit_name       STRING,
-                  year               STRING,
-                  session_type       STRING,
-                  Time               STRING,
-                  Driver             STRING,
-                  DriverNumber       STRING,
-                  LapTime            STRING,
-                  LapNumber          STRING,
-                  Stint              STRING,
-                  PitOutTime         STRING,
-                  PitInTime          STRING,
-                  Sector1Time        STRING,
-                  Sector2Time        STRING,
-                  Sector3Time        STRING,
-                  Sector1SessionTime STRING,
-                  Sector2SessionTime STRING,
-                  Sector3SessionTime STRING,
-                  SpeedI1            STRING,
-                  SpeedI2            STRING,
-                  SpeedFL            STRING,
-                  SpeedST            STRING,
-                  IsPersonalBest     STRING,
-                  Compound           STRING,
-                  TyreLife           STRING,
-                  FreshTyre          STRING,
-                  Team               STRING,
-                  LapStartTime       STRING,
-                  LapStartDate       STRING,
-                  TrackStatus        STRING,
-                  Position           STRING,
-                  Deleted            STRING,
-                  DeletedReason      STRING,
-                  LOAD_TIME          TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
-                );
-            """
-        create_weather_table_sql = """
-            CREATE OR REPLACE TABLE weather_staging (
-                circuit_name       STRING,
-                year               STRING,
-                session_type       STRING, 
-                Time               STRING,
-                AirTemp            STRING,
-                Humidity           STRING,
-                Pressure           STRING,
-                Rainfall           STRING,
-                TrackTemp          STRING,
-                WindDirection      STRING,
-                WindSpeed          STRING,
-                LOAD_TIME          TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
-            );
-        """
-        create_drivers_info_table_sql = """
-        CREATE OR REPLACE TABLE drivers_info_staging (
-            circuit_name       STRING,
-            year               STRING,
-            session_type       STRING,
-            DriverNumber       STRING,
-            BroadcastName      STRING,
-            Abbreviation       STRING,
-            DriverId           STRING,
-            TeamName           STRING,
-            TeamColor          STRING,
-            TeamId             STRING,
-            FirstName          STRING,
-            LastName           STRING,
-            FullName           STRING,
-            HeadshotUrl        STRING,
-            CountryCode        STRING,
-            Position           STRING,
-            ClassifiedPosition STRING,
-            GridPosition       STRING,
-            Q1                 STRING,
-            Q2                 STRING,
-            Q3                 STRING,
-            Time               STRING,
-            Status             STRING,
-            Points             STRING,
-            LOAD_TIME          TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+
+def default_registry():
+    return SchemaRegistry(get_client('s3'), STAGE_BUCKET, STAGE_PREFIX)
+
+
+def staging_schemas(registry):
+    """
+    Registered columns per staging dataset, reporting drift between seasons. Datasets nothing
+    was written for yet are left out.
+    """
+    schemas = {}
+    for dataset in STAGING_DATASETS:
+        document = registry.document(dataset)
+        if not document['seasons']:
+            print(f"No schema registered for {dataset} yet, skipping {staging_table(dataset)}.")
+            continue
+        for season, drift in season_drift(document).items():
+            if drift:
+                print(f"Schema drift in {dataset} {season}: {format_drift(drift)}")
+        schemas[dataset] = table_columns(document)
+    return schemas
+
+
+def existing_columns(cursor, table):
+    cursor.execute("SELECT column_name, data_type FROM information_schema.columns "
+                   "WHERE table_schema = CURRENT_SCHEMA() AND table_name = %s", (table.upper(),))
+    return dict(cursor.fetchall())
+
+
+def create_tables(cursor, schemas, replace=False):
+    """
+    Creates missing staging tables from the registered schemas and adds columns new seasons
+    introduced. replace=True recreates them empty, e.g. to move existing tables to new types.
+    """
+    for dataset, columns in schemas.items():
+        table = staging_table(dataset)
+        cursor.execute(create_table_sql(table, columns, replace))
+        if replace:
+            continue
+        statements, mismatched = table_changes(table, existing_columns(cursor, table), columns)
+        for statement in statements:
+            print(statement)
+            cursor.execute(statement)
+        if mismatched:
+            print(f"{table}: {', '.join(mismatched)} differ from the registered types, "
+                  f"recreate the table with --full --replace to change them.")
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+            table_name          STRING,
+            last_modified       TIMESTAMP_NTZ,
+            updated_at          TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
         );
-        """
-
-        cursor.execute(create_laps_table_sql)
-        cursor.execute(create_weather_table_sql)
-        cursor.execute(create_drivers_info_table_sql)
-
-        laps_sql = """
-                COPY INTO laps_staging
-                FROM @my_f1_stage
-                FILE_FORMAT = (TYPE = PARQUET)
-                PATTERN = '.*laps.parquet'
-                MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE
-                ON_ERROR = CONTINUE
-            """
+    """)
+    # The file holding a watermark back and how many runs it failed in
+    cursor.execute(f"ALTER TABLE {WATERMARK_TABLE} ADD COLUMN IF NOT EXISTS failed_file STRING")
+    cursor.execute(f"ALTER TABLE {WATERMARK_TABLE} ADD COLUMN IF NOT EXISTS attempts INTEGER")
+
+
+def stage_location(dataset, layout='flat', year=None, event=None, session=None):
+    """
+    FROM location and PATTERN selecting a dataset's files in the stage.
+
+    With the hive layout (see load/layout.py) the location is narrowed to
+    dataset=<dataset>/year=<year>/event=<event>/session=<session>/, stopping at the first
+    filter left open, so Snowflake only lists the selected partitions instead of the whole stage.
+    """
+    if layout == 'hive':
+        location = f"{STAGE}/dataset={dataset}/"
+        for name, value in (('year', year), ('event', event), ('session', session)):
+            if value is None:
+                break
+            location += f"{name}={value}/"
+        return location, '.*[.]parquet'
+    return STAGE, f'.*{dataset}.parquet'
+
 
-        weather_sql = """
-                COPY INTO weather_staging
-                FROM @my_f1_stage
-                FILE_FORMAT = (TYPE = PARQUET)
-                PATTERN = '.*weather.parquet'
-                MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE
+def copy_sql(table, columns, dataset, layout='flat', year=None, event=None, session=None):
+    """COPY statement loading every matching file of a dataset into its staging table."""
+    location, pattern = stage_location(dataset, layout, year, event, session)
+    return copy_transform(table, columns, location) + f"""
+                PATTERN = '{pattern}'
+                FILE_FORMAT = (TYPE = PARQUET USE_LOGICAL_TYPE = TRUE)
                 ON_ERROR = CONTINUE
             """
 
-        driver_info_sql = """
-                COPY INTO drivers_info_staging
-                FROM @my_f1_stage
-                FILE_FORMAT = (TYPE = PARQUET)
-                PATTERN = '.*drivers_info.parquet'
-                MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE
-                ON_ERROR = CONTINUE
+
+def copy_files_sql(table, columns, files):
+    """
+    COPY statement loading exactly `files` (paths relative to the stage) into a table. A file
+    with rows that fail is skipped whole, so it is not recorded as loaded and can be retried.
+    """
+    file_list = ', '.join(f"'{path}'" for path in files)
+    return copy_transform(table, columns, STAGE) + f"""
+                FILES = ({file_list})
+                FILE_FORMAT = (TYPE = PARQUET USE_LOGICAL_TYPE = TRUE)
+                ON_ERROR = SKIP_FILE
             """
 
-        cursor.execute(laps_sql)
-        cursor.execute(weather_sql)
-        cursor.execute(driver_info_sql)
+
+def stage_path(path):
+    """Path relative to the stage, from a stage URL (LIST output) or an S3 key (upload manifest)."""
+    for prefix in (STAGE_URL, STAGE_KEY_PREFIX):
+        if path.startswith(prefix):
+            return path[len(prefix):]
+    return path
+
+
+def file_dataset(path):
+    """Dataset a staged file belongs to, for both key layouts (see parse_key in load/layout.py)."""
+    for part in path.split('/'):
+        if part.startswith('dataset='):
+            return part[len('dataset='):]
+    session, _, dataset = path.rsplit('/', 1)[-1][:-len('.parquet')].partition('_')
+    if dataset.startswith('delta_'):
+        dataset = dataset.split('_', 2)[2]
+    return dataset
+
+
+def read_manifest(path):
+    """New-file manifest: one S3 key or stage path per line."""
+    with open(path) as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def files_by_table(paths, datasets=STAGING_DATASETS):
+    """Groups stage paths by the staging table they load into; files of other datasets are left out."""
+    grouped = {}
+    for path in paths:
+        path = stage_path(path)
+        dataset = file_dataset(path)
+        if dataset in datasets:
+            grouped.setdefault(staging_table(dataset), []).append(path)
+    return grouped
+
+
+def read_watermarks(cursor):
+    """Latest (last_modified, failed_file, attempts) per table."""
+    # The latest row, not the maximum: a failed file can move a watermark back (see advance_watermarks)
+    cursor.execute(f"SELECT table_name, last_modified, failed_file, attempts FROM {WATERMARK_TABLE} "
+                   f"QUALIFY ROW_NUMBER() OVER (PARTITION BY table_name ORDER BY updated_at DESC) = 1")
+    return {table: (last_modified, failed_file, attempts or 0)
+            for table, last_modified, failed_file, attempts in cursor.fetchall()}
+
+
+def list_new_files(cursor, dataset, watermark=None, layout='flat', year=None, event=None, session=None):
+    """
+    Stage files of a dataset modified after `watermark` minus WATERMARK_OVERLAP, as
+    (stage path, last_modified) in modification order.
+    """
+    since = None if watermark is None else watermark - WATERMARK_OVERLAP
+    location, pattern = stage_location(dataset, layout, year, event, session)
+    cursor.execute(f"LIST {location} PATTERN = '{pattern}'")
+    columns = [column[0].lower() for column in cursor.description]
+    files = []
+    for row in cursor.fetchall():
+        entry = dict(zip(columns, row))
+        last_modified = parsedate_to_datetime(entry['last_modified']).astimezone(datetime.timezone.utc)
+        last_modified = last_modified.replace(tzinfo=None)
+        path = stage_path(entry['name'])
+        if file_dataset(path) != dataset:
+            continue
+        if since is None or last_modified > since:
+            files.append((path, last_modified))
+    return sorted(files, key=lambda file: file[1])
+
+
+def run_async(conn, statements):
+    """
+    Submits every (table, sql) statement with execute_async so they run concurrently in the
+    warehouse, waits for all of them and returns the per-file COPY results as dicts.
+    A statement that fails outright is reported as one result with status 'QUERY_FAILED'.
+    """
+    submitted = []
+    for table, sql in statements:
+        cursor = conn.cursor()
+        try:
+            cursor.execute_async(sql)
+            submitted.append((table, cursor.sfqid))
+        finally:
+            cursor.close()
+
+    results = []
+    for table, query_id in submitted:
+        cursor = conn.cursor()
+        try:
+            while conn.is_still_running(conn.get_query_status_throw_if_error(query_id)):
+                time.sleep(ASYNC_POLL_SECONDS)
+            cursor.get_results_from_sfqid(query_id)
+            columns = [column[0].lower() for column in cursor.description]
+            for row in cursor.fetchall():
+                result = dict(zip(columns, row))
+                if 'file' not in result:
+                    # "Copy executed with 0 files processed."
+                    continue
+                result['table'] = table
+                result['file'] = stage_path(result['file'])
+                results.append(result)
+        except Exception as e:
+            results.append({'table': table, 'file': None, 'status': 'QUERY_FAILED', 'rows_loaded': 0,
+                            'errors_seen': None, 'first_error': str(e)})
+        finally:
+            cursor.close()
+    return results
+
+
+def report(results):
+    """Prints a per-table summary and every file that did not load cleanly. Returns the number of problem files."""
+    tables = {}
+    problems = []
+    for result in results:
+        summary = tables.setdefault(result['table'], {'files': 0, 'rows': 0})
+        summary['files'] += 1
+        summary['rows'] += result.get('rows_loaded') or 0
+        if result['status'] not in LOADED_STATUSES or result.get('errors_seen'):
+            problems.append(result)
+
+    for table, summary in sorted(tables.items()):
+        print(f"{table}: {summary['rows']} rows from {summary['files']} files")
+    for result in problems:
+        print(f"  {result['status']} {result['table']} {result['file']}: "
+              f"{result.get('errors_seen')} errors, first: {result.get('first_error')}")
+    return len(problems)
+
+
+def advance_watermarks(cursor, new_files, results, watermarks=None):
+    """
+    Moves each table's watermark to its newest file loaded without a gap: files are walked in
+    modification order and the walk stops at the first one that failed, whose last_modified
+    becomes the watermark. That can move it back, but keeps the file listed (and retried) on
+    the next run, within WATERMARK_OVERLAP. A file that failed MAX_FILE_ATTEMPTS runs in a row
+    (counted in `watermarks`, see read_watermarks) is given up on with a warning and walked past.
+    """
+    watermarks = watermarks or {}
+    status = {(result['table'], result['file']): result['status'] for result in results}
+    failed_tables = {result['table'] for result in results if result['status'] == 'QUERY_FAILED'}
+    for table, files in new_files.items():
+        if table in failed_tables:
+            continue
+        _, held_by, held_attempts = watermarks.get(table, (None, None, 0))
+        watermark = failed_file = None
+        attempts = 0
+        for path, last_modified in files:
+            # Files COPY skipped as already loaded are not in the results
+            if status.get((table, path), 'LOADED') not in LOADED_STATUSES:
+                attempts = held_attempts + 1 if path == held_by else 1
+                if attempts < MAX_FILE_ATTEMPTS:
+                    print(f"WARNING: {table}: {path} failed to load (attempt {attempts} of "
+                          f"{MAX_FILE_ATTEMPTS}), watermark held at it.")
+                    watermark, failed_file = last_modified, path
+                    break
+                print(f"WARNING: {table}: giving up on {path} after {attempts} failed loads, it has to "
+                      f"be fixed and loaded with --manifest.")
+                attempts = 0
+            watermark = last_modified
+        if watermark is not None:
+            cursor.execute(f"INSERT INTO {WATERMARK_TABLE} (table_name, last_modified, failed_file, attempts) "
+                           f"VALUES (%s, %s, %s, %s)", (table, watermark, failed_file, attempts))
+
+
+def incremental_load(conn=None, files=None, layout='flat', year=None, event=None, session=None, registry=None):
+    """
+    Loads only new stage files into the staging tables, which are kept between runs.
+
+    With `files` (S3 keys or stage paths, e.g. from a new-file manifest) exactly those files
+    are copied. Otherwise the stage is listed per dataset and files modified after the table's
+    watermark (less WATERMARK_OVERLAP, already loaded files are skipped by COPY) are copied,
+    after which the watermark moves forward. The COPY statements of all tables run
+    concurrently. Returns the per-file results.
+    """
+    schemas = staging_schemas(registry or default_registry())
+    table_schemas = {staging_table(dataset): columns for dataset, columns in schemas.items()}
+    own_connection = conn is None
+    conn = conn or connect()
+    cursor = conn.cursor()
+    try:
+        create_tables(cursor, schemas)
+
+        if files is not None:
+            new_files = {table: [(path, None) for path in paths]
+                         for table, paths in files_by_table(files, schemas).items()}
+        else:
+            watermarks = read_watermarks(cursor)
+            new_files = {}
+            for dataset in schemas:
+                table = staging_table(dataset)
+                listed = list_new_files(cursor, dataset, watermarks.get(table, (None,))[0], layout, year, event,
+                                        session)
+                if listed:
+                    new_files[table] = listed
+
+        statements = []
+        for table, table_files in new_files.items():
+            paths = [path for path, _ in table_files]
+            for start in range(0, len(paths), MAX_FILES_PER_COPY):
+                statements.append((table, copy_files_sql(table, table_schemas[table],
+                                                          paths[start:start + MAX_FILES_PER_COPY])))
+        if not statements:
+            print("No new files to load.")
+            return []
+
+        results = run_async(conn, statements)
+        report(results)
+        if files is None:
+            advance_watermarks(cursor, new_files, results, watermarks)
+        return results
+
+    finally:
+        cursor.close()
+        if own_connection:
+            conn.close()
+
+
+def initial_load(layout='flat', year=None, event=None, session=None, replace=False, conn=None, registry=None):
+    """
+    Copies every matching stage file into the staging tables. Files already loaded are skipped
+    by Snowflake's load metadata unless replace=True recreates the tables first.
+    """
+    schemas = staging_schemas(registry or default_registry())
+    own_connection = conn is None
+    conn = conn or connect()
+    cursor = conn.cursor()
+    try:
+        create_tables(cursor, schemas, replace=replace)
+
+        partitions = dict(layout=layout, year=year, event=event, session=session)
+        statements = [
+            (staging_table(dataset), copy_sql(staging_table(dataset), columns, dataset, **partitions))
+            for dataset, columns in schemas.items()
+        ]
+        results = run_async(conn, statements)
+        report(results)
         print("Initial load complete!")
+        return results
 
     finally:
         cursor.close()
-        conn.close()
+        if own_connection:
+            conn.close()
 
 
 if __name__ == "__main__":
-    initial_load()
+    parser = argparse.ArgumentParser(description='Load staged F1 parquet files into the Snowflake staging tables. '
+                                                 'Run from the repo root: python -m load.stage_and_load')
+    parser.add_argument('--manifest', help='File listing the new S3 keys to load, one per line')
+    parser.add_argument('--full', action='store_true', help='Copy every matching file instead of only new ones')
+    parser.add_argument('--replace', action='store_true', help='With --full, recreate the tables first')
+    parser.add_argument('--layout', choices=['flat', 'hive'], default='flat')
+    args = parser.parse_args()
+
+    if args.full:
+        initial_load(args.layout, replace=args.replace)
+    else:
+        incremental_load(files=read_manifest(args.manifest) if args.manifest else None, layout=args.layout)
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+# Channels summarized by every rollup, and the statistics computed for each of them.
+# Brake is a boolean, so its mean is the share of samples spent braking.
+ROLLUP_CHANNELS = ['Speed', 'Throttle', 'Brake', 'RPM']
+ROLLUP_STATS = ['min', 'max', 'mean']
+
+TIME_BUCKET_SECONDS = 1
+DISTANCE_BUCKET_METERS = 100
+
+# Full-rate telemetry is written once per driver; the rollups are one small file per session
+FULL_RATE_ARTIFACT = 'telemetry'
+
+
+def driver_abbreviations(f1_session):
+    """DriverNumber -> three letter abbreviation, from session.results."""
+    results = f1_session.results
+    return dict(zip(results['DriverNumber'].astype(str), results['Abbreviation']))
+
+
+def add_lap_numbers(car_data, driver_laps):
+    """
+    Tags every sample with the lap it was recorded on. Samples before the first lap starts or
+    after the last lap ends (grid, cool-down) get no lap number.
+    """
+    laps = driver_laps[['LapStartTime', 'Time', 'LapNumber']].dropna(subset=['LapStartTime'])
+    laps = laps.rename(columns={'Time': 'LapEndTime'}).sort_values('LapStartTime')
+    car_data = car_data.sort_values('SessionTime')
+    if laps.empty:
+        return car_data.assign(LapNumber=np.nan)
+
+    tagged = pd.merge_asof(car_data, laps, left_on='SessionTime', right_on='LapStartTime', direction='backward')
+    tagged.loc[tagged['SessionTime'] > tagged['LapEndTime'], 'LapNumber'] = np.nan
+    return tagged.drop(columns=['LapStartTime', 'LapEndTime'])
+
+
+def add_distance(car_data):
+    """
+    Integrates speed over time into the distance covered since the start of the data
+    (Distance) and since the start of the current lap (LapDistance), in meters.
+    """
+    seconds = car_data['SessionTime'].dt.total_seconds().diff().fillna(0).to_numpy()
+    step = car_data['Speed'].to_numpy(dtype='float64') / 3.6 * seconds
+    car_data = car_data.assign(Distance=np.cumsum(step))
+    lap_distance = pd.Series(step, index=car_data.index).groupby(car_data['LapNumber']).cumsum()
+    return car_data.assign(LapDistance=lap_distance)
+
+
+def driver_telemetry(f1_session):
+    """Full-rate car data per driver abbreviation, with Driver, LapNumber and distances added."""
+    abbreviations = driver_abbreviations(f1_session)
+    laps = f1_session.laps
+    frames = {}
+    for driver_number, car_data in f1_session.car_data.items():
+        driver = abbreviations.get(str(driver_number), str(driver_number))
+        df = pd.DataFrame(car_data).assign(Driver=driver)
+        df = add_lap_numbers(df, laps[laps['DriverNumber'] == str(driver_number)])
+        frames[driver] = add_distance(df).reset_index(drop=True)
+    return frames
+
+
+def rollup(df, keys):
+    """min/max/mean of ROLLUP_CHANNELS and the sample count for each group of `keys`."""
+    channels = df[ROLLUP_CHANNELS].astype('float64')
+    grouped = channels.groupby([df[key] for key in keys], sort=True, observed=True)
+    result = grouped.agg(ROLLUP_STATS)
+    result.columns = [f"{channel}_{stat}" for channel, stat in result.columns]
+    result['Samples'] = grouped.size()
+    return result.reset_index()
+
+
+def time_rollup(df, seconds=TIME_BUCKET_SECONDS):
+    """Rollup per driver and `seconds` wide bucket of session time (bucket start in seconds)."""
+    buckets = (df['SessionTime'].dt.total_seconds() // seconds * seconds).astype('int64')
+    return rollup(df.assign(SessionTimeBucket=buckets), ['Driver', 'SessionTimeBucket'])
+
+
+def distance_rollup(df, meters=DISTANCE_BUCKET_METERS):
+    """Rollup per driver, lap and `meters` long bucket of lap distance (bucket start in meters)."""
+    on_lap = df[df['LapNumber'].notna()]
+    buckets = (on_lap['LapDistance'] // meters * meters).astype('int64')
+    return rollup(on_lap.assign(LapDistanceBucket=buckets), ['Driver', 'LapNumber', 'LapDistanceBucket'])
+
+
+def lap_rollup(df):
+    """Rollup per driver and lap."""
+    return rollup(df[df['LapNumber'].notna()], ['Driver', 'LapNumber'])
+
+
+def build_telemetry_frames(f1_session):
+    """
+    Telemetry artifacts of a session: the full-rate data as {driver: frame} under
+    'telemetry', and the 1 s, 100 m and per-lap rollups of all drivers as one frame each.
+    Sessions without car data return no artifacts.
+    """
+    per_driver = driver_telemetry(f1_session)
+    if not per_driver:
+        return {}
+    combined = pd.concat(per_driver.values(), ignore_index=True)
+    return {
+        FULL_RATE_ARTIFACT: per_driver,
+        'telemetry_1s': time_rollup(combined),
+        'telemetry_100m': distance_rollup(combined),
+        'telemetry_lap': lap_rollup(combined),
+    }
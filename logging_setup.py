@@ -1,7 +1,70 @@
+import atexit
+import configparser
 import logging.config
+import logging.handlers
+import multiprocessing
 import os
+import queue
+import threading
 from datetime import datetime
 
+LOG_FORMAT = '%(asctime)s - %(filename)s - %(levelname)s - %(message)s'
+PLACEHOLDER = 'PLACEHOLDER_LOG_FILE_PATH'
+
+# Set to 1 to write log records from a background thread instead of in the logging call
+ASYNC_ENV = 'LOG_ASYNC'
+
+
+def load_config(path, log_file):
+    """The logging config file parsed in memory, with the log file path filled in."""
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(path)
+    for section in config.sections():
+        for option, value in config.items(section):
+            if PLACEHOLDER in value:
+                config.set(section, option, value.replace(PLACEHOLDER, log_file))
+    return config
+
+
+class RoutingQueueHandler(logging.handlers.QueueHandler):
+    """Queues records tagged with the logger whose handlers should write them."""
+
+    def __init__(self, log_queue, route):
+        super().__init__(log_queue)
+        self.route = route
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.log_route = self.route
+        return record
+
+
+class RoutingQueueListener(logging.handlers.QueueListener):
+    """The single writer thread: hands each queued record to the handlers of the logger it came from."""
+
+    def __init__(self, log_queue, routes):
+        super().__init__(log_queue)
+        self.routes = routes
+
+    def handle(self, record):
+        record = self.prepare(record)
+        for handler in self.routes.get(getattr(record, 'log_route', ''), self.routes['']):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def configure_worker(log_queue):
+    """
+    Pool worker initializer: every record logged in the worker goes to the parent's queue, so
+    workers neither write to the console nor open log files of their own.
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(RoutingQueueHandler(log_queue, ''))
+    root.setLevel(logging.DEBUG)
+    LoggingSetup.attach(log_queue)
+
 
 class LoggingSetup:
     _instance = None
@@ -9,23 +72,46 @@ class LoggingSetup:
 
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
-            cls._instance = super().__new__(cls, *args, **kwargs)
+            cls._instance = super().__new__(cls)
             cls._instance._initialized = False
         return cls._instance
 
-    def __init__(self, default_path='temp.conf', default_level=logging.DEBUG, env_key='LOG_CFG'):
+    def __init__(self, default_path='temp.conf', default_level=logging.DEBUG, env_key='LOG_CFG', async_mode=None):
         if self._initialized:
             return
         self.default_path = default_path
         self.default_level = default_level
         self.env_key = env_key
+        self.queue = None
+        self.listener = None
+        self.worker_queue = None
+        self.forwarder = None
         self._log_file = self.setup_logging()
+        if async_mode is None:
+            async_mode = os.getenv(ASYNC_ENV, '') not in ('', '0')
+        if async_mode:
+            self.start_async()
         self._initialized = True
 
+    @classmethod
+    def attach(cls, log_queue):
+        """Marks logging of this (worker) process as set up, forwarding to `log_queue`."""
+        instance = cls.__new__(cls)
+        instance.queue = log_queue
+        instance.listener = None
+        instance.worker_queue = None
+        instance.forwarder = None
+        instance._log_file = None
+        instance._initialized = True
+
     def setup_logging(self):
-        log_dir = 'logs'
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
+        log_dir = os.getenv('LOG_DIR', 'logs')
+        try:
+            os.makedirs(log_dir, exist_ok=True)
+        except OSError:
+            # Read-only file system (Lambda outside /tmp): log to the console only
+            logging.basicConfig(level=self.default_level, format=LOG_FORMAT)
+            return None
 
         current_time = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         log_file = os.path.join(log_dir, f"log_{current_time}.log")
@@ -37,20 +123,7 @@ class LoggingSetup:
             path = value
 
         if os.path.exists(path):
-            # Read the configuration file
-            with open(path, 'r') as file:
-                config = file.read()
-
-            # Replace the placeholder with the actual log file path
-            config = config.replace('PLACEHOLDER_LOG_FILE_PATH', log_file)
-
-            # Write the updated configuration to a temporary file
-            temp_config_path = os.path.join(log_dir, 'temp_logging.conf')
-            with open(temp_config_path, 'w') as file:
-                file.write(config)
-
-            # Use the updated configuration
-            logging.config.fileConfig(temp_config_path)
+            logging.config.fileConfig(load_config(path, log_file))
 
             # Manually add the FileHandler if not already added
             root_logger = logging.getLogger()
@@ -58,32 +131,80 @@ class LoggingSetup:
             if not file_handler_exists:
                 file_handler = logging.FileHandler(log_file)
                 file_handler.setLevel(self.default_level)
-                formatter = logging.Formatter('%(asctime)s - %(filename)s - %(levelname)s - %(message)s')
-                file_handler.setFormatter(formatter)
+                file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
                 root_logger.addHandler(file_handler)
 
         else:
             logging.basicConfig(
                 level=self.default_level,
-                format='%(asctime)s - %(filename)s - %(levelname)s - %(message)s',
+                format=LOG_FORMAT,
                 handlers=[
                     logging.FileHandler(log_file),
                     logging.StreamHandler()
                 ]
             )
 
-        # Verify handlers attached to the root logger
-        # root_logger = logging.getLogger()
-        # root_logger.debug("Logging setup complete. Logs will be written to: %s", log_file)
-        # root_logger.debug("This is a debug message to test file writing.")
-        # root_logger.info("This is an info message to test file writing.")
-        # root_logger.error("This is an error message to test file writing.")
+        return log_file
 
-        # Debugging: List all handlers attached to the root logger
-        # for handler in root_logger.handlers:
-        #     root_logger.debug("Handler attached to root logger: %s", handler)
+    def start_async(self):
+        """
+        Moves the handlers of the root logger and of every configured logger behind one queue,
+        drained by a single writer thread, so a logging call only enqueues the record.
+        """
+        self.queue = queue.SimpleQueue()
+        root = logging.getLogger()
+        loggers = [root] + [logger for logger in logging.Logger.manager.loggerDict.values()
+                            if isinstance(logger, logging.Logger) and logger.handlers]
+        routes = {}
+        for logger in loggers:
+            route = '' if logger is root else logger.name
+            routes[route] = list(logger.handlers)
+            for handler in routes[route]:
+                logger.removeHandler(handler)
+            logger.addHandler(RoutingQueueHandler(self.queue, route))
+
+        self.listener = RoutingQueueListener(self.queue, routes)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def forward(self):
+        """Moves the records of pool workers onto the writer's queue until stop() sends None."""
+        while True:
+            record = self.worker_queue.get()
+            if record is None:
+                return
+            self.queue.put(record)
+
+    def stop(self):
+        """Writes out everything still queued and stops the writer thread."""
+        if self.listener is None:
+            return
+        if self.forwarder is not None:
+            self.worker_queue.put(None)
+            self.forwarder.join()
+            self.forwarder = None
+        listener, self.listener = self.listener, None
+        listener.stop()
+        for handlers in listener.routes.values():
+            for handler in handlers:
+                handler.flush()
 
-        return log_file
+    @classmethod
+    def worker_initializer(cls):
+        """
+        (initializer, initargs) for a ProcessPoolExecutor whose workers should log through this
+        process's writer thread; (None, ()) unless async logging is running. Worker records
+        cross a multiprocessing queue, created on first use, which a forwarding thread empties
+        onto the writer's queue, so in-process logging calls never pay for pickling.
+        """
+        instance = cls._instance
+        if instance is None or getattr(instance, 'listener', None) is None:
+            return None, ()
+        if instance.forwarder is None:
+            instance.worker_queue = multiprocessing.Queue(-1)
+            instance.forwarder = threading.Thread(target=instance.forward, name='log-forwarder', daemon=True)
+            instance.forwarder.start()
+        return configure_worker, (instance.worker_queue,)
 
     @classmethod
     def get_log_file(cls):
@@ -1,22 +1,85 @@
+import argparse
+
 from load.LoadEventSchedule import load_event_schedule_to_dynamodb, create_dynamoDB_table, schedule_next_race_trigger
 from load.data_loader import DataIngestion
+from load.manifest import BackfillManifest
+from load.s3_writer import HashIndex
 from logger import Logger
+import instrumentation
 
 logger = Logger.get_logger()
 
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Backfill F1 session data into S3')
+    parser.add_argument('--start-year', type=int, default=2023)
+    parser.add_argument('--end-year', type=int, default=2024)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of sessions to load in parallel (1 keeps the sequential load)')
+    parser.add_argument('--manifest', default='backfill_manifest.sqlite',
+                        help='SQLite file recording every uploaded artifact')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip artifacts the manifest already marks as uploaded')
+    parser.add_argument('--full-load', action='store_true',
+                        help='Parse every fastf1 dataset instead of only what gets uploaded')
+    parser.add_argument('--layout', choices=['flat', 'hive'], default='flat',
+                        help='S3 key layout; hive writes dataset=/year=/event=/session= partitions with an _index')
+    parser.add_argument('--hash-index',
+                        help='Local JSON file of uploaded content hashes, used instead of HEAD requests for dedup')
+    parser.add_argument('--shared-cache', action='store_true',
+                        help='Back the local fastf1 cache with the shared cache tier in S3')
+    parser.add_argument('--telemetry', action='store_true',
+                        help='Also write full-rate telemetry per driver and its 1 s / 100 m / per-lap rollups')
+    parser.add_argument('--live', nargs=2, metavar=('EVENT', 'SESSION'),
+                        help='Poll a running session of --end-year and upload its new laps and weather as deltas')
+    parser.add_argument('--poll-interval', type=int, default=60, help='Seconds between live polls')
+    parser.add_argument('--fanout', action='store_true',
+                        help='Run one work item per session through the fan-out flow instead of the backfill pool')
+    parser.add_argument('--processes', action='store_true',
+                        help='With --fanout, run the work items on a process pool instead of threads')
+    parser.add_argument('--spool-dir',
+                        help='Encode artifacts into this local directory and upload them in the background, with retries')
+    parser.add_argument('--metrics', choices=instrumentation.OUTPUTS,
+                        help='Time each pipeline stage and log a summary as JSON or CloudWatch EMF at the end')
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+    if args.metrics:
+        instrumentation.configure(args.metrics)
 
     bucket_name = 'race-predictor-pro'
     prefix = 'f1_data'
-    f1_data_ingestion = DataIngestion(bucket_name, prefix)
+    manifest = BackfillManifest(args.manifest)
+    hash_index = HashIndex(args.hash_index) if args.hash_index else None
+    f1_data_ingestion = DataIngestion(bucket_name, prefix, manifest=manifest, resume=args.resume,
+                                      selective_load=not args.full_load, hash_index=hash_index,
+                                      layout=args.layout, shared_cache=args.shared_cache,
+                                      telemetry=args.telemetry, spool_dir=args.spool_dir)
 
-    start_year = 2023
-    end_year = 2024
+    start_year = args.start_year
+    end_year = args.end_year
 
-    f1_data_ingestion.initial_load(start_year, end_year)
+    try:
+        if args.live:
+            f1_data_ingestion.ingest_live(end_year, args.live[0], args.live[1], poll_interval=args.poll_interval)
+            return
+        if args.fanout:
+            f1_data_ingestion.fanout_load(start_year, end_year, max_workers=args.workers,
+                                          use_processes=args.processes)
+            return
+        f1_data_ingestion.initial_load(start_year, end_year, max_workers=args.workers)
+    finally:
+        # Spooled uploads mark the manifest as they finish, so they go first
+        f1_data_ingestion.close()
+        manifest.close()
+        if hash_index is not None:
+            hash_index.save()
+        instrumentation.flush(function='backfill')
    # create_dynamoDB_table()
    # load_event_schedule_to_dynamodb(start_year, end_year)
    # schedule_next_race_trigger()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
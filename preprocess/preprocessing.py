@@ -1,8 +1,28 @@
+import argparse
+import io
+import tempfile
+import time
 import boto3
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError, ClientError
 
+from load.s3_writer import DEFAULT_PART_SIZE, HashingFile, upload_encoded, write_parquet
+from load.layout import parse_key
+from load.normalize import encode_options
+
+# Columns appended to every file by the rewrite
+METADATA_COLUMNS = ('year',)
+
+# Bytes fetched from the end of an object to read the parquet footer in one request
+FOOTER_READ_SIZE = 64 * 1024
+
+# Footer codec names that pyarrow's writer spells differently
+WRITER_COMPRESSION = {'UNCOMPRESSED': 'none', 'LZ4_RAW': 'lz4'}
+
 
 def list_parquet_files(bucket_name, prefix):
     """
@@ -30,6 +50,184 @@ def list_parquet_files(bucket_name, prefix):
         raise e
 
 
+def iter_parquet_files(s3, bucket_name, prefix):
+    """
+    Lazily yields (key, size) for every Parquet file under the prefix, one listing page at a time.
+    """
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(".parquet"):
+                yield obj["Key"], obj["Size"]
+
+
+class S3RangeReader(io.RawIOBase):
+    """
+    Seekable read-only view of an S3 object that fetches bytes with ranged GETs.
+
+    Lets pyarrow read a parquet footer without downloading the whole object. The tail of
+    the object is prefetched since that is where the footer lives.
+    """
+
+    def __init__(self, s3, bucket_name, key, size):
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.key = key
+        self.size = size
+        self.position = 0
+        self.tail_start = max(0, size - FOOTER_READ_SIZE)
+        self.tail = self._get_range(self.tail_start, size - 1)
+
+    def _get_range(self, start, end):
+        if end < start:
+            return b""
+        obj = self.s3.get_object(Bucket=self.bucket_name, Key=self.key, Range=f"bytes={start}-{end}")
+        return obj["Body"].read()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.size + offset
+        return self.position
+
+    def read(self, n=-1):
+        end = self.size if n is None or n < 0 else min(self.size, self.position + n)
+        if self.position >= self.tail_start:
+            data = self.tail[self.position - self.tail_start:end - self.tail_start]
+        else:
+            data = self._get_range(self.position, end - 1)
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def metadata_from_key(file_path):
+    """
+    Metadata column values encoded in the S3 key.
+    """
+    return {'year': parse_key(file_path)['year']}
+
+
+def add_metadata_columns(table, metadata):
+    """
+    Appends constant metadata columns to an Arrow table, leaving existing columns untouched.
+    """
+    for name, value in metadata.items():
+        if name not in table.column_names:
+            table = table.append_column(name, pa.repeat(pa.scalar(value, pa.string()), table.num_rows))
+    return table
+
+
+def writer_compression(codec):
+    """pyarrow writer name of a codec as reported in a parquet footer."""
+    return WRITER_COMPRESSION.get(codec, codec.lower())
+
+
+def rewrite_parquet_file(s3, bucket_name, file_path, size):
+    """
+    Adds the metadata columns to one file at the Arrow level, streaming it one row group at a
+    time: row groups are read with ranged GETs and encoded into a spooled temp file (in memory
+    up to a part, on disk beyond), so memory stays bounded by a row group and a part. The file
+    is then uploaded with its sha256 as metadata, like every object the ingestion writes, so
+    the dedup HEAD keeps working. Returns the number of bytes read, or 0 if the file already
+    had every column.
+    """
+    footer = pq.ParquetFile(S3RangeReader(s3, bucket_name, file_path, size), pre_buffer=True)
+    if all(name in footer.schema_arrow.names for name in METADATA_COLUMNS):
+        return 0
+
+    compression = 'snappy'
+    if footer.metadata.num_row_groups and footer.metadata.num_columns:
+        compression = writer_compression(footer.metadata.row_group(0).column(0).compression)
+
+    metadata = metadata_from_key(file_path)
+    # Every object gets rewritten with new content, so there is no point in a dedup HEAD
+    with tempfile.SpooledTemporaryFile(max_size=DEFAULT_PART_SIZE) as spool:
+        encoded = HashingFile(spool)
+        writer = None
+        for index in range(footer.num_row_groups):
+            table = add_metadata_columns(footer.read_row_group(index), metadata)
+            if writer is None:
+                writer = pq.ParquetWriter(encoded, table.schema, compression=compression)
+            writer.write_table(table)
+        if writer is None:
+            table = add_metadata_columns(footer.schema_arrow.empty_table(), metadata)
+            writer = pq.ParquetWriter(encoded, table.schema, compression=compression)
+            writer.write_table(table)
+        writer.close()
+
+        spool.seek(0)
+        upload_encoded(s3, bucket_name, file_path, spool, encoded.sha256.hexdigest())
+    return size
+
+
+def process_and_overwrite_parquet_files_parallel(bucket_name, prefix, max_workers=8):
+    """
+    Pipeline version of process_and_overwrite_parquet_files: keys are listed lazily and
+    rewritten on a bounded thread pool, files that already carry the metadata columns are
+    skipped after a footer-only read, and throughput is reported at the end.
+    """
+    s3 = boto3.client("s3")
+    start = time.perf_counter()
+    processed = skipped = failed = 0
+    bytes_processed = 0
+    in_flight = {}
+
+    def collect(done):
+        nonlocal processed, skipped, failed, bytes_processed
+        for future in done:
+            file_path = in_flight.pop(future)
+            try:
+                bytes_read = future.result()
+            except ClientError as e:
+                print(f"Error accessing file '{file_path}' in bucket '{bucket_name}': {e}")
+                failed += 1
+                continue
+            except Exception as e:
+                print(f"Unexpected error while processing file '{file_path}': {e}")
+                failed += 1
+                continue
+
+            if bytes_read:
+                processed += 1
+                bytes_processed += bytes_read
+                print(f"Processed and overwritten: {file_path}")
+            else:
+                skipped += 1
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for file_path, size in iter_parquet_files(s3, bucket_name, prefix):
+            if len(in_flight) >= max_workers * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight[pool.submit(rewrite_parquet_file, s3, bucket_name, file_path, size)] = file_path
+        collect(wait(in_flight).done)
+
+    elapsed = time.perf_counter() - start
+    total_files = processed + skipped + failed
+    print(f"Rewrote {processed} files, skipped {skipped} already processed, {failed} failed "
+          f"in {elapsed:.1f}s: {total_files / elapsed:.1f} files/s, "
+          f"{bytes_processed / elapsed / (1024 * 1024):.2f} MB/s rewritten.")
+    return {'processed': processed, 'skipped': skipped, 'failed': failed,
+            'bytes': bytes_processed, 'seconds': elapsed}
+
+
 def process_and_overwrite_parquet_files(bucket_name, prefix):
     """
     Recursively processes Parquet files, adds metadata columns, and overwrites them in S3.
@@ -46,11 +244,11 @@ def process_and_overwrite_parquet_files(bucket_name, prefix):
 
         for file_path in files:
             try:
-                # Extract circuit_name and session_type from the file path
-                parts = file_path.split("/")
-                circuit_name = parts[-2]  # Adjust index based on your S3 structure
-                session_type = parts[-1].split("_")[0]  # Extract session type from the file name
-                year = parts[1]
+                # Extract circuit_name and session_type from the file path (flat or hive layout)
+                partition = parse_key(file_path)
+                circuit_name = partition['event']
+                session_type = partition['session']
+                year = partition['year']
 
                 # Download the Parquet file from S3
                 obj = s3.get_object(Bucket=bucket_name, Key=file_path)
@@ -64,16 +262,14 @@ def process_and_overwrite_parquet_files(bucket_name, prefix):
                 # df["session_type"] = session_type
                 df['year'] = year
 
-                # Save the updated DataFrame to Parquet
-                updated_parquet_data = BytesIO()
-                df.to_parquet(updated_parquet_data, engine="pyarrow", index=False)
-                updated_parquet_data.seek(0)
-
-                # Overwrite the same file in S3
-                s3.put_object(Bucket=bucket_name, Key=file_path, Body=updated_parquet_data)
-                updated_parquet_data.close()
+                # Overwrite the same file in S3, unless the encoded bytes are unchanged
+                result = write_parquet(s3, bucket_name, file_path, df, dedup=True,
+                                       **encode_options(partition['dataset']))
                 parquet_data.close()
-                print(f"Processed and overwritten: {file_path}")
+                if result.skipped:
+                    print(f"Unchanged, skipped upload: {file_path}")
+                else:
+                    print(f"Processed and overwritten: {file_path}")
 
             except ClientError as e:
                 print(f"Error accessing file '{file_path}' in bucket '{bucket_name}': {e}")
@@ -91,10 +287,19 @@ def process_and_overwrite_parquet_files(bucket_name, prefix):
 
 
 if __name__ == "__main__":
+    # Run from the repository root: python -m preprocess.preprocessing --workers 16
+    parser = argparse.ArgumentParser(description='Add metadata columns to every parquet file in the lake')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='Files rewritten concurrently; 1 uses the sequential rewrite')
+    args = parser.parse_args()
+
     bucket_name = "race-predictor-pro"
     input_prefix = "f1_data/"
 
     try:
-        process_and_overwrite_parquet_files(bucket_name, input_prefix)
+        if args.workers > 1:
+            process_and_overwrite_parquet_files_parallel(bucket_name, input_prefix, args.workers)
+        else:
+            process_and_overwrite_parquet_files(bucket_name, input_prefix)
     except Exception as e:
         print(f"Critical failure in the processing pipeline: {e}")
\ No newline at end of file
@@ -0,0 +1,247 @@
+import argparse
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from load.layout import event_slug, parse_key
+
+# Partition columns added to every table read from the lake
+PARTITION_COLUMNS = ['year', 'event', 'session']
+
+
+def sync_from_s3(s3_client, bucket, prefix, dest):
+    """
+    Mirrors the parquet files under s3://bucket/prefix into `dest`, downloading only files that
+    are missing or changed size. Works against moto as well as the real bucket. Returns the
+    number of files downloaded.
+    """
+    downloaded = 0
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if not obj['Key'].endswith('.parquet'):
+                continue
+            path = os.path.join(dest, obj['Key'])
+            if os.path.exists(path) and os.path.getsize(path) == obj['Size']:
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            s3_client.download_file(bucket, obj['Key'], f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+            downloaded += 1
+    return downloaded
+
+
+def unify_types(table):
+    """
+    Brings a file's columns to the types every season shares, so tables written before and after
+    normalization concat: durations become int64 milliseconds (as load/normalize.py writes them)
+    and dictionary columns are decoded to their values.
+    """
+    for index, field in enumerate(table.schema):
+        column = table.column(index)
+        if pa.types.is_duration(field.type):
+            column = pc.cast(column, pa.duration('ms'), safe=False).cast(pa.int64())
+        elif pa.types.is_dictionary(field.type):
+            column = column.cast(field.type.value_type)
+        else:
+            continue
+        table = table.set_column(index, field.name, column)
+    return table
+
+
+class LocalLake:
+    """
+    Read-only view of a local copy of the lake written by DataIngestion (both key layouts,
+    see load/layout.py). Files are catalogued once from their paths, so filtering on year,
+    event and session prunes whole files before any parquet is opened.
+    """
+
+    def __init__(self, root, prefix='f1_data'):
+        self.root = root
+        self.prefix = prefix
+        self._catalog = None
+
+    def catalog(self):
+        """One entry per parquet file: its path and the partition values parsed from its key."""
+        if self._catalog is None:
+            base = os.path.join(self.root, self.prefix)
+            entries = []
+            for directory, _, files in os.walk(base):
+                for name in files:
+                    if not name.endswith('.parquet'):
+                        continue
+                    path = os.path.join(directory, name)
+                    entry = parse_key(os.path.relpath(path, self.root).replace(os.sep, '/'))
+                    entry['path'] = path
+                    entries.append(entry)
+            self._catalog = entries
+        return self._catalog
+
+    def files(self, dataset, year=None, event=None, session=None):
+        """
+        Paths of the files of a dataset matching the filters. Live deltas of a session are only
+        used while no complete file has been written for it.
+        """
+        return [entry['path'] for entry in self.entries(dataset, year, event, session)]
+
+    def entries(self, dataset, year=None, event=None, session=None):
+        wanted = {
+            'year': None if year is None else str(year),
+            'event': None if event is None else event_slug(event),
+            'session': None if session is None else session.lower(),
+        }
+        partitions = {}
+        for entry in self.catalog():
+            if entry['dataset'] != dataset:
+                continue
+            if any(value is not None and entry[name] != value for name, value in wanted.items()):
+                continue
+            key = (entry['year'], entry['event'], entry['session'], entry.get('driver'))
+            partitions.setdefault(key, []).append(entry)
+
+        selected = []
+        for entries in partitions.values():
+            complete = [entry for entry in entries if 'delta' not in entry]
+            selected += complete or sorted(entries, key=lambda entry: entry['delta'])
+        return sorted(selected, key=lambda entry: entry['path'])
+
+    def table(self, dataset, year=None, event=None, session=None, columns=None):
+        """
+        Arrow table of a dataset with year, event and session columns added. Schemas of
+        different seasons are unified (see unify_types), a column missing from a file reads as nulls.
+        """
+        tables = []
+        for entry in self.entries(dataset, year, event, session):
+            schema = pq.read_schema(entry['path'])
+            wanted = None if columns is None else [column for column in columns if column in schema.names]
+            # The partition values come from the catalog, not from pyarrow's hive path discovery
+            table = unify_types(pq.read_table(entry['path'], columns=wanted, partitioning=None))
+            # Preprocessed files carry a year column of their own; the catalog's value replaces it
+            table = table.drop_columns([name for name in PARTITION_COLUMNS if name in table.column_names])
+            for name in PARTITION_COLUMNS:
+                table = table.append_column(name, pa.array([entry[name]] * table.num_rows, pa.string()))
+            if entry.get('driver') is not None and 'Driver' not in table.column_names:
+                table = table.append_column('Driver', pa.array([entry['driver']] * table.num_rows, pa.string()))
+            tables.append(table)
+        if not tables:
+            return pa.table({name: pa.array([], pa.string()) for name in PARTITION_COLUMNS})
+        return pa.concat_tables(tables, promote_options='permissive')
+
+    def frame(self, dataset, year=None, event=None, session=None, columns=None):
+        return self.table(dataset, year, event, session, columns).to_pandas()
+
+    def sql(self, query, **tables):
+        """
+        Runs a DuckDB query over the given tables, e.g. sql("SELECT ...", laps=lake.table('laps', 2023)).
+        DuckDB is optional and only needed for this method.
+        """
+        try:
+            import duckdb
+        except ImportError:
+            raise ImportError("LocalLake.sql needs duckdb, install it with `pip install duckdb`.")
+
+        connection = duckdb.connect()
+        try:
+            for name, table in tables.items():
+                connection.register(name, table)
+            return connection.execute(query).df()
+        finally:
+            connection.close()
+
+
+def race_progress(lake, year, event, session='R'):
+    """Position of every driver at the end of each lap, with the lap time in ms."""
+    laps = lake.frame('laps', year, event, session, columns=['Driver', 'Team', 'LapNumber', 'Position', 'LapTime'])
+    if laps.empty:
+        return laps
+    laps = laps.dropna(subset=['LapNumber', 'Position'])
+    return laps[['Driver', 'Team', 'LapNumber', 'Position', 'LapTime']].sort_values(
+        ['LapNumber', 'Position']).reset_index(drop=True)
+
+
+def standings(lake, year, by='driver'):
+    """
+    Championship standings of a season from the race and sprint classifications: points,
+    wins, podiums and starts per driver (by='driver') or team (by='team').
+    """
+    results = pd.concat([
+        lake.frame('drivers_info', year, session=session,
+                   columns=['Abbreviation', 'FullName', 'TeamName', 'Position', 'Points'])
+        for session in ('R', 'S')
+    ], ignore_index=True)
+    if results.empty or 'Points' not in results.columns:
+        return pd.DataFrame()
+
+    keys = ['Abbreviation', 'FullName', 'TeamName'] if by == 'driver' else ['TeamName']
+    results = results.assign(
+        Win=(results['session'] == 'r') & (results['Position'] == 1),
+        Podium=(results['session'] == 'r') & (results['Position'] <= 3),
+        Start=results['session'] == 'r',
+    )
+    table = results.groupby(keys, observed=True).agg(
+        Points=('Points', 'sum'),
+        Wins=('Win', 'sum'),
+        Podiums=('Podium', 'sum'),
+        Starts=('Start', 'sum'),
+    )
+    table = table.sort_values(['Points', 'Wins'], ascending=False).reset_index()
+    table.insert(0, 'Rank', range(1, len(table) + 1))
+    return table
+
+
+def weather_vs_laptime(lake, year, event, session='R'):
+    """
+    Every timed lap with the weather sampled last before it ended (air and track temperature,
+    humidity, rainfall, wind), for plotting pace against conditions.
+    """
+    laps = lake.frame('laps', year, event, session,
+                      columns=['Driver', 'Team', 'LapNumber', 'LapTime', 'Time', 'Compound', 'TyreLife'])
+    weather = lake.frame('weather', year, event, session,
+                         columns=['Time', 'AirTemp', 'TrackTemp', 'Humidity', 'Rainfall', 'WindSpeed'])
+    if laps.empty or weather.empty:
+        return pd.DataFrame()
+
+    laps = laps.dropna(subset=['LapTime', 'Time'])
+    laps = laps.assign(Time=laps['Time'].astype('int64')).sort_values('Time')
+    weather = weather.dropna(subset=['Time']).drop(columns=PARTITION_COLUMNS)
+    weather = weather.assign(Time=weather['Time'].astype('int64')).sort_values('Time')
+    joined = pd.merge_asof(laps, weather, on='Time', direction='backward')
+    return joined.sort_values(['Driver', 'LapNumber']).reset_index(drop=True)
+
+
+QUERIES = {
+    'race_progress': race_progress,
+    'weather_vs_laptime': weather_vs_laptime,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the dashboard queries against a local copy of the lake')
+    parser.add_argument('query', choices=sorted(QUERIES) + ['standings'])
+    parser.add_argument('year', type=int)
+    parser.add_argument('event', nargs='?', help='Event name, e.g. "Bahrain Grand Prix" (not used by standings)')
+    parser.add_argument('--session', default='R')
+    parser.add_argument('--root', default='lake', help='Directory holding the local copy of the bucket')
+    parser.add_argument('--prefix', default='f1_data')
+    parser.add_argument('--sync-bucket', help='Mirror this S3 bucket into --root first')
+    args = parser.parse_args()
+
+    if args.sync_bucket:
+        from load.aws_clients import get_client
+
+        downloaded = sync_from_s3(get_client('s3'), args.sync_bucket, args.prefix, args.root)
+        print(f"Downloaded {downloaded} files into {args.root}.")
+
+    lake = LocalLake(args.root, args.prefix)
+    if args.query == 'standings':
+        result = standings(lake, args.year)
+    else:
+        result = QUERIES[args.query](lake, args.year, args.event, args.session)
+    print(result.to_string())
+
+
+if __name__ == "__main__":
+    main()
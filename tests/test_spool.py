@@ -0,0 +1,125 @@
+import io
+import os
+import threading
+
+import boto3
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from moto import mock_aws
+
+from load import spool as spool_module
+from load.spool import DEAD_LETTER_DIR, MAX_FAILED_RUNS, Spool
+
+BUCKET = 'race-predictor-pro'
+
+
+class FlakyS3:
+    """S3 client whose writes fail `failures` times (forever with None) and can be held on `gate`."""
+
+    def __init__(self, client, failures=0, gate=None):
+        self.client = client
+        self.failures = failures
+        self.gate = gate
+
+    def put_object(self, **kwargs):
+        if self.gate is not None:
+            self.gate.wait()
+        if self.failures is None or self.failures > 0:
+            if self.failures is not None:
+                self.failures -= 1
+            raise ConnectionError('injected S3 failure')
+        return self.client.put_object(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setattr(spool_module, 'RETRY_BASE_SECONDS', 0.001)
+    with mock_aws():
+        client = boto3.client('s3')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def frame(value, rows=100):
+    return pd.DataFrame({'LapNumber': range(rows), 'Value': [value] * rows})
+
+
+def stored(s3, key):
+    body = s3.get_object(Bucket=BUCKET, Key=key)['Body'].read()
+    return pq.read_table(io.BytesIO(body)).to_pandas()
+
+
+def spooled_files(spool_dir):
+    return sorted(name for name in os.listdir(spool_dir) if name != DEAD_LETTER_DIR)
+
+
+def test_transient_failures_are_retried(s3, tmp_path):
+    spool = Spool(FlakyS3(s3, failures=2), str(tmp_path), max_attempts=5)
+    spool.write(BUCKET, 'f1_data/a.parquet', frame(1))
+
+    assert spool.close() == []
+    assert stored(s3, 'f1_data/a.parquet')['Value'].tolist() == [1] * 100
+    assert spooled_files(tmp_path) == []
+
+
+def test_entries_that_gave_up_are_uploaded_by_the_next_spool(s3, tmp_path):
+    spool = Spool(FlakyS3(s3, failures=None), str(tmp_path), max_attempts=2)
+    spool.write(BUCKET, 'f1_data/a.parquet', frame(1))
+    assert spool.close() == ['f1_data/a.parquet']
+    assert len(spooled_files(tmp_path)) == 2
+
+    recovered = Spool(s3, str(tmp_path))
+    assert recovered.close() == []
+    assert stored(s3, 'f1_data/a.parquet')['Value'].tolist() == [1] * 100
+    assert spooled_files(tmp_path) == []
+
+
+def test_entries_failing_every_run_are_dead_lettered(s3, tmp_path):
+    for _ in range(MAX_FAILED_RUNS):
+        spool = Spool(FlakyS3(s3, failures=None), str(tmp_path), max_attempts=1)
+        if not spool.pending:
+            spool.write(BUCKET, 'f1_data/a.parquet', frame(1))
+        assert spool.close() == ['f1_data/a.parquet']
+
+    assert spooled_files(tmp_path) == []
+    assert len(os.listdir(tmp_path / DEAD_LETTER_DIR)) == 2
+    assert Spool(s3, str(tmp_path)).close() == []
+
+
+def test_newer_write_of_a_key_supersedes_the_queued_one(s3, tmp_path):
+    gate = threading.Event()
+    client = FlakyS3(s3, gate=gate)
+    spool = Spool(client, str(tmp_path), workers=1)
+    spool.write(BUCKET, 'f1_data/blocker.parquet', frame(0))
+    spool.write(BUCKET, 'f1_data/a.parquet', frame(1))
+    spool.write(BUCKET, 'f1_data/a.parquet', frame(2))
+    gate.set()
+
+    assert spool.close() == []
+    assert stored(s3, 'f1_data/a.parquet')['Value'].tolist() == [2] * 100
+    assert spooled_files(tmp_path) == []
+
+
+def test_write_blocks_at_the_byte_cap_until_uploads_free_space(s3, tmp_path):
+    gate = threading.Event()
+    spool = Spool(FlakyS3(s3, gate=gate), str(tmp_path), max_bytes=1)
+    spool.write(BUCKET, 'f1_data/a.parquet', frame(1))
+
+    second = threading.Thread(target=spool.write, args=(BUCKET, 'f1_data/b.parquet', frame(2)))
+    second.start()
+    second.join(0.2)
+    assert second.is_alive()
+    assert len(spooled_files(tmp_path)) == 2
+
+    gate.set()
+    second.join(5)
+    assert not second.is_alive()
+    assert spool.close() == []
+    assert stored(s3, 'f1_data/b.parquet')['Value'].tolist() == [2] * 100